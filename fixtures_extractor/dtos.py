@@ -1,17 +1,39 @@
+import sys
+from collections import defaultdict
 from dataclasses import dataclass
+from typing import Dict, FrozenSet, NamedTuple, Optional, Tuple
 
 from django.db.models.fields.related import ForeignObjectRel
 
-from fixtures_extractor.enums import FieldType
+from fixtures_extractor.enums import FieldType, RelationKind
 
 
-@dataclass
-class ModelFieldMetaDTO:
+class ModelFieldMetaDTO(NamedTuple):
+    """Metadata of a model field
+
+    A plain tuple, immutable and hashable, so fields can be used as dict and
+    set keys. ``build`` interns their strings, which are shared by every
+    field pointing to the same model. Fields sort by name only. Many to many
+    relations with an explicit ``through`` model, from either side, also name
+    that model and its foreign key pointing to the model of the field.
+    Generic foreign keys and generic relations name the content type and
+    object id fields of the model holding the generic foreign key, generic
+    foreign keys point to the content type model.
+    """
+
     app_name: str
     field_name: str
     model_name: str
     field_type: FieldType
     is_model_declared: bool = True
+    through_app_model: Optional[str] = None
+    through_field_name: Optional[str] = None
+    content_type_field_name: Optional[str] = None
+    object_id_field_name: Optional[str] = None
+
+    @property
+    def app_model(self) -> str:
+        return f"{self.app_name}.{self.model_name}"
 
     @staticmethod
     def build(field):
@@ -21,21 +43,49 @@ class ModelFieldMetaDTO:
         field_type = ModelFieldMetaDTO._detect_field_type(field=field)
         is_model_declared = ModelFieldMetaDTO._detect_model_declaration(field=field)
 
-        if is_model_declared and field_type != FieldType.field:
+        content_type_field_name = object_id_field_name = None
+        if field_type == FieldType.generic_foreign_key:
+            content_type_field_name = sys.intern(field.ct_field)
+            object_id_field_name = sys.intern(field.fk_field)
+            content_type_model = field.model._meta.get_field(
+                field.ct_field
+            ).related_model
+            app_name = content_type_model._meta.app_label
+            model_name = content_type_model._meta.model_name
+        elif is_model_declared and field_type != FieldType.field:
             app_name = field.related_model._meta.app_label
             model_name = field.related_model._meta.model_name
 
+        if field_type == FieldType.generic_relation:
+            content_type_field_name = sys.intern(field.content_type_field_name)
+            object_id_field_name = sys.intern(field.object_id_field_name)
+
         if field.is_relation and not is_model_declared:
             app_name = field.related_model._meta.app_label
             model_name = field.related_model._meta.model_name
             field_name = field.field.name
 
+        through_app_model = through_field_name = None
+        if field_type == FieldType.many_to_many_through:
+            if is_model_declared:
+                through = field.remote_field.through
+                through_field_name = field.m2m_field_name()
+            else:
+                through = field.through
+                through_field_name = field.field.m2m_reverse_field_name()
+            through_app_model = sys.intern(through._meta.label_lower)
+            through_field_name = sys.intern(through_field_name)
+
         return ModelFieldMetaDTO(
-            app_name=app_name,
-            field_name=field_name,
-            model_name=model_name,
+            app_name=sys.intern(app_name),
+            field_name=sys.intern(field_name),
+            model_name=sys.intern(model_name),
             field_type=field_type,
             is_model_declared=is_model_declared,
+            through_app_model=through_app_model,
+            through_field_name=through_field_name,
+            content_type_field_name=content_type_field_name,
+            object_id_field_name=object_id_field_name,
         )
 
     @classmethod
@@ -43,7 +93,19 @@ class ModelFieldMetaDTO:
         if not field.is_relation:
             return FieldType.field
 
+        # Generic fields are told apart by their attributes, so the
+        # contenttypes app is not imported when it is not installed
+        if hasattr(field, "fk_field") and hasattr(field, "ct_field"):
+            return FieldType.generic_foreign_key
+
+        if hasattr(field, "object_id_field_name") and cls._detect_model_declaration(
+            field=field
+        ):
+            return FieldType.generic_relation
+
         if field.many_to_many:
+            if cls._has_explicit_through(field=field):
+                return FieldType.many_to_many_through
             return FieldType.many_to_many
 
         if field.one_to_one:
@@ -61,26 +123,134 @@ class ModelFieldMetaDTO:
     def _detect_model_declaration(cls, field) -> bool:
         return not isinstance(field, ForeignObjectRel)
 
-    def __eq__(self, value: object) -> bool:
-        if self.app_name != value.app_name:
-            return False
+    @classmethod
+    def _has_explicit_through(cls, field) -> bool:
+        if isinstance(field, ForeignObjectRel):
+            through = field.through
+        else:
+            through = field.remote_field.through
+        return through is not None and not through._meta.auto_created
+
+    def __gt__(self, value: object) -> bool:
+        return self.field_name > value.field_name
 
-        if self.field_name != value.field_name:
-            return False
+    def __lt__(self, value: object) -> bool:
+        return self.field_name < value.field_name
 
-        if self.model_name != value.model_name:
-            return False
+    def __ge__(self, value: object) -> bool:
+        return self.field_name >= value.field_name
 
-        if self.field_type != value.field_type:
-            return False
+    def __le__(self, value: object) -> bool:
+        return self.field_name <= value.field_name
 
-        if self.is_model_declared != value.is_model_declared:
-            return False
 
-        return True
+ONE_RELATION_TYPES = frozenset({FieldType.one_to_one, FieldType.foreign_key})
 
-    def __gt__(self, value: object) -> bool:
-        return self.field_name > value.field_name
 
-    def __lt__(self, value: object) -> bool:
-        return self.field_name < value.field_name
+@dataclass(frozen=True)
+class ModelSchemaDTO:
+    app_model: str
+    all_fields: Tuple[ModelFieldMetaDTO, ...]
+    fields: Tuple[ModelFieldMetaDTO, ...]
+    one_relations: Tuple[ModelFieldMetaDTO, ...]
+    many_relations: Tuple[ModelFieldMetaDTO, ...]
+    target_relations: Tuple[ModelFieldMetaDTO, ...]
+    # Many to many relations with an explicit through model, from either
+    # side, whose rows are extracted as records of their own instead of ids
+    through_relations: Tuple[ModelFieldMetaDTO, ...] = ()
+    generic_foreign_keys: Tuple[ModelFieldMetaDTO, ...] = ()
+    generic_relations: Tuple[ModelFieldMetaDTO, ...] = ()
+
+    @staticmethod
+    def build(app_model: str, all_fields: Tuple[ModelFieldMetaDTO, ...]):
+        fields, one_relations, many_relations, target_relations = [], [], [], []
+        through_relations, generic_foreign_keys, generic_relations = [], [], []
+
+        for field in all_fields:
+            if field.field_type == FieldType.field:
+                fields.append(field)
+            elif field.field_type == FieldType.many_to_many_through:
+                through_relations.append(field)
+            elif field.field_type == FieldType.generic_foreign_key:
+                generic_foreign_keys.append(field)
+            elif field.field_type == FieldType.generic_relation:
+                generic_relations.append(field)
+            elif not field.is_model_declared:
+                target_relations.append(field)
+            elif field.field_type in ONE_RELATION_TYPES:
+                one_relations.append(field)
+            elif field.field_type == FieldType.many_to_many:
+                many_relations.append(field)
+
+        return ModelSchemaDTO(
+            app_model=app_model,
+            all_fields=all_fields,
+            fields=tuple(fields),
+            one_relations=tuple(one_relations),
+            many_relations=tuple(many_relations),
+            target_relations=tuple(target_relations),
+            through_relations=tuple(through_relations),
+            generic_foreign_keys=tuple(generic_foreign_keys),
+            generic_relations=tuple(generic_relations),
+        )
+
+
+@dataclass(frozen=True)
+class ExtractionEdgeDTO:
+    """A bulk fetch step from the records of ``source`` to ``target``
+
+    The values of ``source_field`` in the fetched ``source`` records are
+    looked up as ``<filter_key>__in`` on ``target``.
+    """
+
+    source: str
+    target: str
+    source_field: str
+    filter_key: str
+    relation_kind: RelationKind
+    is_cycle: bool = False
+
+    @property
+    def is_fan_out(self) -> bool:
+        """Whether the edge fetches the rows pointing to the ``source`` rows
+
+        Reverse, through and generic relation edges fan out. Foreign keys,
+        many to many and generic foreign keys are looked up by primary key,
+        the rows they reach are required to load the ``source`` ones.
+        """
+        return self.filter_key != "id"
+
+
+@dataclass(frozen=True)
+class ExtractionPlanDTO:
+    root: str
+    models: Tuple[str, ...]
+    edges: Tuple[ExtractionEdgeDTO, ...]
+    edges_by_source: Dict[str, Tuple[ExtractionEdgeDTO, ...]]
+    # ``(model, filter_key)`` lookups fetching the rows of through models
+    through_lookups: FrozenSet[Tuple[str, str]] = frozenset()
+
+    @staticmethod
+    def build(root: str, models: Tuple[str, ...], edges: Tuple[ExtractionEdgeDTO, ...]):
+        edges_by_source = defaultdict(list)
+        for edge in edges:
+            edges_by_source[edge.source].append(edge)
+
+        return ExtractionPlanDTO(
+            root=root,
+            models=models,
+            edges=edges,
+            edges_by_source={
+                source: tuple(source_edges)
+                for source, source_edges in edges_by_source.items()
+            },
+            through_lookups=frozenset(
+                (edge.target, edge.filter_key)
+                for edge in edges
+                if edge.relation_kind == RelationKind.through
+            ),
+        )
+
+    @property
+    def cyclic_edges(self) -> Tuple[ExtractionEdgeDTO, ...]:
+        return tuple(edge for edge in self.edges if edge.is_cycle)
@@ -4,6 +4,17 @@ from enum import Enum
 class FieldType(Enum):
     field = "field"
     many_to_many = "many_to_many"
+    many_to_many_through = "many_to_many_through"
     foreign_key = "foreign_key"
     reverse_foreign_key = "reverse_foreign_key"
     one_to_one = "one_to_one"
+    generic_foreign_key = "generic_foreign_key"
+    generic_relation = "generic_relation"
+
+
+class RelationKind(Enum):
+    one = "one"
+    many = "many"
+    reverse = "reverse"
+    through = "through"
+    generic = "generic"
@@ -2,18 +2,17 @@ import logging
 
 
 class ExtraFormatter(logging.Formatter):
-    def_keys = [
-        'name', 'msg', 'args', 'levelname', 'levelno',
-        'pathname', 'filename', 'module', 'exc_info',
-        'exc_text', 'stack_info', 'lineno', 'funcName',
-        'created', 'msecs', 'relativeCreated', 'thread',
-        'threadName', 'processName', 'process', 'message'
-    ]
+    # Attributes of every record, whatever the Python version
+    def_keys = frozenset(
+        logging.LogRecord('', logging.NOTSET, '', 0, '', None, None).__dict__
+    ) | {'message', 'asctime'}
 
     def format(self, record):
         string = super().format(record)
-        extra = {k: v for k, v in record.__dict__.items()
-                 if k not in self.def_keys}
-        if len(extra) > 0:
+        # Most records carry no extra, skip building the dict for them
+        extra_keys = record.__dict__.keys() - self.def_keys
+        if extra_keys:
+            extra = {k: v for k, v in record.__dict__.items()
+                     if k in extra_keys}
             string += " - extra: " + str(extra)
         return string
@@ -0,0 +1,73 @@
+from typing import Dict, Iterable, Optional, Tuple
+
+from django.apps import apps
+
+CONTENT_TYPE_MODEL = "contenttypes.contenttype"
+
+# Lookups of generic relations also filter on the content type of the rows,
+# they are written as ``<object_id field>@<content_type field>=<id>``
+GENERIC_FILTER_SEPARATOR = "@"
+
+
+def build_generic_filter_key(
+    object_id_field_name: str, content_type_field_name: str, content_type_id: int
+) -> str:
+    return (
+        f"{object_id_field_name}{GENERIC_FILTER_SEPARATOR}"
+        f"{content_type_field_name}={content_type_id}"
+    )
+
+
+def parse_filter_key(filter_key: str) -> Tuple[str, Dict[str, int]]:
+    """The field a lookup filters on and the conditions the rows must meet"""
+    field_name, separator, condition = filter_key.partition(GENERIC_FILTER_SEPARATOR)
+    if not separator:
+        return filter_key, {}
+
+    condition_field_name, _, condition_value = condition.partition("=")
+    return field_name, {condition_field_name: int(condition_value)}
+
+
+def get_content_type_id(app_model: str) -> int:
+    # Imported here, the contenttypes app is only required by generic relations
+    from django.contrib.contenttypes.models import ContentType
+
+    return ContentType.objects.get_for_model(apps.get_model(app_model)).id
+
+
+def get_content_type_model(content_type_id: int) -> Optional[str]:
+    """The ``app.model`` of a content type, cached by the contenttypes app
+
+    ``None`` when the model of the content type was removed.
+    """
+    from django.contrib.contenttypes.models import ContentType
+
+    model = ContentType.objects.get_for_id(content_type_id).model_class()
+    if model is None:
+        return None
+    return model._meta.label_lower
+
+
+def get_content_type_ids(
+    natural_keys: Iterable[Tuple[str, str]], using: str
+) -> Dict[Tuple[str, str], int]:
+    """Map the ``(app_label, model)`` of content types to their id in ``using``
+
+    Content types missing from the database are left out.
+    """
+    from django.contrib.contenttypes.models import ContentType
+
+    natural_keys = set(natural_keys)
+    if not natural_keys:
+        return {}
+
+    content_types = ContentType.objects.using(using).filter(
+        app_label__in={app_label for app_label, _ in natural_keys}
+    )
+    return {
+        (app_label, model): content_type_id
+        for app_label, model, content_type_id in content_types.values_list(
+            "app_label", "model", "id"
+        )
+        if (app_label, model) in natural_keys
+    }
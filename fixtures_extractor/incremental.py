@@ -0,0 +1,190 @@
+import hashlib
+import json
+import logging
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from fixtures_extractor.encoders import EnhancedDjangoJSONEncoder
+from fixtures_extractor.metrics import ExtractionMetrics
+from fixtures_extractor.writers import (
+    FIXTURE_WRITERS,
+    JSONFixtureWriter,
+    iter_fixture_records,
+)
+
+logger = logging.getLogger(f"extract_fixture.{__name__}")
+
+
+def encode_value(value):
+    """The value as it reads once written into a fixture"""
+    return json.loads(json.dumps(value, cls=EnhancedDjangoJSONEncoder))
+
+
+def record_digest(record: dict) -> str:
+    canonical_record = json.dumps(
+        record,
+        cls=EnhancedDjangoJSONEncoder,
+        sort_keys=True,
+        separators=(",", ":"),
+    )
+    return hashlib.sha1(canonical_record.encode("utf-8")).hexdigest()
+
+
+class PreviousFixtureIndex:
+    """The records of a fixture written by a previous extraction
+
+    Records are indexed by ``(model, pk)`` along with a digest of their
+    content, so a new extraction can tell which rows changed. Records written
+    without primary key, as natural keys, can not be told apart, they are
+    left out of the index and always count as changed.
+    """
+
+    def __init__(self, records: Optional[List[dict]] = None):
+        self.records = records or []
+        self.digests = [record_digest(record) for record in self.records]
+        self.positions: Dict[Tuple[str, object], int] = {
+            record_key: position
+            for position, record_key in enumerate(
+                self.record_key(record) for record in self.records
+            )
+            if record_key[1] is not None
+        }
+
+    @staticmethod
+    def load(fixture_file: Path):
+        if not fixture_file.exists():
+            logger.debug("No previous fixture found at %s", fixture_file)
+            return PreviousFixtureIndex()
+
+        records = list(iter_fixture_records(fixture_file=fixture_file))
+
+        logger.debug("Loaded %d records from previous %s", len(records), fixture_file)
+        return PreviousFixtureIndex(records=records)
+
+    @classmethod
+    def record_key(cls, record: dict) -> Tuple[str, object]:
+        return (record["model"], record["fields"].get("id"))
+
+    def __len__(self) -> int:
+        return len(self.records)
+
+    def get(self, app_model: str, pk) -> Optional[dict]:
+        position = self.positions.get((app_model, pk))
+        if position is None:
+            return None
+        return self.records[position]
+
+
+class IncrementalFixtureWriter:
+    """Rewrites a fixture only when its records changed
+
+    While every new record matches a record of the previous fixture, by
+    model, primary key and content, nothing is written. Records are matched
+    whatever their order, queries without ordering may return the same rows
+    in another order. On the first difference the matched records and the
+    remaining ones are streamed by a fixture writer, whose temporary file
+    replaces the previous fixture once it is complete.
+    """
+
+    def __init__(
+        self,
+        output_file: Path,
+        previous_index: PreviousFixtureIndex,
+        indent: Optional[int] = 4,
+        metrics: Optional[ExtractionMetrics] = None,
+        fixture_format: str = "json",
+    ):
+        self.output_file = output_file
+        self.previous_index = previous_index
+        self.indent = indent
+        self.fixture_format = fixture_format
+        self.metrics = metrics
+        # Positions in the previous fixture of the matched records, in the
+        # order they were written
+        self.matched_keys: Dict[Tuple[str, object], int] = {}
+        self.changed_count = 0
+        self._writer: Optional[JSONFixtureWriter] = None
+
+    @property
+    def is_changed(self) -> bool:
+        return self._writer is not None
+
+    @property
+    def duplicated_count(self) -> int:
+        if self._writer is None:
+            return 0
+        return self._writer.duplicated_count
+
+    @property
+    def written_count(self) -> int:
+        if self._writer is None:
+            return len(self.matched_keys)
+        return self._writer.written_count
+
+    def close(self):
+        if self._writer is None and len(self.matched_keys) < len(self.previous_index):
+            # Records of the previous fixture were removed
+            self._start_writing()
+
+        if self._writer is None:
+            logger.debug("File %s is unchanged", self.output_file)
+            return
+
+        self._writer.close()
+        logger.debug(
+            "File %s rewritten, %d records changed since the previous extraction",
+            self.output_file,
+            self.changed_count,
+        )
+
+    def write(self, record: dict) -> bool:
+        if self._writer is not None:
+            return self._write_changed(record=record)
+
+        record_key = PreviousFixtureIndex.record_key(record)
+        if record_key in self.matched_keys:
+            return False
+
+        position = self.previous_index.positions.get(record_key)
+        if position is not None and self.previous_index.digests[
+            position
+        ] == record_digest(record):
+            self.matched_keys[record_key] = position
+            return True
+
+        self._start_writing()
+        return self._write_changed(record=record)
+
+    def write_records(self, records: Iterable[dict]):
+        for record in records:
+            self.write(record)
+
+    def _start_writing(self):
+        self._writer = FIXTURE_WRITERS[self.fixture_format](
+            output_file=self.output_file, indent=self.indent, metrics=self.metrics
+        )
+        self._writer.open()
+        self._writer.write_records(
+            self.previous_index.records[position]
+            for position in self.matched_keys.values()
+        )
+
+    def _write_changed(self, record: dict) -> bool:
+        position = self.previous_index.positions.get(
+            PreviousFixtureIndex.record_key(record)
+        )
+        if position is None or self.previous_index.digests[position] != record_digest(
+            record
+        ):
+            self.changed_count += 1
+        return self._writer.write(record)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is not None and self._writer is not None:
+            self._writer.abort()
+            return
+
+        self.close()
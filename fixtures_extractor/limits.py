@@ -0,0 +1,55 @@
+from dataclasses import dataclass
+from fnmatch import fnmatchcase
+from typing import Optional, Tuple
+
+from fixtures_extractor.dtos import ExtractionEdgeDTO
+
+
+@dataclass(frozen=True)
+class TraversalLimits:
+    """Bounds how far and how wide an extraction goes
+
+    ``max_depth`` is the number of relation hops, of any kind, from the root
+    records after which the edges fanning out stop being followed, and
+    ``max_rows_per_relation`` the number of rows fetched through every
+    reverse relation of an extraction. ``allowed_edges`` and
+    ``denied_edges`` are shell style patterns matched against the edges of
+    the plan, written as ``<source>-><target>`` or, to match a single kind of
+    relation, as ``<kind>:<source>-><target>`` where kind is one of
+    ``through``, ``generic`` or ``reverse``. For example
+    ``reverse:*->eventol.attendee``. Rows of many to many through models are
+    fetched whole, ``max_rows_per_relation`` does not apply to them.
+
+    Limits only apply to the edges fanning out of the rows. Foreign keys,
+    many to many and generic foreign keys of the extracted rows are always
+    followed, whatever the depth, so fixtures never miss the rows they need
+    to load.
+    """
+
+    max_depth: Optional[int] = None
+    max_rows_per_relation: Optional[int] = None
+    allowed_edges: Tuple[str, ...] = ()
+    denied_edges: Tuple[str, ...] = ()
+
+    def is_edge_allowed(self, edge: ExtractionEdgeDTO) -> bool:
+        if not edge.is_fan_out:
+            return True
+
+        if self.allowed_edges and not self._match_edge(
+            edge=edge, patterns=self.allowed_edges
+        ):
+            return False
+
+        return not self._match_edge(edge=edge, patterns=self.denied_edges)
+
+    @classmethod
+    def _match_edge(cls, edge: ExtractionEdgeDTO, patterns: Tuple[str, ...]) -> bool:
+        edge_name = f"{edge.source}->{edge.target}"
+        qualified_edge_name = f"{edge.relation_kind.value}:{edge_name}"
+
+        for pattern in patterns:
+            name = qualified_edge_name if ":" in pattern else edge_name
+            if fnmatchcase(name, pattern.lower()):
+                return True
+
+        return False
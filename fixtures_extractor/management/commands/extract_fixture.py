@@ -1,11 +1,30 @@
 import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from contextlib import nullcontext
 from pathlib import Path
-from typing import List
+from typing import List, Optional, Tuple
 
-from django.core.management.base import BaseCommand
+import django
+from django.apps import apps
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections
 
 from fixtures_extractor.extra_logging_formatter import ExtraFormatter
+from fixtures_extractor.incremental import PreviousFixtureIndex
+from fixtures_extractor.limits import TraversalLimits
+from fixtures_extractor.metrics import ExtractionMetrics
+from fixtures_extractor.ordering import RECORD_ORDERS
 from fixtures_extractor.orm_extractor import ORMExtractor
+from fixtures_extractor.persistent_cache import PersistentRecordCache
+from fixtures_extractor.progress import ProgressReporter
+from fixtures_extractor.projection import FieldProjection
+from fixtures_extractor.traversal import GraphTraversal, RecordCache
+from fixtures_extractor.writers import (
+    COMPRESSORS,
+    FIXTURE_WRITERS,
+    get_fixture_suffix,
+)
 
 logger = logging.getLogger("extract_fixture")
 console = logging.StreamHandler()
@@ -14,6 +33,9 @@ console.setFormatter(ExtraFormatter("%(name)s - %(levelname)s - %(message)s"))
 logger.addHandler(console)
 
 
+# Primary ids between two progress lines
+PRIMARY_IDS_REPORT_EVERY = 100
+
 VERBOSITY = {
     0: logging.ERROR,
     1: logging.WARN,
@@ -23,6 +45,124 @@ VERBOSITY = {
 
 
 orm_extractor = ORMExtractor()
+_worker_graph_traversal: Optional[GraphTraversal] = None
+
+
+def extract_primary_id(
+    graph_traversal: GraphTraversal,
+    full_model_name: str,
+    model_name: str,
+    filter_key: str,
+    primary_id: int,
+    output_dir: Path,
+    incremental: bool = False,
+    compression: Optional[str] = None,
+    indent: Optional[int] = 4,
+    fixture_format: str = "json",
+    order: str = "dependency",
+    natural_foreign: bool = False,
+    natural_primary: bool = False,
+) -> Path:
+    logger.debug("Processing %s with %s=%s", full_model_name, filter_key, primary_id)
+    primary_output_dir = output_dir.joinpath(f"{model_name.lower()}_{primary_id}")
+    primary_output_dir.mkdir(parents=True, exist_ok=True)
+    output_file = primary_output_dir.joinpath(
+        full_model_name
+        + get_fixture_suffix(compression=compression, fixture_format=fixture_format)
+    )
+
+    previous_index = None
+    if incremental:
+        previous_index = PreviousFixtureIndex.load(fixture_file=output_file)
+
+    metrics = graph_traversal.metrics
+    with metrics.collect() if metrics is not None else nullcontext():
+        records = graph_traversal.iter_records(
+            app_model=full_model_name,
+            filter_key=filter_key,
+            filter_values=[primary_id],
+            previous_index=previous_index,
+        )
+
+        orm_extractor.dump_records(
+            output_file=output_file,
+            records=records,
+            previous_index=previous_index,
+            metrics=metrics,
+            indent=indent,
+            fixture_format=fixture_format,
+            order=order,
+            natural_foreign=natural_foreign,
+            natural_primary=natural_primary,
+        )
+    return output_file
+
+
+def build_graph_traversal(
+    projection: FieldProjection,
+    limits: TraversalLimits,
+    chunk_size: Optional[int] = None,
+    timestamp_field: Optional[str] = None,
+    cache_options: Optional[dict] = None,
+) -> GraphTraversal:
+    if cache_options:
+        record_cache = PersistentRecordCache(**cache_options)
+    elif chunk_size:
+        # Chunked extractions keep memory bounded, caching every row would not
+        record_cache = None
+    else:
+        record_cache = RecordCache()
+
+    return GraphTraversal(
+        orm_extractor=orm_extractor,
+        record_cache=record_cache,
+        projection=projection,
+        chunk_size=chunk_size,
+        limits=limits,
+        timestamp_field=timestamp_field,
+    )
+
+
+def init_worker(verbosity: int, traversal_options: dict):
+    """Prepare a pool worker, each one holds its own connection and cache"""
+    global _worker_graph_traversal
+
+    # Workers started with the spawn method do not inherit the app registry
+    if not apps.ready:
+        django.setup()
+
+    logger.setLevel(VERBOSITY[verbosity])
+    _worker_graph_traversal = build_graph_traversal(**traversal_options)
+
+
+def extract_primary_id_in_worker(
+    collect_metrics: bool = False, **kwargs
+) -> Tuple[Path, Optional[ExtractionMetrics]]:
+    # Metrics of every primary id are sent back and merged by the parent
+    metrics = ExtractionMetrics() if collect_metrics else None
+    _worker_graph_traversal.metrics = metrics
+
+    output_file = extract_primary_id(graph_traversal=_worker_graph_traversal, **kwargs)
+    return output_file, metrics
+
+
+def is_in_memory_database(using: str = DEFAULT_DB_ALIAS) -> bool:
+    """Whether ``using`` is an in-memory SQLite database
+
+    Such a database only lives in the connection that created it, it can not
+    be shared with worker processes.
+    """
+    connection = connections[using]
+    database_name = str(connection.settings_dict["NAME"])
+    return connection.vendor == "sqlite" and (
+        database_name == ":memory:" or "mode=memory" in database_name
+    )
+
+
+def get_pool_context():
+    if "fork" in multiprocessing.get_all_start_methods():
+        return multiprocessing.get_context("fork")
+    return multiprocessing.get_context()
 
 
 class Command(BaseCommand):
@@ -52,6 +192,176 @@ class Command(BaseCommand):
             default="fixtures",
             help="Output dir for all the resulted fixtures",
         )
+        parser.add_argument(
+            "-j",
+            "--jobs",
+            type=int,
+            default=1,
+            help="Number of worker processes used to extract the primary ids",
+        )
+        parser.add_argument(
+            "--include-field",
+            action="append",
+            dest="include_fields",
+            help=(
+                "Only fetch this field, as app.model.field, for its model. "
+                "Can be used multiple times"
+            ),
+        )
+        parser.add_argument(
+            "--exclude-field",
+            action="append",
+            dest="exclude_fields",
+            help=(
+                "Do not fetch this field, as app.model.field, for its model. "
+                "Can be used multiple times"
+            ),
+        )
+        parser.add_argument(
+            "--keys-only-traversal",
+            action="store_true",
+            help=(
+                "Walk the relations fetching only keys and load the other "
+                "fields in a final pass for the extracted rows"
+            ),
+        )
+        parser.add_argument(
+            "--chunk-size",
+            type=int,
+            help=(
+                "Read every query in chunks of this many rows instead of loading "
+                "the whole result in memory"
+            ),
+        )
+        parser.add_argument(
+            "--max-depth",
+            type=int,
+            help=(
+                "Maximum number of relation hops from the start model, after "
+                "which reverse relations are no longer followed"
+            ),
+        )
+        parser.add_argument(
+            "--max-rows-per-relation",
+            type=int,
+            help="Maximum number of rows fetched through every reverse relation",
+        )
+        parser.add_argument(
+            "--follow-edge",
+            action="append",
+            dest="allowed_edges",
+            help=(
+                "Only follow the reverse relations matching this pattern, written as "
+                "[through|generic|reverse:]app.model->app.model with shell wildcards. "
+                "Can be used multiple times"
+            ),
+        )
+        parser.add_argument(
+            "--skip-edge",
+            action="append",
+            dest="denied_edges",
+            help=(
+                "Do not follow the reverse relations matching this pattern, written as "
+                "[through|generic|reverse:]app.model->app.model with shell wildcards. "
+                "Can be used multiple times"
+            ),
+        )
+        parser.add_argument(
+            "--cache-file",
+            type=str,
+            help=(
+                "SQLite file keeping the fetched rows between runs, so repeated "
+                "extractions only query the database for the missing ones"
+            ),
+        )
+        parser.add_argument(
+            "--cache-ttl",
+            type=float,
+            help="Seconds a row kept in the cache file is valid for",
+        )
+        parser.add_argument(
+            "--cache-max-entries",
+            type=int,
+            help="Maximum number of rows and lookups kept in the cache file",
+        )
+        parser.add_argument(
+            "--format",
+            dest="fixture_format",
+            choices=sorted(FIXTURE_WRITERS),
+            default="json",
+            help=(
+                "Fixture format, a JSON array or JSON lines with a record per "
+                "line, which requires Django 3.2, json by default"
+            ),
+        )
+        parser.add_argument(
+            "--compression",
+            choices=sorted(COMPRESSORS),
+            help="Compress the fixtures while they are written, loaddata reads them",
+        )
+        parser.add_argument(
+            "--indent",
+            type=int,
+            default=4,
+            help="Spaces used to indent the fixtures, 4 by default",
+        )
+        parser.add_argument(
+            "--compact",
+            action="store_true",
+            help="Write the fixtures without any whitespace, ignores --indent",
+        )
+        parser.add_argument(
+            "--order",
+            choices=RECORD_ORDERS,
+            default="dependency",
+            help=(
+                "Order of the records, dependency writes every record after the "
+                "records it points to so loaddata inserts them in one pass, "
+                "traversal keeps the order they were found. dependency by default"
+            ),
+        )
+        parser.add_argument(
+            "--natural-foreign",
+            action="store_true",
+            help=(
+                "Write relations to models defining natural_key as natural keys, "
+                "so fixtures load into databases with other primary keys"
+            ),
+        )
+        parser.add_argument(
+            "--natural-primary",
+            action="store_true",
+            help=(
+                "Leave out the primary key of models defining natural_key, "
+                "loaddata finds their rows by natural key"
+            ),
+        )
+        parser.add_argument(
+            "--metrics",
+            action="store_true",
+            help=(
+                "Print the queries, rows and time spent per model and relation "
+                "once the extraction is done"
+            ),
+        )
+        parser.add_argument(
+            "--incremental",
+            action="store_true",
+            help=(
+                "Compare against the fixtures already in the output dir and "
+                "only rewrite the ones whose records changed"
+            ),
+        )
+        parser.add_argument(
+            "--timestamp-field",
+            type=str,
+            default="updated_at",
+            help=(
+                "Field telling when a row was last modified. With --incremental "
+                "and --keys-only-traversal, rows whose timestamp did not change "
+                "are reused from the previous fixtures instead of being fetched"
+            ),
+        )
 
     def handle(self, *args, **options):
         logger.setLevel(VERBOSITY[options.get("verbosity", 0)])
@@ -61,12 +371,15 @@ class Command(BaseCommand):
         output_dir = Path(options.get("output_dir"))
 
         logger.info(
-            f"Extracting fixtures for {app_name}.{model_name} into '{output_dir}' path"
+            "Extracting fixtures for %s.%s into '%s' path",
+            app_name,
+            model_name,
+            output_dir,
         )
 
         filter_key = "id"
         primary_ids: List = options.get("primary_ids")
-        logger.info(f"Filtering by {filter_key}={primary_ids}")
+        logger.info("Filtering by %s=%s", filter_key, primary_ids)
 
         if not app_name.islower() or not model_name.islower():
             logger.warning(
@@ -76,123 +389,218 @@ class Command(BaseCommand):
         app_name = app_name.lower()
         model_name = model_name.lower()
         full_model_name = f"{app_name}.{model_name}"
-        logger.debug(f"Full model name: {full_model_name}")
+        logger.debug("Full model name: %s", full_model_name)
+
+        extract_options = {
+            "full_model_name": full_model_name,
+            "model_name": model_name,
+            "filter_key": filter_key,
+            "output_dir": output_dir,
+            "incremental": options.get("incremental", False),
+            "compression": options.get("compression"),
+            "fixture_format": options.get("fixture_format", "json"),
+            "indent": None if options.get("compact") else options.get("indent", 4),
+            "order": options.get("order", "dependency"),
+            "natural_foreign": options.get("natural_foreign", False),
+            "natural_primary": options.get("natural_primary", False),
+        }
+        if extract_options["indent"] is not None and extract_options["indent"] < 0:
+            raise CommandError("The indent can not be negative")
+        # loaddata can not read the fixtures otherwise
+        if extract_options["fixture_format"] == "jsonl" and django.VERSION < (3, 2):
+            raise CommandError("The jsonl format requires Django 3.2 or later")
+        if extract_options["incremental"] and (
+            extract_options["natural_foreign"] or extract_options["natural_primary"]
+        ):
+            raise CommandError(
+                "Natural keys can not be used with incremental extractions"
+            )
+        jobs: int = options.get("jobs") or 1
+
+        try:
+            projection = FieldProjection.build(
+                include=options.get("include_fields"),
+                exclude=options.get("exclude_fields"),
+                keys_only=options.get("keys_only_traversal", False),
+            )
+        except ValueError as ex:
+            raise CommandError(ex)
+
+        chunk_size: Optional[int] = options.get("chunk_size")
+        if chunk_size is not None and chunk_size < 1:
+            raise CommandError("The chunk size must be a positive number")
+
+        limits = TraversalLimits(
+            max_depth=options.get("max_depth"),
+            max_rows_per_relation=options.get("max_rows_per_relation"),
+            allowed_edges=tuple(options.get("allowed_edges") or ()),
+            denied_edges=tuple(options.get("denied_edges") or ()),
+        )
+        if (limits.max_depth is not None and limits.max_depth < 0) or (
+            limits.max_rows_per_relation is not None
+            and limits.max_rows_per_relation < 1
+        ):
+            raise CommandError("The traversal limits must be positive numbers")
+
+        cache_options = None
+        if options.get("cache_file"):
+            if chunk_size is not None:
+                raise CommandError("The cache file can not be used with a chunk size")
+            cache_options = {
+                "cache_file": Path(options.get("cache_file")),
+                "ttl": options.get("cache_ttl"),
+                "max_entries": options.get("cache_max_entries"),
+            }
+            if (cache_options["ttl"] is not None and cache_options["ttl"] <= 0) or (
+                cache_options["max_entries"] is not None
+                and cache_options["max_entries"] < 1
+            ):
+                raise CommandError("The cache limits must be positive numbers")
+
+        traversal_options = {
+            "projection": projection,
+            "limits": limits,
+            "chunk_size": chunk_size,
+            "cache_options": cache_options,
+        }
+        if extract_options["incremental"]:
+            traversal_options["timestamp_field"] = options.get("timestamp_field")
+
+        metrics = ExtractionMetrics() if options.get("metrics") else None
+
+        if jobs > 1 and is_in_memory_database():
+            logger.warning(
+                "--jobs is not supported on in-memory SQLite databases, "
+                "extracting the primary ids sequentially"
+            )
+            jobs = 1
+
+        if jobs > 1 and len(primary_ids) > 1:
+            self.extract_in_pool(
+                primary_ids=primary_ids,
+                jobs=jobs,
+                verbosity=options.get("verbosity", 0),
+                traversal_options=traversal_options,
+                metrics=metrics,
+                **extract_options,
+            )
+        else:
+            self.extract_sequentially(
+                primary_ids=primary_ids,
+                traversal_options=traversal_options,
+                metrics=metrics,
+                **extract_options,
+            )
+
+        # Kept on the command for callers that want the numbers themselves
+        self.metrics = metrics
+        if metrics is not None:
+            self.stdout.write(metrics.summary())
+
+    def extract_sequentially(
+        self,
+        primary_ids: List,
+        traversal_options: dict,
+        metrics: Optional[ExtractionMetrics] = None,
+        **extract_options,
+    ):
+        graph_traversal = build_graph_traversal(**traversal_options)
+        graph_traversal.metrics = metrics
+        progress = ProgressReporter(
+            logger=logger, every=PRIMARY_IDS_REPORT_EVERY, unit="primary ids"
+        )
 
         for primary_id in primary_ids:
             try:
-                logger.debug(
-                    f"Processing {full_model_name} with {filter_key}={primary_id}"
-                )
-                primary_output_dir = output_dir.joinpath(
-                    f"{model_name.lower()}_{primary_id}"
+                output_file = extract_primary_id(
+                    graph_traversal=graph_traversal,
+                    primary_id=primary_id,
+                    **extract_options,
                 )
-                primary_output_dir.mkdir(parents=True, exist_ok=True)
-                output_file = primary_output_dir.joinpath(f"{full_model_name}.json")
-
-                records = self.process_fields(
-                    full_model_name=full_model_name,
-                    filter_key=filter_key,
-                    filter_value=str(primary_id),
-                    history=[],
-                    origin=full_model_name,
-                )
-
-                orm_extractor.dump_records(output_file=output_file, records=records)
-                logger.info(f"File {output_file} saved")
+                logger.debug("File %s saved", output_file)
             except Exception as ex:
-                logger.error(
-                    f"Error processing {full_model_name} with {filter_key}={primary_id}"
+                self.log_primary_id_error(
+                    primary_id=primary_id, ex=ex, **extract_options
                 )
-                logger.debug(ex, exc_info=True)
-
-    def process_fields(
-        self,
-        full_model_name: str,
-        filter_key: str,
-        filter_value: str,
-        history: List,
-        origin: str,
-    ) -> list:
-        navigation_msg = f"navigating form {origin} to {full_model_name} with {filter_key}={filter_value}"
+            progress.add(1)
 
-        if (origin, full_model_name, filter_key, filter_value) in history:
-            logger.debug(f"Skipped {navigation_msg}, was already processed")
-            return []
+        progress.report()
 
-        logger.info(f"Processing {navigation_msg}")
-        history.append((origin, full_model_name, filter_key, filter_value))
+        record_cache = graph_traversal.record_cache
+        if record_cache is not None:
+            logger.debug(
+                "Record cache served %d lookups, %d went to the database",
+                record_cache.hits,
+                record_cache.misses,
+            )
 
-        schema_records = []
+        if isinstance(record_cache, PersistentRecordCache):
+            logger.debug("Cache file served %d lookups", record_cache.disk_hits)
+            record_cache.close()
 
-        base_model_records = orm_extractor.get_records(
-            app_model=full_model_name, filter_key=filter_key, filter_value=filter_value
+    def extract_in_pool(
+        self,
+        primary_ids: List,
+        jobs: int,
+        verbosity: int,
+        traversal_options: dict,
+        metrics: Optional[ExtractionMetrics] = None,
+        **extract_options,
+    ):
+        logger.info("Extracting %d primary ids with %d workers", len(primary_ids), jobs)
+        progress = ProgressReporter(
+            logger=logger, every=PRIMARY_IDS_REPORT_EVERY, unit="primary ids"
         )
 
-        if len(base_model_records) == 0:
-            logger.debug(f"No records found for {full_model_name}")
-            return []
+        # Forked workers must not share the parent connections, they open
+        # their own ones the first time they query the database
+        connections.close_all()
+
+        with ProcessPoolExecutor(
+            max_workers=jobs,
+            mp_context=get_pool_context(),
+            initializer=init_worker,
+            initargs=(verbosity, traversal_options),
+        ) as executor:
+            futures = {
+                executor.submit(
+                    extract_primary_id_in_worker,
+                    collect_metrics=metrics is not None,
+                    primary_id=primary_id,
+                    **extract_options,
+                ): primary_id
+                for primary_id in primary_ids
+            }
+
+            for future in as_completed(futures):
+                primary_id = futures[future]
+                try:
+                    output_file, primary_id_metrics = future.result()
+                    logger.debug("File %s saved", output_file)
+                    if metrics is not None:
+                        metrics.merge(primary_id_metrics)
+                except Exception as ex:
+                    self.log_primary_id_error(
+                        primary_id=primary_id, ex=ex, **extract_options
+                    )
+                progress.add(1)
 
-        jsonfy_records = orm_extractor.build_records(
-            app_model=full_model_name, records=base_model_records
-        )
-        schema_records.extend(jsonfy_records)
+        progress.report()
 
-        one_relation_declared_fields = orm_extractor.get_model_declared_one_relations(
-            app_model=full_model_name
-        )
-        logger.debug(f"Found {len(one_relation_declared_fields)} one declared fields")
+        # Workers exit without closing their caches, evict them once from here
+        cache_options = traversal_options.get("cache_options")
+        if cache_options:
+            PersistentRecordCache(**cache_options).close()
 
-        many_relation_declared_fields = orm_extractor.get_model_declared_many_relations(
-            app_model=full_model_name
-        )
-        logger.debug(f"Found {len(many_relation_declared_fields)} many declared fields")
-
-        target_relation_fields = orm_extractor.get_model_target_relations(
-            app_model=full_model_name
+    def log_primary_id_error(
+        self,
+        primary_id: int,
+        ex: Exception,
+        full_model_name: str,
+        filter_key: str,
+        **kwargs,
+    ):
+        logger.error(
+            "Error processing %s with %s=%s", full_model_name, filter_key, primary_id
         )
-        logger.debug(f"Found {len(target_relation_fields)} target fields")
-
-        for record in base_model_records:
-            logger.debug("Processing one relation fields")
-            for one_declared_field in one_relation_declared_fields:
-                full_name = (
-                    f"{one_declared_field.app_name}.{one_declared_field.model_name}"
-                )
-                one_declared_records = self.process_fields(
-                    full_model_name=full_name,
-                    filter_key="id",
-                    filter_value=record[one_declared_field.field_name],
-                    history=history,
-                    origin=full_model_name,
-                )
-                schema_records.extend(one_declared_records)
-
-            logger.debug("Processing many relation fields")
-            for many_declared_field in many_relation_declared_fields:
-                full_name = (
-                    f"{many_declared_field.app_name}.{many_declared_field.model_name}"
-                )
-
-                for filter_value in record[many_declared_field.field_name]:
-                    many_declared_records = self.process_fields(
-                        full_model_name=full_name,
-                        filter_key="id",
-                        filter_value=filter_value,
-                        history=history,
-                        origin=full_model_name,
-                    )
-                    schema_records.extend(many_declared_records)
-
-            logger.debug("Processing target relation fields")
-            for target_field in target_relation_fields:
-                full_name = f"{target_field.app_name}.{target_field.model_name}"
-                target_records = self.process_fields(
-                    full_model_name=full_name,
-                    filter_key=target_field.field_name,
-                    filter_value=record["id"],
-                    history=history,
-                    origin=full_model_name,
-                )
-                schema_records.extend(target_records)
-
-        return schema_records
+        logger.debug(ex, exc_info=True)
@@ -0,0 +1,142 @@
+from pathlib import Path
+from typing import List
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS
+
+from fixtures_extractor.management.commands.extract_fixture import VERBOSITY, logger
+from fixtures_extractor.remapping import FixtureRemapper
+from fixtures_extractor.writers import (
+    FIXTURE_WRITERS,
+    get_fixture_format,
+    iter_fixture_records,
+)
+
+
+def find_fixture_files(paths: List[Path]) -> List[Path]:
+    """The fixtures at ``paths``, directories are searched recursively"""
+    fixture_files = []
+    for path in paths:
+        if path.is_dir():
+            fixture_files.extend(
+                sorted(
+                    fixture_file
+                    for fixture_file in path.rglob("*")
+                    if fixture_file.is_file()
+                    and get_fixture_format(fixture_file=fixture_file) in FIXTURE_WRITERS
+                )
+            )
+        elif path.is_file():
+            fixture_files.append(path)
+        else:
+            raise CommandError(f"No fixture found at {path}")
+    return fixture_files
+
+
+class Command(BaseCommand):
+    help = (
+        "Rewrites the primary keys of a set of fixtures, and every relation "
+        "pointing to them, so they load into a database already holding rows"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "fixtures",
+            type=str,
+            nargs="+",
+            help="Fixture files, or directories searched for fixtures",
+        )
+        parser.add_argument(
+            "-d",
+            "--output_dir",
+            type=str,
+            default="remapped_fixtures",
+            help="Output dir for the remapped fixtures, keeping their file names",
+        )
+        parser.add_argument(
+            "--database",
+            type=str,
+            default=DEFAULT_DB_ALIAS,
+            help=(
+                "Database the fixtures will be loaded into, new primary keys "
+                "start after its highest ones"
+            ),
+        )
+        parser.add_argument(
+            "--indent",
+            type=int,
+            default=4,
+            help="Spaces used to indent the fixtures, 4 by default",
+        )
+        parser.add_argument(
+            "--compact",
+            action="store_true",
+            help="Write the fixtures without any whitespace, ignores --indent",
+        )
+
+    def handle(self, *args, **options):
+        logger.setLevel(VERBOSITY[options.get("verbosity", 0)])
+
+        output_dir = Path(options.get("output_dir"))
+        indent = None if options.get("compact") else options.get("indent", 4)
+        if indent is not None and indent < 0:
+            raise CommandError("The indent can not be negative")
+
+        paths = [Path(fixture) for fixture in options.get("fixtures")]
+        fixture_files = find_fixture_files(paths=paths)
+        # Fixtures found in directories keep their path relative to them
+        output_files = {
+            fixture_file: output_dir.joinpath(
+                self.get_relative_path(fixture_file=fixture_file, paths=paths)
+            )
+            for fixture_file in fixture_files
+        }
+        if any(
+            fixture_file.resolve() == output_file.resolve()
+            for fixture_file, output_file in output_files.items()
+        ):
+            raise CommandError("The remapped fixtures would overwrite the fixtures")
+
+        remapper = FixtureRemapper(using=options.get("database"))
+        for fixture_file in fixture_files:
+            logger.debug("Indexing %s", fixture_file)
+            remapper.index(records=iter_fixture_records(fixture_file=fixture_file))
+        remapper.freeze()
+
+        for fixture_file, output_file in output_files.items():
+            logger.debug("Remapping %s into %s", fixture_file, output_file)
+            output_file.parent.mkdir(parents=True, exist_ok=True)
+            writer = FIXTURE_WRITERS[get_fixture_format(fixture_file=fixture_file)](
+                output_file=output_file, indent=indent
+            )
+            with writer:
+                writer.write_records(
+                    remapper.iter_records(
+                        records=iter_fixture_records(fixture_file=fixture_file)
+                    )
+                )
+
+        if remapper.unmapped_count:
+            logger.warning(
+                "%d references point to rows outside of the fixtures, "
+                "they were left untouched",
+                remapper.unmapped_count,
+            )
+        logger.debug(
+            "Dropped %d content types already in the database",
+            remapper.dropped_count,
+        )
+        logger.info(
+            "Remapped %d records of %d models from %d fixtures into '%s'",
+            remapper.remapped_count,
+            len(remapper.pk_maps),
+            len(fixture_files),
+            output_dir,
+        )
+
+    @classmethod
+    def get_relative_path(cls, fixture_file: Path, paths: List[Path]) -> Path:
+        for path in paths:
+            if path.is_dir() and path in fixture_file.parents:
+                return fixture_file.relative_to(path)
+        return Path(fixture_file.name)
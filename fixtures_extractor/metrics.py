@@ -0,0 +1,137 @@
+import logging
+from collections import defaultdict
+from contextlib import contextmanager
+from dataclasses import dataclass
+from time import perf_counter
+from typing import Dict, Tuple
+
+from django.db import DEFAULT_DB_ALIAS, connections
+
+logger = logging.getLogger(f"extract_fixture.{__name__}")
+
+
+# Step of the queries run outside of any traversal step
+OTHER_STEP = ("-", "-")
+
+
+@dataclass
+class StepMetrics:
+    queries: int = 0
+    sql_seconds: float = 0.0
+    rows: int = 0
+    deduplicated_rows: int = 0
+    cached_rows: int = 0
+
+    def merge(self, other: "StepMetrics"):
+        self.queries += other.queries
+        self.sql_seconds += other.sql_seconds
+        self.rows += other.rows
+        self.deduplicated_rows += other.deduplicated_rows
+        self.cached_rows += other.cached_rows
+
+
+class ExtractionMetrics:
+    """Counters of an extraction, per model and relation
+
+    Every query run while ``collect`` is active is attributed to the current
+    step, the ``(model, relation)`` being fetched, where the relation is the
+    lookup keys of the fetch. Lookups reaching a model through several edges
+    are fetched together, so they share a step. Natural keys are fetched in
+    the ``natural_keys`` step of their model and records are written in its
+    ``write`` step. ``rows`` only counts the rows returned by queries, rows
+    read from the record cache are counted in ``cached_rows``. Serialization
+    and disk time are measured by the fixture writers.
+    """
+
+    def __init__(self):
+        self.steps: Dict[Tuple[str, str], StepMetrics] = defaultdict(StepMetrics)
+        self.current_step = OTHER_STEP
+        self.serialization_seconds = 0.0
+        self.write_seconds = 0.0
+        self.written_records = 0
+
+    @contextmanager
+    def collect(self, using: str = DEFAULT_DB_ALIAS):
+        connection = connections[using]
+        # Execute wrappers are only available since Django 2.0
+        if not hasattr(connection, "execute_wrapper"):
+            logger.warning("Queries can not be measured with this Django version")
+            yield self
+            return
+
+        with connection.execute_wrapper(self.execute):
+            yield self
+
+    def execute(self, execute, sql, params, many, context):
+        started_at = perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            step_metrics = self.steps[self.current_step]
+            step_metrics.queries += 1
+            step_metrics.sql_seconds += perf_counter() - started_at
+
+    def set_step(self, app_model: str, relation: str):
+        self.current_step = (app_model, relation)
+
+    def add_rows(self, rows: int, deduplicated_rows: int = 0, cached_rows: int = 0):
+        step_metrics = self.steps[self.current_step]
+        step_metrics.rows += rows
+        step_metrics.deduplicated_rows += deduplicated_rows
+        step_metrics.cached_rows += cached_rows
+
+    def add_write(self, serialization_seconds: float, write_seconds: float):
+        self.serialization_seconds += serialization_seconds
+        self.write_seconds += write_seconds
+
+    def merge(self, other: "ExtractionMetrics"):
+        for step, step_metrics in other.steps.items():
+            self.steps[step].merge(step_metrics)
+        self.serialization_seconds += other.serialization_seconds
+        self.write_seconds += other.write_seconds
+        self.written_records += other.written_records
+
+    @property
+    def total(self) -> StepMetrics:
+        total = StepMetrics()
+        for step_metrics in self.steps.values():
+            total.merge(step_metrics)
+        return total
+
+    def as_dict(self) -> dict:
+        return {
+            "steps": [
+                {"model": app_model, "relation": relation, **vars(step_metrics)}
+                for (app_model, relation), step_metrics in sorted(self.steps.items())
+            ],
+            "serialization_seconds": self.serialization_seconds,
+            "write_seconds": self.write_seconds,
+            "written_records": self.written_records,
+        }
+
+    def summary(self) -> str:
+        lines = [
+            f"{'model':<32}{'relation':<24}{'queries':>8}{'rows':>10}"
+            f"{'duplicated':>12}{'cached':>10}{'sql ms':>10}"
+        ]
+        for (app_model, relation), step_metrics in sorted(
+            self.steps.items(), key=lambda item: -item[1].sql_seconds
+        ):
+            lines.append(self._format_line(app_model, relation, step_metrics))
+        lines.append(self._format_line("total", "", self.total))
+        lines.append(
+            f"Serialized {self.written_records} records in "
+            f"{self.serialization_seconds * 1000:.1f} ms, "
+            f"{self.write_seconds * 1000:.1f} ms writing to disk"
+        )
+        return "\n".join(lines)
+
+    @classmethod
+    def _format_line(
+        cls, app_model: str, relation: str, step_metrics: StepMetrics
+    ) -> str:
+        return (
+            f"{app_model:<32}{relation:<24}{step_metrics.queries:>8}"
+            f"{step_metrics.rows:>10}{step_metrics.deduplicated_rows:>12}"
+            f"{step_metrics.cached_rows:>10}{step_metrics.sql_seconds * 1000:>10.1f}"
+        )
@@ -0,0 +1,184 @@
+import logging
+from collections import defaultdict
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from django.apps import apps
+
+from fixtures_extractor.dtos import ModelFieldMetaDTO
+from fixtures_extractor.enums import FieldType
+from fixtures_extractor.metrics import ExtractionMetrics
+from fixtures_extractor.schema import SchemaRegistry
+from fixtures_extractor.schema import schema_registry as default_schema_registry
+
+logger = logging.getLogger(f"extract_fixture.{__name__}")
+
+
+# Records whose relations are resolved together
+NATURAL_KEY_BATCH_SIZE = 1000
+
+
+class NaturalKeyResolver:
+    """Writes natural keys instead of primary keys, as ``dumpdata`` does
+
+    Only models defining ``natural_key`` and a default manager with
+    ``get_by_natural_key`` are concerned. With ``natural_foreign`` the
+    relations pointing to them are written as natural keys: records are read
+    in batches of ``batch_size`` and the natural keys of each model they
+    point to are fetched with a single ``in_bulk`` query, then kept for the
+    following batches. Natural keys may include the natural key of the rows
+    listed in ``natural_key.dependencies``, so the foreign keys to those
+    models are joined to that query. With ``natural_primary`` their own
+    primary key is left out, ``loaddata`` finds the rows by natural key
+    instead.
+    """
+
+    def __init__(
+        self,
+        schema_registry: Optional[SchemaRegistry] = None,
+        natural_foreign: bool = False,
+        natural_primary: bool = False,
+        batch_size: int = NATURAL_KEY_BATCH_SIZE,
+        metrics: Optional[ExtractionMetrics] = None,
+    ):
+        self.schema_registry = schema_registry or default_schema_registry
+        self.natural_foreign = natural_foreign
+        self.natural_primary = natural_primary
+        self.batch_size = batch_size
+        self.metrics = metrics
+        self.natural_keys: Dict[str, Dict[object, Tuple]] = defaultdict(dict)
+        self._has_natural_key: Dict[str, bool] = {}
+        self._natural_fields: Dict[str, Tuple[ModelFieldMetaDTO, ...]] = {}
+        self._dependency_fields: Dict[str, Tuple[str, ...]] = {}
+
+    def has_natural_key(self, app_model: str) -> bool:
+        has_natural_key = self._has_natural_key.get(app_model)
+        if has_natural_key is None:
+            model = apps.get_model(app_model)
+            has_natural_key = hasattr(model, "natural_key") and hasattr(
+                model._default_manager, "get_by_natural_key"
+            )
+            self._has_natural_key[app_model] = has_natural_key
+        return has_natural_key
+
+    def get_natural_fields(self, app_model: str) -> Tuple[ModelFieldMetaDTO, ...]:
+        """Relations of ``app_model`` pointing to models with a natural key"""
+        natural_fields = self._natural_fields.get(app_model)
+        if natural_fields is None:
+            schema = self.schema_registry.get_schema(app_model=app_model)
+            natural_fields = tuple(
+                field
+                for field in schema.one_relations + schema.many_relations
+                if self.has_natural_key(app_model=field.app_model)
+            )
+            self._natural_fields[app_model] = natural_fields
+        return natural_fields
+
+    def get_dependency_fields(self, app_model: str) -> Tuple[str, ...]:
+        """Foreign keys of ``app_model`` to the dependencies of its natural key"""
+        dependency_fields = self._dependency_fields.get(app_model)
+        if dependency_fields is None:
+            model = apps.get_model(app_model)
+            dependencies = {
+                dependency.lower()
+                for dependency in getattr(model.natural_key, "dependencies", ())
+            }
+            schema = self.schema_registry.get_schema(app_model=app_model)
+            dependency_fields = tuple(
+                field.field_name
+                for field in schema.one_relations
+                if field.app_model in dependencies
+            )
+            self._dependency_fields[app_model] = dependency_fields
+        return dependency_fields
+
+    def iter_records(self, records: Iterable[dict]) -> Iterator[dict]:
+        if not self.natural_foreign:
+            yield from records
+            return
+
+        batch = []
+        for record in records:
+            batch.append(record)
+            if len(batch) == self.batch_size:
+                yield from self.resolve_batch(records=batch)
+                batch = []
+
+        if batch:
+            yield from self.resolve_batch(records=batch)
+
+    def resolve_batch(self, records: List[dict]) -> List[dict]:
+        missing_pks = defaultdict(set)
+        for record in records:
+            for field in self.get_natural_fields(app_model=record["model"]):
+                natural_keys = self.natural_keys[field.app_model]
+                missing_pks[field.app_model].update(
+                    pk
+                    for pk in self._get_related_pks(record=record, field=field)
+                    if pk not in natural_keys
+                )
+
+        for app_model, pks in missing_pks.items():
+            if pks:
+                self.load_natural_keys(app_model=app_model, pks=pks)
+
+        return [self.convert(record=record) for record in records]
+
+    def load_natural_keys(self, app_model: str, pks: Iterable):
+        logger.debug("Fetching natural keys of %s model", app_model)
+        if self.metrics is not None:
+            self.metrics.set_step(app_model=app_model, relation="natural_keys")
+
+        model = apps.get_model(app_model)
+        natural_keys = self.natural_keys[app_model]
+        instances = model._default_manager.all()
+        dependency_fields = self.get_dependency_fields(app_model=app_model)
+        if dependency_fields:
+            instances = instances.select_related(*dependency_fields)
+
+        for pk, instance in instances.in_bulk(list(pks)).items():
+            natural_keys[pk] = instance.natural_key()
+
+    def convert(self, record: dict) -> dict:
+        natural_fields = self.get_natural_fields(app_model=record["model"])
+        if not natural_fields:
+            return record
+
+        # Records may be shared with the record cache, they are never altered
+        fields = dict(record["fields"])
+        for field in natural_fields:
+            value = fields.get(field.field_name)
+            if value is None:
+                continue
+
+            natural_keys = self.natural_keys[field.app_model]
+            if field.field_type == FieldType.many_to_many:
+                fields[field.field_name] = [natural_keys.get(pk, pk) for pk in value]
+            else:
+                fields[field.field_name] = natural_keys.get(value, value)
+
+        return {"model": record["model"], "fields": fields}
+
+    def strip_primary_key(self, record: dict) -> dict:
+        """The record without its primary key, when written as natural"""
+        if not self.natural_primary or not self.has_natural_key(
+            app_model=record["model"]
+        ):
+            return record
+
+        return {
+            "model": record["model"],
+            "fields": {
+                field_name: value
+                for field_name, value in record["fields"].items()
+                if field_name != "id"
+            },
+        }
+
+    @classmethod
+    def _get_related_pks(cls, record: dict, field: ModelFieldMetaDTO) -> Iterable:
+        value = record["fields"].get(field.field_name)
+        if value is None:
+            return ()
+        if field.field_type == FieldType.many_to_many:
+            return value
+        return (value,)
@@ -0,0 +1,216 @@
+import logging
+import pickle
+import tempfile
+from collections import defaultdict
+from itertools import chain
+from typing import IO, Dict, Iterable, Iterator, List, Optional, Set
+
+from fixtures_extractor.schema import SchemaRegistry
+from fixtures_extractor.schema import schema_registry as default_schema_registry
+
+logger = logging.getLogger(f"extract_fixture.{__name__}")
+
+
+# Records held in memory before the biggest model is spooled to disk
+MAX_BUFFERED_RECORDS = 100000
+
+RECORD_ORDERS = ("dependency", "traversal")
+
+
+class DependencyOrder:
+    """Sorts fixture records so every row comes after the rows it points to
+
+    Models are sorted by their foreign key, one to one and many to many
+    relations, and rows of a model pointing to rows of the same model are
+    sorted parents first, so ``loaddata`` never needs deferred constraint
+    checks. Models in a cycle keep the order they were found in. Records are
+    grouped per model, and when more than ``max_buffered_records`` are held
+    the biggest group is spooled to a temporary file.
+    """
+
+    def __init__(
+        self,
+        schema_registry: Optional[SchemaRegistry] = None,
+        max_buffered_records: int = MAX_BUFFERED_RECORDS,
+    ):
+        self.schema_registry = schema_registry or default_schema_registry
+        self.max_buffered_records = max_buffered_records
+
+    def get_dependencies(self, app_model: str) -> Set[str]:
+        schema = self.schema_registry.get_schema(app_model=app_model)
+        return {
+            field.app_model
+            for field in schema.one_relations + schema.many_relations
+            if field.app_model != app_model
+        }
+
+    def sort_models(self, models: List[str]) -> List[str]:
+        """Kahn's sort of ``models``, ties and cycles keep the given order"""
+        pending = {
+            app_model: self.get_dependencies(app_model=app_model).intersection(models)
+            for app_model in models
+        }
+
+        sorted_models = []
+        while pending:
+            ready_model = next(
+                (app_model for app_model in pending if not pending[app_model]), None
+            )
+            if ready_model is None:
+                ready_model = next(iter(pending))
+                logger.debug(
+                    "Models %s depend on each other, %s is written first",
+                    sorted(pending),
+                    ready_model,
+                )
+
+            del pending[ready_model]
+            for dependencies in pending.values():
+                dependencies.discard(ready_model)
+            sorted_models.append(ready_model)
+
+        return sorted_models
+
+    def get_self_relations(self, app_model: str) -> List[str]:
+        schema = self.schema_registry.get_schema(app_model=app_model)
+        return [
+            field.field_name
+            for field in schema.one_relations
+            if field.app_model == app_model
+        ]
+
+    @classmethod
+    def sort_self_references(
+        cls, records: Iterable[dict], record_ids: Set, field_names: List[str]
+    ) -> Iterator[dict]:
+        """Sort the rows of a model pointing to itself, parents first
+
+        ``record_ids`` are the ids of all the ``records``. Rows are streamed,
+        only the ones whose parent among them was not written yet are held in
+        memory until it is. Rows still waiting at the end are part of a cycle,
+        or point to one, and the cycle is broken at one of its rows.
+        """
+        emitted: Set = set()
+        waiting: Dict[object, List[dict]] = defaultdict(list)
+
+        def get_pending_parent_id(record: dict):
+            for field_name in field_names:
+                parent_id = record["fields"].get(field_name)
+                if (
+                    parent_id in record_ids
+                    and parent_id not in emitted
+                    and parent_id != record["fields"]["id"]
+                ):
+                    return parent_id
+            return None
+
+        def release(record: dict, is_forced: bool = False) -> Iterator[dict]:
+            """Write ``record`` if its parents are, then the rows waiting on it"""
+            ready = [record]
+            while ready:
+                current = ready.pop()
+                current_id = current["fields"]["id"]
+                if current_id in emitted:
+                    continue
+
+                parent_id = None if is_forced else get_pending_parent_id(current)
+                is_forced = False
+                if parent_id is not None:
+                    waiting[parent_id].append(current)
+                    continue
+
+                emitted.add(current_id)
+                yield current
+                ready.extend(waiting.pop(current_id, ()))
+
+        for record in records:
+            yield from release(record)
+
+        if waiting:
+            logger.debug("Rows %s reference each other", sorted(waiting))
+            waiting_records = {
+                record["fields"]["id"]: record
+                for records in waiting.values()
+                for record in records
+            }
+
+        # Rows left waiting are part of a cycle or below one, a row of the
+        # cycle is written first, which releases the others
+        while waiting:
+            record = next(iter(waiting.values()))[0]
+            walked_ids = set()
+            while record["fields"]["id"] not in walked_ids:
+                walked_ids.add(record["fields"]["id"])
+                record = waiting_records[get_pending_parent_id(record)]
+
+            parent_id = get_pending_parent_id(record)
+            waiting[parent_id].remove(record)
+            if not waiting[parent_id]:
+                del waiting[parent_id]
+            yield from release(record, is_forced=True)
+
+    def iter_sorted_records(self, records: Iterable[dict]) -> Iterator[dict]:
+        buffers: Dict[str, List[dict]] = {}
+        spools: Dict[str, IO[bytes]] = {}
+        buffered_records = 0
+
+        try:
+            for record in records:
+                model_records = buffers.setdefault(record["model"], [])
+                model_records.append(record)
+                buffered_records += 1
+
+                if buffered_records > self.max_buffered_records:
+                    app_model = max(buffers, key=lambda model: len(buffers[model]))
+                    buffered_records -= len(buffers[app_model])
+                    self._spool(spools, app_model, buffers[app_model])
+                    buffers[app_model] = []
+
+            for app_model in self.sort_models(models=list(buffers)):
+                buffered_model_records = buffers.pop(app_model)
+                model_records = chain(
+                    self._iter_spooled(spools, app_model), buffered_model_records
+                )
+                self_relations = self.get_self_relations(app_model=app_model)
+                if self_relations:
+                    # Spooled rows are read twice, their ids first
+                    record_ids = {
+                        record["fields"]["id"]
+                        for record in chain(
+                            self._iter_spooled(spools, app_model),
+                            buffered_model_records,
+                        )
+                    }
+                    model_records = self.sort_self_references(
+                        records=model_records,
+                        record_ids=record_ids,
+                        field_names=self_relations,
+                    )
+                yield from model_records
+        finally:
+            for spool in spools.values():
+                spool.close()
+
+    @classmethod
+    def _spool(cls, spools: Dict[str, IO[bytes]], app_model: str, records: List):
+        spool = spools.get(app_model)
+        if spool is None:
+            spool = spools[app_model] = tempfile.TemporaryFile()
+            logger.debug("Spooling %s records to disk", app_model)
+        for record in records:
+            pickle.dump(record, spool, protocol=pickle.HIGHEST_PROTOCOL)
+
+    @classmethod
+    def _iter_spooled(
+        cls, spools: Dict[str, IO[bytes]], app_model: str
+    ) -> Iterator[dict]:
+        spool = spools.get(app_model)
+        if spool is None:
+            return
+
+        spool.seek(0)
+        while True:
+            try:
+                yield pickle.load(spool)
+            except EOFError:
+                return
@@ -1,126 +1,340 @@
-import json
 import logging
+from collections import defaultdict
 from math import log
 from pathlib import Path
-from typing import List
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple, Type
 
+import django
 from django.apps import apps
+from django.db.models import Model, Q, QuerySet
 
-from fixtures_extractor.dtos import ModelFieldMetaDTO
-from fixtures_extractor.encoders import EnhancedDjangoJSONEncoder
-from fixtures_extractor.enums import FieldType
+from fixtures_extractor.dtos import ModelFieldMetaDTO, ModelSchemaDTO
+from fixtures_extractor.generic import parse_filter_key
+from fixtures_extractor.incremental import (
+    IncrementalFixtureWriter,
+    PreviousFixtureIndex,
+)
+from fixtures_extractor.metrics import ExtractionMetrics
+from fixtures_extractor.natural_keys import NaturalKeyResolver
+from fixtures_extractor.ordering import DependencyOrder
+from fixtures_extractor.schema import SchemaRegistry
+from fixtures_extractor.schema import schema_registry as default_schema_registry
+from fixtures_extractor.writers import FIXTURE_WRITERS
 
 logger = logging.getLogger(f"extract_fixture.{__name__}")
 
 
 class ORMExtractor:
+    def __init__(self, schema_registry: Optional[SchemaRegistry] = None):
+        self.schema_registry = schema_registry or default_schema_registry
+
     def get_records(self, app_model: str, filter_key: str, filter_value: str):
         logger.debug(
-            f"Extracting records from {app_model} model with filter {filter_key}={filter_value}"
+            "Extracting records from %s model with filter %s=%s",
+            app_model,
+            filter_key,
+            filter_value,
         )
 
-        try:
-            model = apps.get_model(app_model)
-        except LookupError as ex:
-            raise ex
+        records = self.get_model(app_model=app_model).objects.all()
 
-        fields = self.get_model_fields(app_model=app_model)
-        field_names = [field.field_name for field in fields]
+        if filter_key:
+            records = records.filter(**{filter_key: filter_value}).all()
 
-        one_relation_fields = self.get_model_declared_one_relations(app_model=app_model)
-        one_relation_field_names = [field.field_name for field in one_relation_fields]
+        return self.get_queryset_records(app_model=app_model, records=records)
 
-        many_to_many_fields = self.get_model_declared_many_relations(
-            app_model=app_model
+    def get_batch_records(
+        self,
+        app_model: str,
+        lookups: Dict[str, Iterable],
+        field_names: Optional[List[str]] = None,
+        limit: Optional[int] = None,
+    ):
+        """Fetch every record matching any of the ``lookups`` in one query
+
+        ``lookups`` maps a filter key to the values it should match, the
+        filters are OR-ed together as ``<filter_key>__in`` conditions. Only the
+        plain fields in ``field_names`` are fetched when it is given, and at
+        most ``limit`` records, by primary key order, when it is given.
+        """
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(
+                "Extracting records from %s model with filters %s",
+                app_model,
+                list(lookups),
+            )
+
+        return self.get_queryset_records(
+            app_model=app_model,
+            records=self.get_batch_queryset(
+                app_model=app_model, lookups=lookups, limit=limit
+            ),
+            field_names=field_names,
         )
-        many_to_many_field_names = [field.field_name for field in many_to_many_fields]
 
-        records = model.objects.all()
+    def iter_batch_records(
+        self,
+        app_model: str,
+        lookups: Dict[str, Iterable],
+        chunk_size: int,
+        field_names: Optional[List[str]] = None,
+        limit: Optional[int] = None,
+    ) -> Iterator[List[dict]]:
+        """Same as ``get_batch_records`` but yields the records in chunks
 
-        if filter_key:
-            records = records.filter(**{filter_key: filter_value}).all()
+        The rows are read with ``QuerySet.iterator``, which uses server-side
+        cursors on the backends supporting them, so at most ``chunk_size``
+        records are held in memory at once. Django before 2.0 fetches the
+        rows of its cursors in blocks of its own size instead.
+        """
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(
+                "Extracting records from %s model with filters %s in chunks of %d",
+                app_model,
+                list(lookups),
+                chunk_size,
+            )
 
+        values = self.get_values_queryset(
+            app_model=app_model,
+            records=self.get_batch_queryset(
+                app_model=app_model, lookups=lookups, limit=limit
+            ),
+            field_names=field_names,
+        )
+
+        if django.VERSION >= (2, 0):
+            rows = values.iterator(chunk_size=chunk_size)
+        else:
+            rows = values.iterator()
+
+        chunk = []
+        for record in rows:
+            chunk.append(record)
+            if len(chunk) == chunk_size:
+                yield self.add_many_to_many_ids(app_model=app_model, records=chunk)
+                chunk = []
+
+        if chunk:
+            yield self.add_many_to_many_ids(app_model=app_model, records=chunk)
+
+    def get_batch_queryset(
+        self,
+        app_model: str,
+        lookups: Dict[str, Iterable],
+        limit: Optional[int] = None,
+    ) -> QuerySet:
+        query = Q()
+        for filter_key, filter_values in lookups.items():
+            field_name, conditions = parse_filter_key(filter_key=filter_key)
+            query |= Q(**{f"{field_name}__in": list(filter_values)}, **conditions)
+
+        records = self.get_model(app_model=app_model).objects.filter(query)
+
+        if limit is not None:
+            records = records.order_by("pk")[:limit]
+
+        return records
+
+    def get_queryset_records(
+        self,
+        app_model: str,
+        records: QuerySet,
+        field_names: Optional[List[str]] = None,
+    ):
         base_record_values = list(
-            records.values(
-                *field_names,
-                *one_relation_field_names,
+            self.get_values_queryset(
+                app_model=app_model, records=records, field_names=field_names
             )
         )
 
-        for index, record in enumerate(records):
-            for m2m_field_name in many_to_many_field_names:
-                base_record_values[index][m2m_field_name] = list(
-                    getattr(record, m2m_field_name).values_list("id", flat=True)
+        return self.add_many_to_many_ids(
+            app_model=app_model, records=base_record_values
+        )
+
+    def get_values_queryset(
+        self,
+        app_model: str,
+        records: QuerySet,
+        field_names: Optional[List[str]] = None,
+    ) -> QuerySet:
+        if field_names is None:
+            field_names = self.get_model_field_names(app_model=app_model)
+
+        one_relation_fields = self.get_model_declared_one_relations(app_model=app_model)
+        one_relation_field_names = [field.field_name for field in one_relation_fields]
+
+        return records.values(
+            *field_names,
+            *one_relation_field_names,
+        )
+
+    def add_many_to_many_ids(self, app_model: str, records: List[dict]) -> List[dict]:
+        many_to_many_fields = self.get_model_declared_many_relations(
+            app_model=app_model
+        )
+
+        if many_to_many_fields and records:
+            record_ids = [record["id"] for record in records]
+
+            for many_to_many_field in many_to_many_fields:
+                m2m_field_name = many_to_many_field.field_name
+                related_ids = self.get_many_to_many_ids(
+                    app_model=app_model,
+                    field_name=m2m_field_name,
+                    record_ids=record_ids,
                 )
+                for record in records:
+                    record[m2m_field_name] = related_ids.get(record["id"], [])
+
+        return records
 
-        return base_record_values
+    def get_many_to_many_ids(
+        self, app_model: str, field_name: str, record_ids: List
+    ) -> Dict[object, List]:
+        """Map each record id to the ids related through ``field_name``
 
-    def dump_records(self, records: List, output_file: Path):
-        def record_key(record):
-            return (record["model"], record["fields"]["id"])
+        The ids are read straight from the through table with one query for
+        the whole batch of records, each record's ids sorted in ascending order
+        so the output does not depend on the order the relations were added.
+        """
+        field = self.get_model(app_model=app_model)._meta.get_field(field_name)
+        through = field.remote_field.through
+        source_attname = through._meta.get_field(field.m2m_field_name()).attname
+        target_attname = through._meta.get_field(field.m2m_reverse_field_name()).attname
 
-        cleaned_records = list(
-            {record_key(record): record for record in records}.values()
+        rows = (
+            through.objects.filter(**{f"{source_attname}__in": record_ids})
+            .order_by(source_attname, target_attname)
+            .values_list(source_attname, target_attname)
         )
 
-        if len(cleaned_records) < len(records):
-            logger.debug(
-                f"Found duplicated records in {len(records) - len(cleaned_records)} records"
-            )
+        related_ids = defaultdict(list)
+        for source_id, target_id in rows:
+            related_ids[source_id].append(target_id)
 
-        logger.debug(f"Saving {output_file} file with {len(cleaned_records)} records")
+        return related_ids
 
-        jsonfy_records = json.dumps(
-            cleaned_records, cls=EnhancedDjangoJSONEncoder, indent=4
+    def get_field_values(
+        self, app_model: str, pks: List, field_names: List[str]
+    ) -> Dict[object, dict]:
+        """Map each of the ``pks`` to the values of its plain ``field_names``"""
+        logger.debug(
+            "Extracting %s fields from %d %s records", field_names, len(pks), app_model
         )
-        with open(output_file, "w+") as output:
-            output.writelines(jsonfy_records)
 
-    def build_records(self, app_model: str, records: List) -> list:
-        logger.debug(f"Building records for {app_model} model")
-        results = []
+        records = self.get_model(app_model=app_model).objects.filter(pk__in=pks)
+
+        return {record["id"]: record for record in records.values(*field_names)}
+
+    def get_model(self, app_model: str) -> Type[Model]:
+        try:
+            return apps.get_model(app_model)
+        except LookupError as ex:
+            raise ex
+
+    def dump_records(
+        self,
+        records: Iterable,
+        output_file: Path,
+        previous_index: Optional[PreviousFixtureIndex] = None,
+        metrics: Optional[ExtractionMetrics] = None,
+        indent: Optional[int] = 4,
+        fixture_format: str = "json",
+        order: str = "dependency",
+        natural_foreign: bool = False,
+        natural_primary: bool = False,
+    ):
+        """Write the records into ``output_file`` in the ``fixture_format``
+
+        The file is compressed when its extension names a compression. With
+        the ``previous_index`` of the fixture already at ``output_file`` the
+        file is only rewritten when its records changed. In the
+        ``"dependency"`` order every record is written after the records it
+        points to, the ``"traversal"`` order keeps the order they were found.
+        ``natural_foreign`` and ``natural_primary`` write natural keys instead
+        of primary keys, as the ``dumpdata`` options of the same name.
+        """
+        logger.debug("Saving %s file", output_file)
+
+        if order == "dependency":
+            records = DependencyOrder(
+                schema_registry=self.schema_registry
+            ).iter_sorted_records(records)
+
+        natural_keys = None
+        if natural_foreign or natural_primary:
+            natural_keys = NaturalKeyResolver(
+                schema_registry=self.schema_registry,
+                natural_foreign=natural_foreign,
+                natural_primary=natural_primary,
+                metrics=metrics,
+            )
+            records = natural_keys.iter_records(records)
+
+        if previous_index is None:
+            writer = FIXTURE_WRITERS[fixture_format](
+                output_file=output_file,
+                indent=indent,
+                metrics=metrics,
+                natural_keys=natural_keys,
+            )
+        else:
+            writer = IncrementalFixtureWriter(
+                output_file=output_file,
+                previous_index=previous_index,
+                indent=indent,
+                metrics=metrics,
+                fixture_format=fixture_format,
+            )
+
+        with writer:
+            writer.write_records(records)
+
+        if writer.duplicated_count:
+            logger.debug(
+                "Found duplicated records in %d records", writer.duplicated_count
+            )
+
+        logger.debug("Saved %s file with %d records", output_file, writer.written_count)
+        return writer
+
+    def build_records(self, app_model: str, records: Iterable[dict]) -> Iterator[dict]:
+        logger.debug("Building records for %s model", app_model)
         for item in records:
-            values = {}
-            for key, value in item.items():
-                if key != "pk":
-                    values[key] = value
+            yield self.build_record(app_model=app_model, item=item)
 
-            item_structure = {"model": app_model, "fields": values}
-            results.append(item_structure)
+    def build_record(self, app_model: str, item: dict) -> dict:
+        # Values fetched by the extractor never include "pk", the row itself
+        # is reused as the fields instead of being copied
+        if "pk" in item:
+            item = {key: value for key, value in item.items() if key != "pk"}
 
-        return results
+        return {"model": app_model, "fields": item}
 
-    def get_all_fields(self, app_model):
-        model = apps.get_model(app_label=app_model)
-        return sorted(
-            [ModelFieldMetaDTO.build(field=field) for field in model._meta.get_fields()]
-        )
+    def get_schema(self, app_model) -> ModelSchemaDTO:
+        return self.schema_registry.get_schema(app_model=app_model)
 
-    def get_model_fields(self, app_model) -> List[ModelFieldMetaDTO]:
-        return [
-            field
-            for field in self.get_all_fields(app_model=app_model)
-            if field.field_type == FieldType.field
-        ]
+    def get_all_fields(self, app_model) -> Tuple[ModelFieldMetaDTO, ...]:
+        return self.get_schema(app_model=app_model).all_fields
 
-    def get_model_declared_many_relations(self, app_model) -> List[ModelFieldMetaDTO]:
-        return [
-            field
-            for field in self.get_all_fields(app_model=app_model)
-            if field.is_model_declared and field.field_type == FieldType.many_to_many
-        ]
+    def get_model_fields(self, app_model) -> Tuple[ModelFieldMetaDTO, ...]:
+        return self.get_schema(app_model=app_model).fields
 
-    def get_model_declared_one_relations(self, app_model) -> List[ModelFieldMetaDTO]:
+    def get_model_field_names(self, app_model) -> List[str]:
         return [
-            field
-            for field in self.get_all_fields(app_model=app_model)
-            if field.is_model_declared
-            and field.field_type in [FieldType.one_to_one, FieldType.foreign_key]
+            field.field_name for field in self.get_model_fields(app_model=app_model)
         ]
 
-    def get_model_target_relations(self, app_model) -> List[ModelFieldMetaDTO]:
-        return [
-            field
-            for field in self.get_all_fields(app_model=app_model)
-            if not field.is_model_declared and field.field_type != FieldType.field
-        ]
+    def get_model_declared_many_relations(
+        self, app_model
+    ) -> Tuple[ModelFieldMetaDTO, ...]:
+        return self.get_schema(app_model=app_model).many_relations
+
+    def get_model_declared_one_relations(
+        self, app_model
+    ) -> Tuple[ModelFieldMetaDTO, ...]:
+        return self.get_schema(app_model=app_model).one_relations
+
+    def get_model_target_relations(self, app_model) -> Tuple[ModelFieldMetaDTO, ...]:
+        return self.get_schema(app_model=app_model).target_relations
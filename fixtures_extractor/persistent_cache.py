@@ -0,0 +1,253 @@
+import hashlib
+import json
+import logging
+import pickle
+import sqlite3
+import time
+from pathlib import Path
+from typing import Dict, List, Optional, Set, Tuple
+
+from fixtures_extractor.encoders import EnhancedDjangoJSONEncoder
+from fixtures_extractor.schema import SchemaRegistry
+from fixtures_extractor.schema import schema_registry as default_schema_registry
+from fixtures_extractor.traversal import RecordCache
+
+logger = logging.getLogger(f"extract_fixture.{__name__}")
+
+
+CREATE_TABLES = """
+CREATE TABLE IF NOT EXISTS records (
+    app_model TEXT NOT NULL,
+    pk TEXT NOT NULL,
+    fingerprint TEXT NOT NULL,
+    record BLOB NOT NULL,
+    stored_at REAL NOT NULL,
+    PRIMARY KEY (app_model, pk, fingerprint)
+);
+CREATE TABLE IF NOT EXISTS lookups (
+    app_model TEXT NOT NULL,
+    filter_key TEXT NOT NULL,
+    filter_value TEXT NOT NULL,
+    fingerprint TEXT NOT NULL,
+    pks BLOB NOT NULL,
+    stored_at REAL NOT NULL,
+    PRIMARY KEY (app_model, filter_key, filter_value, fingerprint)
+);
+"""
+
+
+def encode_key(value) -> str:
+    return json.dumps(value, cls=EnhancedDjangoJSONEncoder)
+
+
+class PersistentRecordCache(RecordCache):
+    """A record cache kept in a SQLite file across command runs
+
+    Fetched rows are stored by ``(model, pk)`` and lookup results as the pks
+    they matched, so later runs only query the database for what they miss.
+    Entries are bound to a fingerprint of the model fields and the fetched
+    columns, a schema change or a different projection never reads them.
+    Entries older than ``ttl`` seconds are ignored, and on ``close`` they
+    are evicted along with the oldest ones past ``max_entries`` per table.
+
+    The file holds pickled rows, only point it to a trusted location.
+    """
+
+    def __init__(
+        self,
+        cache_file: Path,
+        ttl: Optional[float] = None,
+        max_entries: Optional[int] = None,
+        schema_registry: Optional[SchemaRegistry] = None,
+    ):
+        super().__init__()
+        self.cache_file = cache_file
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.schema_registry = schema_registry or default_schema_registry
+        self.disk_hits = 0
+        self._fingerprints: Dict[Tuple[str, Tuple[str, ...]], str] = {}
+        self._connection: Optional[sqlite3.Connection] = None
+
+    @property
+    def connection(self) -> sqlite3.Connection:
+        # Opened on first use, so forked workers never share it
+        if self._connection is None:
+            logger.debug("Opening record cache at %s", self.cache_file)
+            self._connection = sqlite3.connect(str(self.cache_file), timeout=30)
+            self._connection.executescript(CREATE_TABLES)
+        return self._connection
+
+    def get_fingerprint(self, app_model: str, field_names: List[str]) -> str:
+        fingerprint_key = (app_model, tuple(field_names))
+        fingerprint = self._fingerprints.get(fingerprint_key)
+
+        if fingerprint is None:
+            schema = self.schema_registry.get_schema(app_model=app_model)
+            description = [app_model, ",".join(field_names)]
+            description.extend(
+                f"{field.field_name}:{field.field_type.value}:{field.app_model}:"
+                f"{field.is_model_declared}"
+                for field in schema.all_fields
+            )
+            fingerprint = hashlib.sha1("\n".join(description).encode()).hexdigest()
+            self._fingerprints[fingerprint_key] = fingerprint
+        return fingerprint
+
+    def get_min_stored_at(self) -> float:
+        if self.ttl is None:
+            return 0
+        return time.time() - self.ttl
+
+    def lookup(
+        self,
+        app_model: str,
+        filter_key: str,
+        filter_value,
+        field_names: Optional[List[str]] = None,
+    ) -> Optional[List]:
+        records = super().lookup(
+            app_model=app_model, filter_key=filter_key, filter_value=filter_value
+        )
+        if records is None and field_names is not None:
+            records = self.load(
+                app_model=app_model,
+                filter_key=filter_key,
+                filter_value=filter_value,
+                field_names=field_names,
+            )
+            if records is not None:
+                self.disk_hits += 1
+        return records
+
+    def load(
+        self, app_model: str, filter_key: str, filter_value, field_names: List[str]
+    ) -> Optional[List]:
+        fingerprint = self.get_fingerprint(app_model=app_model, field_names=field_names)
+        min_stored_at = self.get_min_stored_at()
+
+        if filter_key == "id":
+            pks = (filter_value,)
+        else:
+            row = self.connection.execute(
+                "SELECT pks FROM lookups WHERE app_model = ? AND filter_key = ? "
+                "AND filter_value = ? AND fingerprint = ? AND stored_at >= ?",
+                (
+                    app_model,
+                    filter_key,
+                    encode_key(filter_value),
+                    fingerprint,
+                    min_stored_at,
+                ),
+            ).fetchone()
+            if row is None:
+                return None
+            pks = pickle.loads(row[0])
+
+        records = []
+        for pk in pks:
+            row = self.connection.execute(
+                "SELECT record FROM records WHERE app_model = ? AND pk = ? "
+                "AND fingerprint = ? AND stored_at >= ?",
+                (app_model, encode_key(pk), fingerprint, min_stored_at),
+            ).fetchone()
+            # A lookup is only answered when all of its rows are still there
+            if row is None:
+                return None
+            records.append(pickle.loads(row[0]))
+
+        # Keep the rows in memory for the rest of the run
+        RecordCache.add_records(self, app_model=app_model, records=records)
+        if filter_key != "id":
+            self.lookups[(app_model, filter_key, filter_value)] = tuple(pks)
+        return records
+
+    def add_records(
+        self,
+        app_model: str,
+        records: List[dict],
+        field_names: Optional[List[str]] = None,
+    ):
+        super().add_records(app_model=app_model, records=records)
+        if field_names is None or not records:
+            return
+
+        fingerprint = self.get_fingerprint(app_model=app_model, field_names=field_names)
+        stored_at = time.time()
+        with self.connection:
+            self.connection.executemany(
+                "INSERT OR REPLACE INTO records VALUES (?, ?, ?, ?, ?)",
+                (
+                    (
+                        app_model,
+                        encode_key(record["id"]),
+                        fingerprint,
+                        pickle.dumps(record, protocol=pickle.HIGHEST_PROTOCOL),
+                        stored_at,
+                    )
+                    for record in records
+                ),
+            )
+
+    def add(
+        self,
+        app_model: str,
+        lookups: Dict[str, Set],
+        records: List[dict],
+        field_names: Optional[List[str]] = None,
+    ):
+        super().add(
+            app_model=app_model,
+            lookups=lookups,
+            records=records,
+            field_names=field_names,
+        )
+        if field_names is None:
+            return
+
+        # Primary key lookups are answered by the stored rows
+        fingerprint = self.get_fingerprint(app_model=app_model, field_names=field_names)
+        stored_at = time.time()
+        with self.connection:
+            self.connection.executemany(
+                "INSERT OR REPLACE INTO lookups VALUES (?, ?, ?, ?, ?, ?)",
+                (
+                    (
+                        app_model,
+                        filter_key,
+                        encode_key(filter_value),
+                        fingerprint,
+                        pickle.dumps(
+                            self.lookups[(app_model, filter_key, filter_value)],
+                            protocol=pickle.HIGHEST_PROTOCOL,
+                        ),
+                        stored_at,
+                    )
+                    for filter_key, filter_values in lookups.items()
+                    if filter_key != "id"
+                    for filter_value in filter_values
+                ),
+            )
+
+    def evict(self):
+        with self.connection:
+            for table in ("records", "lookups"):
+                if self.ttl is not None:
+                    self.connection.execute(
+                        f"DELETE FROM {table} WHERE stored_at < ?",
+                        (self.get_min_stored_at(),),
+                    )
+                if self.max_entries is not None:
+                    self.connection.execute(
+                        f"DELETE FROM {table} WHERE rowid NOT IN ("
+                        f"SELECT rowid FROM {table} ORDER BY stored_at DESC LIMIT ?)",
+                        (self.max_entries,),
+                    )
+
+    def close(self):
+        if self.ttl is not None or self.max_entries is not None:
+            self.evict()
+
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
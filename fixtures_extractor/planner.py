@@ -0,0 +1,215 @@
+import logging
+from collections import deque
+from dataclasses import replace
+from typing import Dict, List, Optional, Set, Tuple
+
+from fixtures_extractor.dtos import ExtractionEdgeDTO, ExtractionPlanDTO
+from fixtures_extractor.enums import RelationKind
+from fixtures_extractor.generic import (
+    CONTENT_TYPE_MODEL,
+    build_generic_filter_key,
+    get_content_type_id,
+)
+from fixtures_extractor.limits import TraversalLimits
+from fixtures_extractor.schema import SchemaRegistry
+from fixtures_extractor.schema import schema_registry as default_schema_registry
+
+logger = logging.getLogger(f"extract_fixture.{__name__}")
+
+
+class ExtractionPlanner:
+    """Compiles the relation graph reachable from a root model into a plan
+
+    The plan lists, in breadth-first order, every edge the traversal can
+    follow from each model, and flags the edges that belong to a cycle of
+    the model graph. Edges rejected by the traversal limits are left out.
+    Plans only depend on the models and the edge patterns, so they are
+    compiled once per root model and reused for every root record.
+    """
+
+    def __init__(self, schema_registry: Optional[SchemaRegistry] = None):
+        self.schema_registry = schema_registry or default_schema_registry
+        self._plans: Dict[Tuple, ExtractionPlanDTO] = {}
+
+    def get_plan(
+        self, root: str, limits: Optional[TraversalLimits] = None
+    ) -> ExtractionPlanDTO:
+        limits = limits or TraversalLimits()
+        plan_key = (root, limits.allowed_edges, limits.denied_edges)
+
+        plan = self._plans.get(plan_key)
+        if plan is None:
+            plan = self.compile_plan(root=root, limits=limits)
+            self._plans[plan_key] = plan
+        return plan
+
+    def compile_plan(
+        self, root: str, limits: Optional[TraversalLimits] = None
+    ) -> ExtractionPlanDTO:
+        logger.debug("Compiling extraction plan for %s model", root)
+        limits = limits or TraversalLimits()
+
+        models = [root]
+        discovered = {root}
+        edges: List[ExtractionEdgeDTO] = []
+        pending_models = deque([root])
+
+        while pending_models:
+            source = pending_models.popleft()
+
+            for edge in self.get_model_edges(app_model=source):
+                if not limits.is_edge_allowed(edge=edge):
+                    logger.debug(
+                        "Skipped %s edge from %s to %s",
+                        edge.relation_kind.value,
+                        edge.source,
+                        edge.target,
+                    )
+                    continue
+
+                edges.append(edge)
+                if edge.target not in discovered:
+                    discovered.add(edge.target)
+                    models.append(edge.target)
+                    pending_models.append(edge.target)
+
+        components = self.get_strongly_connected_components(models=models, edges=edges)
+        edges = [
+            replace(edge, is_cycle=components[edge.source] == components[edge.target])
+            for edge in edges
+        ]
+
+        plan = ExtractionPlanDTO.build(
+            root=root, models=tuple(models), edges=tuple(edges)
+        )
+        logger.debug(
+            "Compiled plan for %s with %d models, %d edges and %d cyclic edges",
+            root,
+            len(plan.models),
+            len(plan.edges),
+            len(plan.cyclic_edges),
+        )
+        return plan
+
+    def get_model_edges(self, app_model: str) -> List[ExtractionEdgeDTO]:
+        schema = self.schema_registry.get_schema(app_model=app_model)
+
+        edges = [
+            ExtractionEdgeDTO(
+                source=app_model,
+                target=field.app_model,
+                source_field=field.field_name,
+                filter_key="id",
+                relation_kind=RelationKind.one,
+            )
+            for field in schema.one_relations
+        ]
+        edges.extend(
+            ExtractionEdgeDTO(
+                source=app_model,
+                target=field.app_model,
+                source_field=field.field_name,
+                filter_key="id",
+                relation_kind=RelationKind.many,
+            )
+            for field in schema.many_relations
+        )
+        edges.extend(
+            ExtractionEdgeDTO(
+                source=app_model,
+                target=field.through_app_model,
+                source_field="id",
+                filter_key=field.through_field_name,
+                relation_kind=RelationKind.through,
+            )
+            for field in schema.through_relations
+        )
+        edges.extend(
+            ExtractionEdgeDTO(
+                source=app_model,
+                target=field.app_model,
+                source_field="id",
+                filter_key=build_generic_filter_key(
+                    object_id_field_name=field.object_id_field_name,
+                    content_type_field_name=field.content_type_field_name,
+                    content_type_id=get_content_type_id(app_model=app_model),
+                ),
+                relation_kind=RelationKind.generic,
+            )
+            for field in schema.generic_relations
+        )
+        # Content types are shared by every row of their model, following
+        # their reverse relations would fetch every row pointing to them, as
+        # the permissions or the generic keys of every object of the type
+        if app_model == CONTENT_TYPE_MODEL:
+            return edges
+
+        # The foreign keys of through models are already followed as above
+        through_lookups = {
+            (field.through_app_model, field.through_field_name)
+            for field in schema.through_relations
+        }
+        edges.extend(
+            ExtractionEdgeDTO(
+                source=app_model,
+                target=field.app_model,
+                source_field="id",
+                filter_key=field.field_name,
+                relation_kind=RelationKind.reverse,
+            )
+            for field in schema.target_relations
+            if (field.app_model, field.field_name) not in through_lookups
+        )
+        return edges
+
+    @classmethod
+    def get_strongly_connected_components(
+        cls, models: List[str], edges: List[ExtractionEdgeDTO]
+    ) -> Dict[str, int]:
+        """Map every model to its strongly connected component, Kosaraju style"""
+        successors: Dict[str, Set[str]] = {model: set() for model in models}
+        predecessors: Dict[str, Set[str]] = {model: set() for model in models}
+        for edge in edges:
+            successors[edge.source].add(edge.target)
+            predecessors[edge.target].add(edge.source)
+
+        finish_order = []
+        visited: Set[str] = set()
+        for model in models:
+            if model in visited:
+                continue
+            visited.add(model)
+            stack = [(model, iter(successors[model]))]
+            while stack:
+                current, pending = stack[-1]
+                for successor in pending:
+                    if successor not in visited:
+                        visited.add(successor)
+                        stack.append((successor, iter(successors[successor])))
+                        break
+                else:
+                    finish_order.append(current)
+                    stack.pop()
+
+        components: Dict[str, int] = {}
+        component = 0
+        for model in reversed(finish_order):
+            if model in components:
+                continue
+            component += 1
+            components[model] = component
+            stack = [model]
+            while stack:
+                current = stack.pop()
+                for predecessor in predecessors[current]:
+                    if predecessor not in components:
+                        components[predecessor] = component
+                        stack.append(predecessor)
+
+        return components
+
+    def invalidate(self):
+        self._plans.clear()
+
+
+extraction_planner = ExtractionPlanner()
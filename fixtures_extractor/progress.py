@@ -0,0 +1,48 @@
+import logging
+from time import perf_counter
+
+# Items between two progress lines
+PROGRESS_REPORT_EVERY = 10000
+
+
+class ProgressReporter:
+    """Logs the ``unit`` items extracted so far, once every ``every`` items
+
+    Adding rows only costs an integer comparison, so it stays cheap on huge
+    traversals, where a log line per fetch would flood the output.
+    """
+
+    def __init__(
+        self,
+        logger: logging.Logger,
+        every: int = PROGRESS_REPORT_EVERY,
+        level: int = logging.INFO,
+        unit: str = "rows",
+    ):
+        self.logger = logger
+        self.every = every
+        self.unit = unit
+        self.level = level
+        self.count = 0
+        self.next_report = every
+        self.started_at = perf_counter()
+
+    def add(self, count: int):
+        self.count += count
+        if self.count >= self.next_report:
+            self.next_report = (self.count // self.every + 1) * self.every
+            self.report()
+
+    def report(self):
+        if not self.logger.isEnabledFor(self.level):
+            return
+
+        elapsed = perf_counter() - self.started_at
+        self.logger.log(
+            self.level,
+            "Extracted %d %s in %.1fs, %.0f per second",
+            self.count,
+            self.unit,
+            elapsed,
+            self.count / elapsed if elapsed else 0,
+        )
@@ -0,0 +1,69 @@
+from collections import defaultdict
+from typing import Dict, Iterable, List, Optional, Set
+
+
+class FieldProjection:
+    """Selects which plain columns are fetched for every model
+
+    ``include`` and ``exclude`` map a model, as ``app.model``, to the names of
+    its plain fields. The primary key is always fetched and relation columns
+    are never projected away, since the traversal needs them. With
+    ``keys_only`` the traversal fetches primary keys and relations only and
+    the projected columns are loaded in a final pass, just for the rows that
+    end up in the fixture.
+    """
+
+    def __init__(
+        self,
+        include: Optional[Dict[str, Set[str]]] = None,
+        exclude: Optional[Dict[str, Set[str]]] = None,
+        keys_only: bool = False,
+    ):
+        self.include = include or {}
+        self.exclude = exclude or {}
+        self.keys_only = keys_only
+
+    @staticmethod
+    def build(
+        include: Optional[Iterable[str]] = None,
+        exclude: Optional[Iterable[str]] = None,
+        keys_only: bool = False,
+    ):
+        """Build a projection from ``app.model.field`` formatted names"""
+        return FieldProjection(
+            include=FieldProjection._group_by_model(field_paths=include or []),
+            exclude=FieldProjection._group_by_model(field_paths=exclude or []),
+            keys_only=keys_only,
+        )
+
+    @classmethod
+    def _group_by_model(cls, field_paths: Iterable[str]) -> Dict[str, Set[str]]:
+        grouped_fields = defaultdict(set)
+        for field_path in field_paths:
+            app_model, separator, field_name = field_path.rpartition(".")
+            if not separator or "." not in app_model:
+                raise ValueError(
+                    f"Invalid field {field_path}, expected app.model.field format"
+                )
+            # Model labels are case insensitive, field names are not
+            grouped_fields[app_model.lower()].add(field_name)
+        return dict(grouped_fields)
+
+    def select_fields(self, app_model: str, field_names: List[str]) -> List[str]:
+        included_fields = self.include.get(app_model)
+        excluded_fields = self.exclude.get(app_model, set())
+
+        return [
+            field_name
+            for field_name in field_names
+            if field_name == "id"
+            or (
+                (included_fields is None or field_name in included_fields)
+                and field_name not in excluded_fields
+            )
+        ]
+
+    def traversal_fields(self, app_model: str, field_names: List[str]) -> List[str]:
+        if self.keys_only:
+            return ["id"]
+        return self.select_fields(app_model=app_model, field_names=field_names)
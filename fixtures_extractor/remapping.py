@@ -0,0 +1,252 @@
+import logging
+from array import array
+from bisect import bisect_left
+from typing import Dict, Iterable, Iterator, Optional, Set, Tuple, Union
+
+from django.apps import apps
+from django.db import DEFAULT_DB_ALIAS
+from django.db.models import Max
+
+from fixtures_extractor.enums import FieldType
+from fixtures_extractor.generic import CONTENT_TYPE_MODEL, get_content_type_ids
+from fixtures_extractor.schema import SchemaRegistry
+from fixtures_extractor.schema import schema_registry as default_schema_registry
+
+logger = logging.getLogger(f"extract_fixture.{__name__}")
+
+
+class PrimaryKeyMap:
+    """Maps the primary keys of a model in a fixture set to new ones
+
+    Old primary keys are kept in a sorted ``array`` of 64 bit integers,
+    8 bytes per row, a fraction of what a dict of ints takes, and the new
+    primary key of each one is ``first_id`` plus its position, found by bisection.
+    Primary keys are added while the fixtures are indexed, then ``freeze``
+    sorts them once.
+    """
+
+    def __init__(self):
+        self.old_pks = array("q")
+        self.first_id = 1
+
+    def __len__(self) -> int:
+        return len(self.old_pks)
+
+    def add(self, pk: int):
+        self.old_pks.append(pk)
+
+    def freeze(self, first_id: int):
+        unique_pks = array("q")
+        for pk in sorted(self.old_pks):
+            if not unique_pks or unique_pks[-1] != pk:
+                unique_pks.append(pk)
+
+        self.old_pks = unique_pks
+        self.first_id = first_id
+
+    def get(self, pk: int) -> Optional[int]:
+        position = bisect_left(self.old_pks, pk)
+        if position < len(self.old_pks) and self.old_pks[position] == pk:
+            return self.first_id + position
+        return None
+
+
+class FixtureRemapper:
+    """Rewrites the primary keys of a fixture set and every reference to them
+
+    Fixtures are read twice: ``index`` collects the primary keys of every
+    model, ``remap`` then rewrites each record on its own, so records can be
+    streamed from and to disk. New primary keys of a model start after the
+    highest one found in the ``using`` database, so the records never collide
+    with the rows it already holds. Content types are never given new primary
+    keys: the content type rows of the fixture set are matched by app label
+    and model to the ones of the ``using`` database, references to them are
+    rewritten to those ids and the rows themselves are dropped. Only content
+    types the database lacks are kept, and remapped as any other row. Object
+    ids of generic foreign keys are remapped when their content type is a
+    natural key or a content type row of the fixture set. References to rows
+    outside of the fixture set, natural keys and models whose primary keys
+    are not integers are left untouched.
+    """
+
+    def __init__(
+        self,
+        schema_registry: Optional[SchemaRegistry] = None,
+        using: str = DEFAULT_DB_ALIAS,
+    ):
+        self.schema_registry = schema_registry or default_schema_registry
+        self.using = using
+        self.pk_maps: Dict[str, PrimaryKeyMap] = {}
+        self.skipped_models: Set[str] = set()
+        # Content type ids of the fixture set, mapped to their natural key
+        self.content_types: Dict[int, Tuple[str, str]] = {}
+        # and to their id in the using database, once frozen
+        self.content_type_ids: Dict[int, int] = {}
+        self.existing_content_type_ids: Set[int] = set()
+        self.remapped_count = 0
+        self.dropped_count = 0
+        self.unmapped_count = 0
+
+    def index(self, records: Iterable[dict]):
+        for record in records:
+            app_model = record["model"]
+            if app_model == CONTENT_TYPE_MODEL:
+                self.add_content_type(record=record)
+                continue
+            if app_model in self.skipped_models:
+                continue
+
+            pk = record["fields"].get("id")
+            if pk is None:
+                continue
+            if not self._is_integer(pk):
+                logger.warning(
+                    "%s primary keys are not integers, they are not remapped",
+                    app_model,
+                )
+                self.skipped_models.add(app_model)
+                self.pk_maps.pop(app_model, None)
+                continue
+
+            pk_map = self.pk_maps.get(app_model)
+            if pk_map is None:
+                pk_map = self.pk_maps[app_model] = PrimaryKeyMap()
+            pk_map.add(pk)
+
+    def add_content_type(self, record: dict):
+        fields = record["fields"]
+        if self._is_integer(fields.get("id")):
+            self.content_types[fields["id"]] = (fields["app_label"], fields["model"])
+
+    def freeze(self):
+        missing_content_type_ids = self.resolve_content_types()
+
+        for app_model, pk_map in self.pk_maps.items():
+            pk_map.freeze(first_id=self.get_first_id(app_model=app_model))
+            logger.debug("%s primary keys remapped from %d", app_model, pk_map.first_id)
+
+        for content_type_id in missing_content_type_ids:
+            self.content_type_ids[content_type_id] = self.pk_maps[
+                CONTENT_TYPE_MODEL
+            ].get(content_type_id)
+
+    def resolve_content_types(self) -> Set[int]:
+        """Match the content types of the fixture set to the database ones
+
+        Returns the ids of the content types missing from the database, they
+        are remapped as any other row.
+        """
+        target_ids = get_content_type_ids(
+            natural_keys=self.content_types.values(), using=self.using
+        )
+
+        missing_content_type_ids = set()
+        for content_type_id, natural_key in self.content_types.items():
+            target_id = target_ids.get(natural_key)
+            if target_id is None:
+                logger.warning(
+                    "Content type %s.%s is missing from the database, it is remapped",
+                    *natural_key,
+                )
+                missing_content_type_ids.add(content_type_id)
+                pk_map = self.pk_maps.get(CONTENT_TYPE_MODEL)
+                if pk_map is None:
+                    pk_map = self.pk_maps[CONTENT_TYPE_MODEL] = PrimaryKeyMap()
+                pk_map.add(content_type_id)
+            else:
+                self.content_type_ids[content_type_id] = target_id
+                self.existing_content_type_ids.add(content_type_id)
+
+        return missing_content_type_ids
+
+    def get_first_id(self, app_model: str) -> int:
+        model = apps.get_model(app_model)
+        max_pk = model._default_manager.using(self.using).aggregate(max_pk=Max("pk"))[
+            "max_pk"
+        ]
+        return (max_pk or 0) + 1
+
+    def iter_records(self, records: Iterable[dict]) -> Iterator[dict]:
+        for record in records:
+            record = self.remap(record=record)
+            if record is not None:
+                yield record
+
+    def remap(self, record: dict) -> Optional[dict]:
+        """The remapped record, ``None`` when the database already holds it"""
+        app_model = record["model"]
+        fields = dict(record["fields"])
+
+        if (
+            app_model == CONTENT_TYPE_MODEL
+            and fields.get("id") in self.existing_content_type_ids
+        ):
+            self.dropped_count += 1
+            return None
+
+        pk_map = self.pk_maps.get(app_model)
+        if pk_map is not None and fields.get("id") is not None:
+            fields["id"] = pk_map.get(fields["id"])
+            self.remapped_count += 1
+
+        schema = self.schema_registry.get_schema(app_model=app_model)
+        for field in schema.one_relations + schema.many_relations:
+            value = fields.get(field.field_name)
+            pk_map = self.get_pk_map(app_model=field.app_model)
+            if value is None or pk_map is None:
+                continue
+
+            if field.field_type == FieldType.many_to_many:
+                fields[field.field_name] = [
+                    self._remap_reference(pk_map=pk_map, pk=pk) for pk in value
+                ]
+            else:
+                fields[field.field_name] = self._remap_reference(
+                    pk_map=pk_map, pk=value
+                )
+
+        for field in schema.generic_foreign_keys:
+            # The content type as written, before its own remapping
+            pk_map = self.get_generic_pk_map(
+                content_type=record["fields"].get(field.content_type_field_name)
+            )
+            object_id = fields.get(field.object_id_field_name)
+            if pk_map is not None and object_id is not None:
+                fields[field.object_id_field_name] = self._remap_reference(
+                    pk_map=pk_map, pk=object_id
+                )
+
+        return {"model": app_model, "fields": fields}
+
+    def get_pk_map(
+        self, app_model: str
+    ) -> Optional[Union[PrimaryKeyMap, Dict[int, int]]]:
+        # References to content types point to the ids of the database
+        if app_model == CONTENT_TYPE_MODEL:
+            return self.content_type_ids or None
+        return self.pk_maps.get(app_model)
+
+    def get_generic_pk_map(self, content_type) -> Optional[PrimaryKeyMap]:
+        # Content types written with --natural-foreign are [app_label, model]
+        if isinstance(content_type, list):
+            return self.pk_maps.get(".".join(content_type))
+
+        natural_key = self.content_types.get(content_type)
+        if natural_key is None:
+            return None
+        return self.pk_maps.get(".".join(natural_key))
+
+    def _remap_reference(self, pk_map: Union[PrimaryKeyMap, Dict[int, int]], pk):
+        # Natural keys are lists, they are already portable
+        if not self._is_integer(pk):
+            return pk
+
+        new_pk = pk_map.get(pk)
+        if new_pk is None:
+            self.unmapped_count += 1
+            return pk
+        return new_pk
+
+    @classmethod
+    def _is_integer(cls, value) -> bool:
+        return isinstance(value, int) and not isinstance(value, bool)
@@ -0,0 +1,48 @@
+import logging
+from typing import Dict, Optional
+
+from django.apps import apps
+
+from fixtures_extractor.dtos import ModelFieldMetaDTO, ModelSchemaDTO
+
+logger = logging.getLogger(f"extract_fixture.{__name__}")
+
+
+class SchemaRegistry:
+    """Classifies the fields of every model once per process.
+
+    Model metadata does not change after the app registry is ready, so the
+    field buckets are built the first time a model is requested and reused
+    afterwards. Call ``invalidate`` when models are altered at runtime, as
+    some tests do.
+    """
+
+    def __init__(self):
+        self._schemas: Dict[str, ModelSchemaDTO] = {}
+
+    def get_schema(self, app_model: str) -> ModelSchemaDTO:
+        schema = self._schemas.get(app_model)
+        if schema is None:
+            schema = self.build_schema(app_model=app_model)
+            self._schemas[app_model] = schema
+        return schema
+
+    def build_schema(self, app_model: str) -> ModelSchemaDTO:
+        logger.debug("Building schema for %s model", app_model)
+        model = apps.get_model(app_label=app_model)
+        all_fields = tuple(
+            sorted(
+                ModelFieldMetaDTO.build(field=field)
+                for field in model._meta.get_fields()
+            )
+        )
+        return ModelSchemaDTO.build(app_model=app_model, all_fields=all_fields)
+
+    def invalidate(self, app_model: Optional[str] = None):
+        if app_model is None:
+            self._schemas.clear()
+        else:
+            self._schemas.pop(app_model, None)
+
+
+schema_registry = SchemaRegistry()
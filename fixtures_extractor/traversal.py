@@ -0,0 +1,746 @@
+import logging
+from collections import defaultdict
+from typing import Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+from django.apps import apps
+from django.core.exceptions import ValidationError
+from django.db.models import Field
+
+from fixtures_extractor.dtos import ExtractionEdgeDTO, ExtractionPlanDTO
+from fixtures_extractor.enums import RelationKind
+from fixtures_extractor.generic import get_content_type_model, parse_filter_key
+from fixtures_extractor.incremental import PreviousFixtureIndex, encode_value
+from fixtures_extractor.limits import TraversalLimits
+from fixtures_extractor.metrics import ExtractionMetrics
+from fixtures_extractor.orm_extractor import ORMExtractor
+from fixtures_extractor.planner import ExtractionPlanner, extraction_planner
+from fixtures_extractor.progress import ProgressReporter
+from fixtures_extractor.projection import FieldProjection
+
+logger = logging.getLogger(f"extract_fixture.{__name__}")
+
+
+Frontier = Dict[str, Dict[str, Set]]
+
+HYDRATION_BATCH_SIZE = 1000
+
+
+def new_frontier() -> Frontier:
+    return defaultdict(lambda: defaultdict(set))
+
+
+class TraversalState:
+    """Bookkeeping of a single extraction
+
+    ``history`` holds every ``(model, filter_key, filter_value)`` lookup
+    already scheduled and ``visited`` every ``(model, pk)`` row already
+    fetched, so each row is fetched and expanded at most once no matter how
+    many paths lead to it. ``relation_rows`` counts the rows fetched through
+    every reverse relation, as ``(model, filter_key)``.
+    """
+
+    def __init__(self):
+        self.frontier: Frontier = new_frontier()
+        self.history: Set[Tuple[str, str, object]] = set()
+        self.visited: Set[Tuple[str, object]] = set()
+        self.relation_rows: Dict[Tuple[str, str], int] = defaultdict(int)
+
+    def next_frontier(self) -> Frontier:
+        current_frontier, self.frontier = self.frontier, new_frontier()
+        return current_frontier
+
+
+class RecordCache:
+    """Rows fetched during a command run, shared by all of its roots
+
+    Rows are indexed by ``(model, pk)`` and the outcome of every lookup is
+    kept as the tuple of pks it matched, so a lookup already resolved for a
+    previous root is answered without touching the database. Column values
+    and lookup values are compared once converted by the filtered field, as
+    the database does, since generic object ids may be stored as text.
+    """
+
+    def __init__(self):
+        self.records: Dict[Tuple[str, object], dict] = {}
+        self.lookups: Dict[Tuple[str, str, object], Tuple] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def get(
+        self,
+        app_model: str,
+        filter_key: str,
+        filter_value,
+        field_names: Optional[List[str]] = None,
+    ) -> Optional[List]:
+        """The cached records matching the lookup, ``None`` when unknown
+
+        ``field_names`` are the columns fetched for the model, they only
+        matter to caches kept across runs with different projections.
+        """
+        records = self.lookup(
+            app_model=app_model,
+            filter_key=filter_key,
+            filter_value=filter_value,
+            field_names=field_names,
+        )
+        if records is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return records
+
+    def lookup(
+        self,
+        app_model: str,
+        filter_key: str,
+        filter_value,
+        field_names: Optional[List[str]] = None,
+    ) -> Optional[List]:
+        if filter_key == "id":
+            record = self.records.get((app_model, filter_value))
+            if record is not None:
+                return [record]
+
+        pks = self.lookups.get((app_model, filter_key, filter_value))
+        if pks is None:
+            return None
+        return [self.records[(app_model, pk)] for pk in pks]
+
+    def add_records(
+        self,
+        app_model: str,
+        records: List[dict],
+        field_names: Optional[List[str]] = None,
+    ):
+        for record in records:
+            self.records[(app_model, record["id"])] = record
+
+    def add(
+        self,
+        app_model: str,
+        lookups: Dict[str, Set],
+        records: List[dict],
+        field_names: Optional[List[str]] = None,
+    ):
+        """Store the complete result of the ``lookups``"""
+        self.add_records(app_model=app_model, records=records, field_names=field_names)
+
+        model_meta = apps.get_model(app_model)._meta
+        for filter_key, filter_values in lookups.items():
+            field_name, conditions = parse_filter_key(filter_key=filter_key)
+            field = model_meta.get_field(field_name)
+            normalized_values = {
+                self.normalize_value(field=field, value=filter_value): filter_value
+                for filter_value in filter_values
+            }
+            matched_pks = defaultdict(list)
+            for record in records:
+                if any(
+                    record[condition_field_name] != condition_value
+                    for condition_field_name, condition_value in conditions.items()
+                ):
+                    continue
+
+                related_values = record[field_name]
+                if not isinstance(related_values, list):
+                    related_values = [related_values]
+
+                for related_value in related_values:
+                    filter_value = normalized_values.get(
+                        self.normalize_value(field=field, value=related_value)
+                    )
+                    if filter_value is not None:
+                        matched_pks[filter_value].append(record["id"])
+
+            for filter_value in filter_values:
+                self.lookups[(app_model, filter_key, filter_value)] = tuple(
+                    matched_pks.get(filter_value, ())
+                )
+
+    @classmethod
+    def normalize_value(cls, field: Field, value):
+        try:
+            return field.to_python(value)
+        except ValidationError:
+            return value
+
+
+class GraphTraversal:
+    """Breadth-first walk over the relations of a set of root records.
+
+    The traversal keeps a frontier of pending lookups per model. Every wave
+    fetches the whole frontier of a model with a single query, builds the
+    records found and pushes the lookups of the edges planned for their
+    model into the next frontier, until no new lookup is discovered.
+
+    With ``chunk_size`` each query is read in chunks of that many rows, so
+    only a chunk of fetched rows is held at once while records flow lazily
+    to the caller. ``limits`` bound the depth, the followed edges and the
+    rows fetched through each reverse relation. Past ``max_depth`` only the
+    edges that do not fan out are followed, so the extracted rows keep every
+    row they point to.
+
+    A keys only walk also fetches the ``timestamp_field`` of the models that
+    have it, so rows whose timestamp did not change since a previous fixture
+    are hydrated from that fixture instead of the database.
+    """
+
+    def __init__(
+        self,
+        orm_extractor: ORMExtractor,
+        record_cache: Optional[RecordCache] = None,
+        projection: Optional[FieldProjection] = None,
+        chunk_size: Optional[int] = None,
+        planner: Optional[ExtractionPlanner] = None,
+        limits: Optional[TraversalLimits] = None,
+        timestamp_field: Optional[str] = None,
+        metrics: Optional[ExtractionMetrics] = None,
+    ):
+        self.orm_extractor = orm_extractor
+        self.planner = planner or extraction_planner
+        self.record_cache = record_cache
+        self.projection = projection or FieldProjection()
+        self.chunk_size = chunk_size
+        self.limits = limits or TraversalLimits()
+        self.timestamp_field = timestamp_field
+        self.metrics = metrics
+        self.reused_count = 0
+
+    def extract(
+        self,
+        app_model: str,
+        filter_key: str,
+        filter_values: Iterable,
+        previous_index: Optional[PreviousFixtureIndex] = None,
+    ):
+        return list(
+            self.iter_records(
+                app_model=app_model,
+                filter_key=filter_key,
+                filter_values=filter_values,
+                previous_index=previous_index,
+            )
+        )
+
+    def iter_records(
+        self,
+        app_model: str,
+        filter_key: str,
+        filter_values: Iterable,
+        previous_index: Optional[PreviousFixtureIndex] = None,
+    ) -> Iterator[dict]:
+        """Lazily yield the extracted records as they are fetched"""
+        keys_only_records: List[Tuple[str, List[dict]]] = []
+        plan = self.planner.get_plan(root=app_model, limits=self.limits)
+        max_depth = self.limits.max_depth
+        state = TraversalState()
+        progress = ProgressReporter(logger=logger)
+
+        for filter_value in filter_values:
+            self.push(
+                state=state,
+                app_model=app_model,
+                filter_key=filter_key,
+                filter_value=filter_value,
+            )
+
+        wave = 0
+        while state.frontier:
+            logger.info("Processing wave %d over %d models", wave, len(state.frontier))
+
+            for full_model_name, lookups in state.next_frontier().items():
+                for base_model_records in self.fetch(
+                    state=state,
+                    full_model_name=full_model_name,
+                    lookups=lookups,
+                    plan=plan,
+                ):
+                    if len(base_model_records) == 0:
+                        logger.debug("No new records found for %s", full_model_name)
+                        continue
+
+                    progress.add(len(base_model_records))
+
+                    self.expand(
+                        state=state,
+                        plan=plan,
+                        full_model_name=full_model_name,
+                        records=base_model_records,
+                        fan_out=max_depth is None or wave < max_depth,
+                    )
+
+                    if self.projection.keys_only:
+                        keys_only_records.append((full_model_name, base_model_records))
+                    else:
+                        yield from self.orm_extractor.build_records(
+                            app_model=full_model_name, records=base_model_records
+                        )
+
+            wave += 1
+
+        progress.report()
+        if max_depth is not None and wave > max_depth:
+            logger.info("Stopped fanning out relations at depth %d", max_depth)
+
+        if self.projection.keys_only:
+            yield from self.hydrate(
+                keys_only_records=keys_only_records, previous_index=previous_index
+            )
+
+    def hydrate(
+        self,
+        keys_only_records: List[Tuple[str, List[dict]]],
+        previous_index: Optional[PreviousFixtureIndex] = None,
+    ) -> Iterator[dict]:
+        """Load the projected columns of the rows found by a keys only walk"""
+        for full_model_name, records in keys_only_records:
+            field_names = self.projection.select_fields(
+                app_model=full_model_name,
+                field_names=self.orm_extractor.get_model_field_names(
+                    app_model=full_model_name
+                ),
+            )
+            logger.info("Hydrating %d %s records", len(records), full_model_name)
+
+            for index in range(0, len(records), HYDRATION_BATCH_SIZE):
+                # Consumers of the hydrated records may have changed the step
+                if self.metrics is not None:
+                    self.metrics.set_step(app_model=full_model_name, relation="hydrate")
+
+                batch_records = records[index : index + HYDRATION_BATCH_SIZE]
+                field_values = {}
+                if previous_index is not None:
+                    field_values = self.get_unchanged_field_values(
+                        previous_index=previous_index,
+                        full_model_name=full_model_name,
+                        records=batch_records,
+                        field_names=field_names,
+                    )
+
+                missing_pks = [
+                    record["id"]
+                    for record in batch_records
+                    if record["id"] not in field_values
+                ]
+                fetched_field_values = {}
+                if missing_pks:
+                    fetched_field_values = self.orm_extractor.get_field_values(
+                        app_model=full_model_name,
+                        pks=missing_pks,
+                        field_names=field_names,
+                    )
+
+                if self.metrics is not None:
+                    self.metrics.add_rows(
+                        rows=len(fetched_field_values), cached_rows=len(field_values)
+                    )
+                field_values.update(fetched_field_values)
+
+                # Rows deleted since the keys only walk are left out
+                hydrated_records = (
+                    {**field_values[record["id"]], **record}
+                    for record in batch_records
+                    if record["id"] in field_values
+                )
+                yield from self.orm_extractor.build_records(
+                    app_model=full_model_name, records=hydrated_records
+                )
+
+    def get_unchanged_field_values(
+        self,
+        previous_index: PreviousFixtureIndex,
+        full_model_name: str,
+        records: List[dict],
+        field_names: List[str],
+    ) -> Dict[object, dict]:
+        """Field values of the rows whose timestamp matches the previous fixture"""
+        timestamp_field = self.timestamp_field
+        if timestamp_field is None or timestamp_field not in field_names:
+            return {}
+
+        field_values = {}
+        for record in records:
+            previous_record = previous_index.get(
+                app_model=full_model_name, pk=record["id"]
+            )
+            if previous_record is None:
+                continue
+
+            previous_fields = previous_record["fields"]
+            if (
+                timestamp_field in previous_fields
+                and previous_fields[timestamp_field]
+                == encode_value(record[timestamp_field])
+                and all(field_name in previous_fields for field_name in field_names)
+            ):
+                field_values[record["id"]] = {
+                    field_name: previous_fields[field_name]
+                    for field_name in field_names
+                }
+
+        if field_values:
+            self.reused_count += len(field_values)
+            logger.debug(
+                "Reused %d unchanged %s records from the previous fixture",
+                len(field_values),
+                full_model_name,
+            )
+        return field_values
+
+    def get_traversal_fields(self, full_model_name: str) -> List[str]:
+        model_field_names = self.orm_extractor.get_model_field_names(
+            app_model=full_model_name
+        )
+        field_names = self.projection.traversal_fields(
+            app_model=full_model_name, field_names=model_field_names
+        )
+
+        # Only projected timestamps are fetched, they end up in the fixture
+        timestamp_field = self.timestamp_field
+        if (
+            self.projection.keys_only
+            and timestamp_field is not None
+            and timestamp_field
+            in self.projection.select_fields(
+                app_model=full_model_name, field_names=model_field_names
+            )
+        ):
+            field_names.append(timestamp_field)
+
+        # Generic foreign keys are followed from their object id columns
+        for field in self.orm_extractor.get_schema(
+            app_model=full_model_name
+        ).generic_foreign_keys:
+            if field.object_id_field_name not in field_names:
+                field_names.append(field.object_id_field_name)
+        return field_names
+
+    def fetch(
+        self,
+        state: TraversalState,
+        full_model_name: str,
+        lookups: Dict[str, Set],
+        plan: Optional[ExtractionPlanDTO] = None,
+    ) -> Iterator[List[dict]]:
+        """Yield the records matching ``lookups`` that were not visited yet
+
+        Through model rows hold many to many relations, so the lookups of the
+        ``plan`` fetching them are never capped.
+        """
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(
+                "Fetching %s with %s",
+                full_model_name,
+                ", ".join(
+                    f"{key} in {len(values)} values" for key, values in lookups.items()
+                ),
+            )
+
+        field_names = self.get_traversal_fields(full_model_name=full_model_name)
+        relation = "|".join(sorted(lookups))
+        if self.metrics is not None:
+            self.metrics.set_step(app_model=full_model_name, relation=relation)
+
+        capped_lookups = {}
+        if self.limits.max_rows_per_relation is not None:
+            uncapped_keys = {"id"}
+            if plan is not None:
+                uncapped_keys.update(
+                    filter_key
+                    for app_model, filter_key in plan.through_lookups
+                    if app_model == full_model_name
+                )
+            capped_lookups = {
+                filter_key: filter_values
+                for filter_key, filter_values in lookups.items()
+                if filter_key not in uncapped_keys
+            }
+            lookups = {
+                filter_key: filter_values
+                for filter_key, filter_values in lookups.items()
+                if filter_key in uncapped_keys
+            }
+
+        missing_lookups = lookups
+        if self.record_cache is not None:
+            cached_records = []
+            missing_lookups = defaultdict(set)
+            for filter_key, filter_values in lookups.items():
+                for filter_value in filter_values:
+                    lookup_records = self.record_cache.get(
+                        app_model=full_model_name,
+                        filter_key=filter_key,
+                        filter_value=filter_value,
+                        field_names=field_names,
+                    )
+                    if lookup_records is None:
+                        missing_lookups[filter_key].add(filter_value)
+                    else:
+                        cached_records.extend(lookup_records)
+
+            if cached_records:
+                if self.metrics is not None:
+                    self.metrics.add_rows(rows=0, cached_rows=len(cached_records))
+                yield self.filter_visited(
+                    state=state, full_model_name=full_model_name, records=cached_records
+                )
+
+        if missing_lookups:
+            yield from self.fetch_lookups(
+                state=state,
+                full_model_name=full_model_name,
+                lookups=missing_lookups,
+                field_names=field_names,
+                relation=relation,
+            )
+
+        for filter_key, filter_values in capped_lookups.items():
+            yield from self.fetch_capped_lookup(
+                state=state,
+                full_model_name=full_model_name,
+                filter_key=filter_key,
+                filter_values=filter_values,
+                field_names=field_names,
+            )
+
+    def fetch_lookups(
+        self,
+        state: TraversalState,
+        full_model_name: str,
+        lookups: Dict[str, Set],
+        field_names: List[str],
+        relation: str,
+    ) -> Iterator[List[dict]]:
+        # Consumers of the cached records may have changed the step
+        if self.metrics is not None:
+            self.metrics.set_step(app_model=full_model_name, relation=relation)
+
+        if self.chunk_size:
+            for fetched_records in self.orm_extractor.iter_batch_records(
+                app_model=full_model_name,
+                lookups=lookups,
+                chunk_size=self.chunk_size,
+                field_names=field_names,
+            ):
+                if self.metrics is not None:
+                    self.metrics.add_rows(rows=len(fetched_records))
+                # A chunk holds part of the lookup results, only rows are cached
+                if self.record_cache is not None:
+                    self.record_cache.add_records(
+                        app_model=full_model_name,
+                        records=fetched_records,
+                        field_names=field_names,
+                    )
+                yield self.filter_visited(
+                    state=state,
+                    full_model_name=full_model_name,
+                    records=fetched_records,
+                )
+                # The next chunk is queried once the consumers are done
+                if self.metrics is not None:
+                    self.metrics.set_step(app_model=full_model_name, relation=relation)
+        else:
+            fetched_records = self.orm_extractor.get_batch_records(
+                app_model=full_model_name,
+                lookups=lookups,
+                field_names=field_names,
+            )
+            if self.metrics is not None:
+                self.metrics.add_rows(rows=len(fetched_records))
+            if self.record_cache is not None:
+                self.record_cache.add(
+                    app_model=full_model_name,
+                    lookups=lookups,
+                    records=fetched_records,
+                    field_names=field_names,
+                )
+            yield self.filter_visited(
+                state=state, full_model_name=full_model_name, records=fetched_records
+            )
+
+    def fetch_capped_lookup(
+        self,
+        state: TraversalState,
+        full_model_name: str,
+        filter_key: str,
+        filter_values: Set,
+        field_names: List[str],
+    ) -> Iterator[List[dict]]:
+        """Fetch a reverse relation without going over the rows limit"""
+        relation = (full_model_name, filter_key)
+        max_rows = self.limits.max_rows_per_relation
+        remaining_rows = max_rows - state.relation_rows[relation]
+
+        if remaining_rows <= 0:
+            logger.debug(
+                "Skipped %s with %s in %d values, reached %d rows",
+                full_model_name,
+                filter_key,
+                len(filter_values),
+                max_rows,
+            )
+            return
+
+        if self.metrics is not None:
+            self.metrics.set_step(app_model=full_model_name, relation=filter_key)
+
+        fetched_records = self.orm_extractor.get_batch_records(
+            app_model=full_model_name,
+            lookups={filter_key: filter_values},
+            field_names=field_names,
+            limit=remaining_rows,
+        )
+        state.relation_rows[relation] += len(fetched_records)
+        if self.metrics is not None:
+            self.metrics.add_rows(rows=len(fetched_records))
+
+        if len(fetched_records) == remaining_rows:
+            logger.warning(
+                "Reached the limit of %d rows for %s records related by %s",
+                max_rows,
+                full_model_name,
+                filter_key,
+            )
+
+        # Capped results are partial, so only their rows can be cached
+        if self.record_cache is not None:
+            self.record_cache.add_records(
+                app_model=full_model_name,
+                records=fetched_records,
+                field_names=field_names,
+            )
+        yield self.filter_visited(
+            state=state, full_model_name=full_model_name, records=fetched_records
+        )
+
+    def filter_visited(
+        self, state: TraversalState, full_model_name: str, records: List[dict]
+    ) -> List[dict]:
+        # Rows reached through other paths, or returned twice by many to many
+        # joins, are dropped here so they are neither emitted nor expanded again
+        new_records = []
+        for record in records:
+            node = (full_model_name, record["id"])
+            if node not in state.visited:
+                state.visited.add(node)
+                new_records.append(record)
+
+        if self.metrics is not None:
+            self.metrics.add_rows(
+                rows=0, deduplicated_rows=len(records) - len(new_records)
+            )
+
+        if len(new_records) < len(records):
+            logger.debug(
+                "Skipped %d %s records, were already processed",
+                len(records) - len(new_records),
+                full_model_name,
+            )
+
+        return new_records
+
+    def expand(
+        self,
+        state: TraversalState,
+        plan: ExtractionPlanDTO,
+        full_model_name: str,
+        records: List[dict],
+        fan_out: bool = True,
+    ):
+        edges = self.get_model_edges(plan=plan, full_model_name=full_model_name)
+        if not fan_out:
+            edges = tuple(edge for edge in edges if not edge.is_fan_out)
+
+        for record in records:
+            for edge in edges:
+                filter_values = record[edge.source_field]
+                if edge.relation_kind != RelationKind.many:
+                    filter_values = [filter_values]
+
+                for filter_value in filter_values:
+                    self.push(
+                        state=state,
+                        app_model=edge.target,
+                        filter_key=edge.filter_key,
+                        filter_value=filter_value,
+                    )
+
+        self.expand_generic(
+            state=state, full_model_name=full_model_name, records=records
+        )
+
+    def expand_generic(
+        self, state: TraversalState, full_model_name: str, records: List[dict]
+    ):
+        """Follow the generic foreign keys of ``records``
+
+        Their targets are grouped by content type, so each target model is
+        fetched by primary key with a single query of the next wave.
+        """
+        generic_fields = self.orm_extractor.get_schema(
+            app_model=full_model_name
+        ).generic_foreign_keys
+
+        for field in generic_fields:
+            object_ids_by_content_type = defaultdict(list)
+            for record in records:
+                content_type_id = record.get(field.content_type_field_name)
+                object_id = record.get(field.object_id_field_name)
+                if content_type_id is not None and object_id is not None:
+                    object_ids_by_content_type[content_type_id].append(object_id)
+
+            for content_type_id, object_ids in object_ids_by_content_type.items():
+                target = get_content_type_model(content_type_id=content_type_id)
+                if target is None:
+                    logger.debug("Content type %s has no model", content_type_id)
+                    continue
+
+                # Object ids may be stored in a column of another type
+                primary_key = self.orm_extractor.get_model(app_model=target)._meta.pk
+                for object_id in object_ids:
+                    try:
+                        filter_value = primary_key.to_python(object_id)
+                    except ValidationError:
+                        logger.debug(
+                            "Skipped %s object id %r, not a valid primary key",
+                            target,
+                            object_id,
+                        )
+                        continue
+
+                    self.push(
+                        state=state,
+                        app_model=target,
+                        filter_key="id",
+                        filter_value=filter_value,
+                    )
+
+    def get_model_edges(
+        self, plan: ExtractionPlanDTO, full_model_name: str
+    ) -> Tuple[ExtractionEdgeDTO, ...]:
+        # Models only reached through generic foreign keys are not part of
+        # the plan, their edges come from a plan of their own
+        if full_model_name not in plan.models:
+            plan = self.planner.get_plan(root=full_model_name, limits=self.limits)
+        return plan.edges_by_source.get(full_model_name, ())
+
+    def push(
+        self,
+        state: TraversalState,
+        app_model: str,
+        filter_key: str,
+        filter_value,
+    ):
+        if filter_value is None:
+            return
+
+        if filter_key == "id" and (app_model, filter_value) in state.visited:
+            return
+
+        lookup = (app_model, filter_key, filter_value)
+        if lookup in state.history:
+            return
+
+        state.history.add(lookup)
+        state.frontier[app_model][filter_key].add(filter_value)
@@ -0,0 +1,243 @@
+import bz2
+import gzip
+import io
+import json
+import logging
+import lzma
+import os
+from pathlib import Path
+from time import perf_counter
+from typing import Iterable, Iterator, Optional, Set, Tuple
+
+from fixtures_extractor.encoders import EnhancedDjangoJSONEncoder
+from fixtures_extractor.metrics import ExtractionMetrics
+from fixtures_extractor.natural_keys import NaturalKeyResolver
+
+logger = logging.getLogger(f"extract_fixture.{__name__}")
+
+
+DEFAULT_BUFFER_SIZE = 1024 * 1024
+
+# Compressions loaddata reads, by file extension
+COMPRESSORS = {
+    "gz": gzip.open,
+    "bz2": bz2.open,
+    "xz": lzma.open,
+}
+
+
+def get_fixture_suffix(
+    compression: Optional[str] = None, fixture_format: str = "json"
+) -> str:
+    if compression is None:
+        return f".{fixture_format}"
+    return f".{fixture_format}.{compression}"
+
+
+def get_fixture_format(fixture_file: Path) -> str:
+    suffixes = fixture_file.suffixes
+    if suffixes and suffixes[-1][1:] in COMPRESSORS:
+        suffixes = suffixes[:-1]
+    return suffixes[-1][1:] if suffixes else "json"
+
+
+def open_fixture(
+    fixture_file: Path, mode: str = "r", buffer_size: int = DEFAULT_BUFFER_SIZE
+):
+    """Open a fixture as text, compressed or not depending on its extension
+
+    ``mode`` is ``r`` or ``w``.
+    """
+    compressor = COMPRESSORS.get(fixture_file.suffix[1:])
+    if compressor is None:
+        return open(fixture_file, mode, buffering=buffer_size, encoding="utf-8")
+
+    # Buffered, so the compressor is fed large blocks instead of every write
+    binary_file = compressor(fixture_file, f"{mode}b")
+    if mode == "w":
+        binary_file = io.BufferedWriter(binary_file, buffer_size=buffer_size)
+    else:
+        binary_file = io.BufferedReader(binary_file, buffer_size=buffer_size)
+    return io.TextIOWrapper(binary_file, encoding="utf-8")
+
+
+def iter_fixture_records(fixture_file: Path) -> Iterator[dict]:
+    """Read back the records of a fixture written in any of the formats"""
+    with open_fixture(fixture_file=fixture_file) as fixture_content:
+        if get_fixture_format(fixture_file=fixture_file) == "jsonl":
+            for line in fixture_content:
+                if line.strip():
+                    yield json.loads(line)
+        else:
+            yield from json.load(fixture_content)
+
+
+class JSONFixtureWriter:
+    """Streams fixture records into a JSON array, one record at a time
+
+    The output is the same as ``json.dumps(records, indent=indent)`` but only
+    a single encoded record is held in memory at any time. Without ``indent``
+    records are written compactly, with no whitespace at all. The file is
+    compressed when its extension is one of the ``COMPRESSORS``. Records
+    already written, identified by their model and id, are skipped, records
+    without id are always written. With
+    ``metrics`` the time spent encoding and writing the records is measured.
+    With ``natural_keys`` the primary key of the records identified by their
+    natural key is left out. Records are written into a temporary file next to
+    ``output_file`` that only replaces it once the writer is closed, a writer
+    left by an exception is aborted and the previous fixture is kept intact.
+    """
+
+    def __init__(
+        self,
+        output_file: Path,
+        indent: Optional[int] = 4,
+        buffer_size: int = DEFAULT_BUFFER_SIZE,
+        metrics: Optional[ExtractionMetrics] = None,
+        natural_keys: Optional[NaturalKeyResolver] = None,
+    ):
+        self.output_file = output_file
+        self.buffer_size = buffer_size
+        if indent is None:
+            self.encoder = EnhancedDjangoJSONEncoder(separators=(",", ":"))
+            self.newline = ""
+        else:
+            self.encoder = EnhancedDjangoJSONEncoder(indent=indent)
+            self.newline = "\n"
+        self.prefix = " " * (indent or 0)
+        self.written_keys: Set[Tuple[str, object]] = set()
+        self.duplicated_count = 0
+        self.keyless_count = 0
+        self.metrics = metrics
+        self.natural_keys = natural_keys
+        # Keeps the extension, which tells the compression
+        self.temporary_file = output_file.with_name(f".tmp.{output_file.name}")
+        self._output = None
+
+    @property
+    def written_count(self) -> int:
+        return len(self.written_keys) + self.keyless_count
+
+    def open(self):
+        self._output = open_fixture(
+            fixture_file=self.temporary_file, mode="w", buffer_size=self.buffer_size
+        )
+        self._output.write(self.get_header())
+
+    def close(self):
+        started_at = perf_counter()
+        self._output.write(self.get_footer())
+        self._output.close()
+        self._output = None
+        os.replace(self.temporary_file, self.output_file)
+
+        if self.metrics is not None:
+            self.metrics.add_write(
+                serialization_seconds=0, write_seconds=perf_counter() - started_at
+            )
+            self.metrics.written_records += self.written_count
+
+    def abort(self):
+        """Drop the records written so far, ``output_file`` is left untouched"""
+        self._output.close()
+        self._output = None
+        os.remove(self.temporary_file)
+
+    def write(self, record: dict) -> bool:
+        if self.metrics is not None:
+            self.metrics.set_step(app_model=record["model"], relation="write")
+
+        record_key = (record["model"], record["fields"].get("id"))
+        if record_key[1] is not None and record_key in self.written_keys:
+            self.duplicated_count += 1
+            return False
+
+        if self.natural_keys is not None:
+            record = self.natural_keys.strip_primary_key(record)
+
+        started_at = perf_counter()
+        jsonfy_record = self.encoder.encode(record)
+        encoded_at = perf_counter()
+        self.write_encoded(jsonfy_record=jsonfy_record)
+        if record_key[1] is None:
+            self.keyless_count += 1
+        else:
+            self.written_keys.add(record_key)
+
+        if self.metrics is not None:
+            self.metrics.add_write(
+                serialization_seconds=encoded_at - started_at,
+                write_seconds=perf_counter() - encoded_at,
+            )
+        return True
+
+    def get_header(self) -> str:
+        return "["
+
+    def get_footer(self) -> str:
+        if self.written_count:
+            return self.newline + "]"
+        return "]"
+
+    def write_encoded(self, jsonfy_record: str):
+        if self.written_count:
+            self._output.write(",")
+        if self.newline:
+            self._output.write(self.newline + self.prefix)
+            jsonfy_record = jsonfy_record.replace("\n", "\n" + self.prefix)
+        self._output.write(jsonfy_record)
+
+    def write_records(self, records: Iterable[dict]):
+        for record in records:
+            self.write(record)
+
+    def __enter__(self):
+        self.open()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is not None:
+            self.abort()
+            return
+
+        self.close()
+
+
+class JSONLinesFixtureWriter(JSONFixtureWriter):
+    """Streams fixture records as JSON lines, the ``jsonl`` format of loaddata
+
+    Every record is written compactly on its own line, so fixtures can be
+    read a record at a time, appended to, split or concatenated.
+    """
+
+    def __init__(
+        self,
+        output_file: Path,
+        indent: Optional[int] = None,
+        buffer_size: int = DEFAULT_BUFFER_SIZE,
+        metrics: Optional[ExtractionMetrics] = None,
+        natural_keys: Optional[NaturalKeyResolver] = None,
+    ):
+        # A record can not span several lines, so it is never indented
+        super().__init__(
+            output_file=output_file,
+            indent=None,
+            buffer_size=buffer_size,
+            metrics=metrics,
+            natural_keys=natural_keys,
+        )
+
+    def get_header(self) -> str:
+        return ""
+
+    def get_footer(self) -> str:
+        return ""
+
+    def write_encoded(self, jsonfy_record: str):
+        self._output.write(jsonfy_record + "\n")
+
+
+FIXTURE_WRITERS = {
+    "json": JSONFixtureWriter,
+    "jsonl": JSONLinesFixtureWriter,
+}
@@ -0,0 +1,97 @@
+"""Benchmark the extract_fixture command over synthetic graphs
+
+Run it from the repository root, results are appended to the results file
+and compared with the previous run stored there::
+
+    python -m tests.benchmarks --size 10x100x5 --size 50x20x2 --graph testapp
+"""
+
+import argparse
+import os
+from pathlib import Path
+
+import django
+
+
+def parse_size(size: str):
+    from tests.benchmarks.harness import GraphSize
+
+    roots, related, tags = (int(value) for value in size.split("x"))
+    return GraphSize(roots=roots, related=related, tags=tags)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--size",
+        action="append",
+        dest="sizes",
+        help="Graph size as ROOTSxRELATEDxTAGS, can be used multiple times",
+    )
+    parser.add_argument(
+        "--graph",
+        action="append",
+        dest="graphs",
+        help=(
+            "Graph to extract, eventol events or testapp comments reaching "
+            "through models and generic relations, all of them by default"
+        ),
+    )
+    parser.add_argument(
+        "--scenario",
+        action="append",
+        dest="scenarios",
+        help="Scenario to run, all of them by default",
+    )
+    parser.add_argument(
+        "--results-file",
+        default="benchmark_results.jsonl",
+        help="JSON lines file keeping the results of every run",
+    )
+    args = parser.parse_args()
+
+    os.environ.setdefault(
+        "DJANGO_SETTINGS_MODULE", "tests.testproject.testproject.settings"
+    )
+    django.setup()
+
+    from django.test.utils import setup_databases, teardown_databases
+
+    from tests.benchmarks.harness import (
+        GRAPHS,
+        SCENARIOS,
+        format_results,
+        load_last_results,
+        run_benchmark,
+        store_results,
+    )
+
+    results_file = Path(args.results_file)
+    sizes = [parse_size(size=size) for size in args.sizes or ["10x100x5"]]
+    scenarios = args.scenarios or list(SCENARIOS)
+    graphs = args.graphs or list(GRAPHS)
+
+    old_config = setup_databases(verbosity=0, interactive=False)
+    try:
+        results = []
+        for graph in graphs:
+            for size in sizes:
+                root_ids = GRAPHS[graph].build(size)
+                for scenario in scenarios:
+                    results.append(
+                        run_benchmark(
+                            scenario=scenario,
+                            size=size,
+                            root_ids=root_ids,
+                            graph=graph,
+                        )
+                    )
+    finally:
+        teardown_databases(old_config, verbosity=0)
+
+    print(format_results(results, load_last_results(results_file=results_file)))
+    store_results(results=results, results_file=results_file)
+
+
+if __name__ == "__main__":
+    main()
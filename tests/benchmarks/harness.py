@@ -0,0 +1,235 @@
+import json
+import platform
+import tempfile
+import time
+import tracemalloc
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List, Optional
+
+import django
+from django.core.management import call_command
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from tests.testproject.eventol.factories import (
+    AttendeeFactory,
+    EventFactory,
+    EventTagFactory,
+)
+from tests.testproject.testapp.factories import (
+    ArticleFactory,
+    BandFactory,
+    CommentFactory,
+    MembershipFactory,
+    TagFactory,
+)
+
+# Extra extract_fixture options of every benchmarked scenario
+SCENARIOS: Dict[str, dict] = {
+    "default": {},
+    "keys_only": {"keys_only_traversal": True},
+    "chunked": {"chunk_size": 100},
+}
+
+
+@dataclass(frozen=True)
+class GraphSize:
+    """Size of a synthetic graph
+
+    ``roots`` records are extracted, each with ``related`` rows fanning out
+    of it and ``tags`` tags.
+    """
+
+    roots: int
+    related: int
+    tags: int
+
+    @property
+    def label(self) -> str:
+        return f"{self.roots}x{self.related}x{self.tags}"
+
+
+@dataclass(frozen=True)
+class BenchmarkResult:
+    graph: str
+    scenario: str
+    size: str
+    rows: int
+    seconds: float
+    queries: int
+    peak_memory: int
+    output_bytes: int
+
+    @property
+    def rows_per_second(self) -> float:
+        return self.rows / self.seconds if self.seconds else 0.0
+
+    @property
+    def key(self):
+        return (self.graph, self.scenario, self.size)
+
+    def to_dict(self) -> dict:
+        return {**asdict(self), "rows_per_second": round(self.rows_per_second, 1)}
+
+
+def build_event_graph(size: GraphSize) -> List[int]:
+    """Create events with their attendees and tags, return the event ids"""
+    event_ids = []
+    for _ in range(size.roots):
+        event = EventFactory.create(tags=EventTagFactory.create_batch(size.tags))
+        AttendeeFactory.create_batch(size.related, event=event)
+        event_ids.append(event.id)
+    return event_ids
+
+
+def build_testapp_graph(size: GraphSize) -> List[int]:
+    """Create comments on bands and on articles, return the comment ids
+
+    Comments are followed through their generic foreign key. Bands hold
+    ``related`` members through memberships rows, articles ``related``
+    comments, found through a generic relation, and ``tags`` tags whose
+    object ids are text. Every root shares its content type row, which the
+    record cache serves after the first root.
+    """
+    comment_ids = []
+    for index in range(size.roots):
+        if index % 2:
+            content_object = ArticleFactory.create()
+            CommentFactory.create_batch(size.related, content_object=content_object)
+            TagFactory.create_batch(size.tags, content_object=content_object)
+        else:
+            content_object = BandFactory.create()
+            MembershipFactory.create_batch(size.related, band=content_object)
+        comment_ids.append(CommentFactory.create(content_object=content_object).id)
+    return comment_ids
+
+
+@dataclass(frozen=True)
+class BenchmarkGraph:
+    """Root model of a synthetic graph and the function creating it"""
+
+    app: str
+    model: str
+    build: Callable[[GraphSize], List[int]]
+
+
+GRAPHS: Dict[str, BenchmarkGraph] = {
+    "eventol": BenchmarkGraph(app="eventol", model="event", build=build_event_graph),
+    "testapp": BenchmarkGraph(
+        app="testapp", model="comment", build=build_testapp_graph
+    ),
+}
+
+
+def run_benchmark(
+    scenario: str,
+    size: GraphSize,
+    root_ids: List[int],
+    graph: str = "eventol",
+    **command_options,
+) -> BenchmarkResult:
+    """Extract every root of the graph and measure the command
+
+    Queries are only captured on the main connection, run it without jobs.
+    Peak memory is the one traced by ``tracemalloc``, which slows the run
+    down, so compare it between runs and not to untraced timings.
+    """
+    with tempfile.TemporaryDirectory() as output_dir:
+        tracemalloc.start()
+        start = time.perf_counter()
+        with CaptureQueriesContext(connection) as context:
+            call_command(
+                "extract_fixture",
+                *root_ids,
+                app=GRAPHS[graph].app,
+                model=GRAPHS[graph].model,
+                output_dir=output_dir,
+                **{**SCENARIOS[scenario], **command_options},
+            )
+        seconds = time.perf_counter() - start
+        _, peak_memory = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        rows = 0
+        output_bytes = 0
+        for output_file in Path(output_dir).glob("*/*.json"):
+            output_bytes += output_file.stat().st_size
+            with open(output_file, "r") as output_content:
+                rows += len(json.load(output_content))
+
+    return BenchmarkResult(
+        graph=graph,
+        scenario=scenario,
+        size=size.label,
+        rows=rows,
+        seconds=round(seconds, 4),
+        queries=len(context.captured_queries),
+        peak_memory=peak_memory,
+        output_bytes=output_bytes,
+    )
+
+
+def store_results(results: Iterable[BenchmarkResult], results_file: Path):
+    """Append a run to the JSON lines ``results_file``"""
+    run = {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "django": django.get_version(),
+        "results": [result.to_dict() for result in results],
+    }
+    with open(results_file, "a") as results_content:
+        results_content.write(json.dumps(run) + "\n")
+
+
+def load_last_results(results_file: Path) -> Optional[List[BenchmarkResult]]:
+    if not results_file.exists():
+        return None
+
+    with open(results_file, "r") as results_content:
+        lines = [line for line in results_content if line.strip()]
+    if not lines:
+        return None
+
+    return [
+        BenchmarkResult(
+            **{key: value for key, value in result.items() if key != "rows_per_second"}
+        )
+        for result in json.loads(lines[-1])["results"]
+    ]
+
+
+def format_results(
+    results: List[BenchmarkResult],
+    previous_results: Optional[List[BenchmarkResult]] = None,
+) -> str:
+    """A table of the results, with the change against a previous run"""
+    previous = {result.key: result for result in previous_results or []}
+    metrics = [
+        ("rows/s", lambda result: result.rows_per_second),
+        ("queries", lambda result: result.queries),
+        ("peak KiB", lambda result: result.peak_memory / 1024),
+        ("output KiB", lambda result: result.output_bytes / 1024),
+    ]
+
+    lines = [
+        f"{'graph':<10}{'scenario':<12}{'size':<14}{'rows':>8}"
+        + "".join(f"{name:>20}" for name, _ in metrics)
+    ]
+    for result in results:
+        previous_result = previous.get(result.key)
+        line = (
+            f"{result.graph:<10}{result.scenario:<12}{result.size:<14}"
+            f"{result.rows:>8}"
+        )
+
+        for _, metric in metrics:
+            value = metric(result)
+            cell = f"{value:.0f}"
+            if previous_result is not None and metric(previous_result):
+                previous_value = metric(previous_result)
+                cell += f" ({(value - previous_value) / previous_value:+.0%})"
+            line += f"{cell:>20}"
+
+        lines.append(line)
+    return "\n".join(lines)
@@ -0,0 +1,47 @@
+import pytest
+
+from tests.benchmarks.harness import (
+    GraphSize,
+    build_event_graph,
+    build_testapp_graph,
+    format_results,
+    load_last_results,
+    run_benchmark,
+    store_results,
+)
+
+pytestmark = [pytest.mark.django_db]
+
+
+def test_benchmark_harness_measures_and_stores_a_run(tmp_path):
+    size = GraphSize(roots=2, related=3, tags=2)
+    event_ids = build_event_graph(size=size)
+    results_file = tmp_path / "results.jsonl"
+
+    result = run_benchmark(scenario="default", size=size, root_ids=event_ids)
+    store_results(results=[result], results_file=results_file)
+
+    assert result.rows == size.roots * (1 + size.related + size.tags)
+    assert result.queries > 0
+    assert result.peak_memory > 0
+    assert result.output_bytes > 0
+    assert load_last_results(results_file=results_file) == [result]
+    assert "(+0%)" in format_results([result], [result])
+
+
+@pytest.mark.parametrize("scenario", ["default", "chunked"])
+def test_benchmark_testapp_graph(scenario):
+    size = GraphSize(roots=2, related=3, tags=2)
+    comment_ids = build_testapp_graph(size=size)
+
+    result = run_benchmark(
+        scenario=scenario, size=size, root_ids=comment_ids, graph="testapp"
+    )
+
+    # Root comment, content type and band with its memberships and musicians
+    band_rows = 3 + 2 * size.related
+    # Root comment, content type and article with its comments and tags
+    article_rows = 3 + size.related + size.tags
+    assert result.graph == "testapp"
+    assert result.rows == band_rows + article_rows
+    assert result.queries > 0
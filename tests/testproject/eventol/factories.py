@@ -5,7 +5,7 @@ import factory.fuzzy
 from factory import post_generation
 from factory.django import DjangoModelFactory
 
-from tests.testproject.eventol.models import EventTag, Event
+from tests.testproject.eventol.models import Attendee, EventTag, Event
 
 
 def _generate_image(image_name: str = "image.jpg"):
@@ -24,7 +24,6 @@ def _generate_file(file_name: str = "file.html"):
     return factory.django.FileField(filename=str(file_path))
 
 
-
 class EventTagFactory(DjangoModelFactory):
     class Meta:
         model = EventTag
@@ -76,3 +75,15 @@ class EventFactory(DjangoModelFactory):
                 self.tags.add(tag)
         else:
             self.tags.add(EventTagFactory())
+
+
+class AttendeeFactory(DjangoModelFactory):
+    class Meta:
+        model = Attendee
+
+    first_name = factory.fuzzy.FuzzyText(length=50)
+    last_name = factory.fuzzy.FuzzyText(length=50)
+    nickname = factory.fuzzy.FuzzyText(length=50)
+    email = factory.Sequence(lambda number: f"attendee{number}@example.com")
+    event = factory.SubFactory(EventFactory)
+    additional_info = factory.fuzzy.FuzzyText(length=100)
@@ -5,7 +5,18 @@ from factory import SubFactory, post_generation
 from factory.django import DjangoModelFactory
 from faker import Factory
 
-from tests.testproject.testapp.models import Artist, Album, RecordLabel, Song
+from tests.testproject.testapp.models import (
+    Article,
+    Artist,
+    Album,
+    Band,
+    Comment,
+    Membership,
+    Musician,
+    RecordLabel,
+    Song,
+    Tag,
+)
 
 faker = Factory.create()
 
@@ -53,3 +64,50 @@ class SongFactory(DjangoModelFactory):
             # A list of artists were passed in, use them
             for artist in extracted:
                 self.artists.add(artist)
+
+
+class MusicianFactory(DjangoModelFactory):
+    class Meta:
+        model = Musician
+
+    name = factory.fuzzy.FuzzyText(length=50)
+
+
+class BandFactory(DjangoModelFactory):
+    class Meta:
+        model = Band
+
+    name = factory.fuzzy.FuzzyText(length=50)
+
+
+class MembershipFactory(DjangoModelFactory):
+    class Meta:
+        model = Membership
+
+    musician = SubFactory(MusicianFactory)
+    band = SubFactory(BandFactory)
+    role = factory.fuzzy.FuzzyText(length=20)
+    joined_on = factory.fuzzy.FuzzyDate(start_date=date(2019, 8, 3))
+
+
+class ArticleFactory(DjangoModelFactory):
+    class Meta:
+        model = Article
+
+    title = factory.fuzzy.FuzzyText(length=50)
+
+
+class TagFactory(DjangoModelFactory):
+    class Meta:
+        model = Tag
+
+    content_object = SubFactory(ArticleFactory)
+    name = factory.fuzzy.FuzzyText(length=20)
+
+
+class CommentFactory(DjangoModelFactory):
+    class Meta:
+        model = Comment
+
+    content_object = SubFactory(ArticleFactory)
+    text = factory.fuzzy.FuzzyText(length=100)
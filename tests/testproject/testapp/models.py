@@ -1,3 +1,5 @@
+from django.contrib.contenttypes.fields import GenericForeignKey, GenericRelation
+from django.contrib.contenttypes.models import ContentType
 from django.db import models
 
 
@@ -10,12 +12,22 @@ class Artist(models.Model):
         return f"{self.first_name} {self.last_name}"
 
 
+class RecordLabelManager(models.Manager):
+    def get_by_natural_key(self, name):
+        return self.get(name=name)
+
+
 class RecordLabel(models.Model):
     name = models.CharField(max_length=100, null=False, blank=False)
 
+    objects = RecordLabelManager()
+
     def __str__(self):
         return self.name
 
+    def natural_key(self):
+        return (self.name,)
+
 
 class Album(models.Model):
     artist = models.ForeignKey(Artist, on_delete=models.CASCADE, related_name="albums")
@@ -35,3 +47,57 @@ class Song(models.Model):
 
     def __str__(self):
         return self.name
+
+
+class Musician(models.Model):
+    name = models.CharField(max_length=100, null=False, blank=False)
+
+    def __str__(self):
+        return self.name
+
+
+class Band(models.Model):
+    name = models.CharField(max_length=100, null=False, blank=False)
+    members = models.ManyToManyField(Musician, through="Membership", related_name="bands")
+
+    def __str__(self):
+        return self.name
+
+
+class Membership(models.Model):
+    musician = models.ForeignKey(Musician, on_delete=models.CASCADE, related_name="memberships")
+    band = models.ForeignKey(Band, on_delete=models.CASCADE, related_name="memberships")
+    role = models.CharField(max_length=100)
+    joined_on = models.DateField(null=False, blank=False)
+
+    def __str__(self):
+        return f"{self.musician} in {self.band}"
+
+
+class Comment(models.Model):
+    content_type = models.ForeignKey(ContentType, on_delete=models.CASCADE)
+    object_id = models.PositiveIntegerField()
+    content_object = GenericForeignKey("content_type", "object_id")
+    text = models.CharField(max_length=200)
+
+    def __str__(self):
+        return self.text
+
+
+class Tag(models.Model):
+    content_type = models.ForeignKey(ContentType, on_delete=models.CASCADE)
+    object_pk = models.CharField(max_length=50)
+    content_object = GenericForeignKey("content_type", "object_pk")
+    name = models.CharField(max_length=50)
+
+    def __str__(self):
+        return self.name
+
+
+class Article(models.Model):
+    title = models.CharField(max_length=100, null=False, blank=False)
+    comments = GenericRelation(Comment)
+    tags = GenericRelation(Tag, object_id_field="object_pk")
+
+    def __str__(self):
+        return self.title
@@ -1,6 +1,12 @@
+import gzip
+import io
+import json
 from pathlib import Path
+import django
 import pytest
 from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import connection
 
 from tests.utils import (
     date_repr,
@@ -10,6 +16,18 @@ from tests.testproject.testapp.factories import (
     RecordLabelFactory,
     AlbumFactory,
     ArtistFactory,
+    CommentFactory,
+    MembershipFactory,
+)
+from fixtures_extractor.management.commands import extract_fixture
+from fixtures_extractor.orm_extractor import ORMExtractor
+from tests.testproject.testapp.models import (
+    Album,
+    Article,
+    Band,
+    Comment,
+    Membership,
+    RecordLabel,
 )
 
 pytestmark = [pytest.mark.django_db]
@@ -99,3 +117,299 @@ def test_run_command_multiple_related_model(tmp_path):
     output_json = sorted(get_json_from_file(output_file), key=lambda x: x["model"])
 
     assert output_json == expected_json
+
+
+@pytest.mark.parametrize("order", ["dependency", "traversal"])
+def test_run_command_failed_root_keeps_previous_fixture(tmp_path, monkeypatch, order):
+    record_label = RecordLabelFactory.create()
+    AlbumFactory.create(record_label=record_label)
+    options = {
+        "app": "testapp",
+        "model": "recordlabel",
+        "output_dir": tmp_path,
+        "order": order,
+    }
+    call_command("extract_fixture", record_label.id, **options)
+    output_file = Path(tmp_path).joinpath(
+        f"recordlabel_{record_label.id}/testapp.recordlabel.json"
+    )
+    previous_content = output_file.read_text()
+
+    get_batch_records = ORMExtractor.get_batch_records
+    calls = []
+
+    def failing_get_batch_records(self, *args, **kwargs):
+        calls.append(args)
+        if len(calls) == 2:
+            raise RuntimeError("Connection lost")
+        return get_batch_records(self, *args, **kwargs)
+
+    monkeypatch.setattr(ORMExtractor, "get_batch_records", failing_get_batch_records)
+    call_command("extract_fixture", record_label.id, **options)
+
+    assert len(calls) == 2
+    assert output_file.read_text() == previous_content
+    assert [path.name for path in output_file.parent.iterdir()] == [output_file.name]
+
+
+@pytest.mark.django_db(transaction=True)
+def test_run_command_with_multiple_jobs(tmp_path, monkeypatch):
+    record_label_1 = RecordLabelFactory.create()
+    record_label_2 = RecordLabelFactory.create()
+
+    # Kept alive, so a connection opened by a worker can not reuse its address
+    connection.ensure_connection()
+    parent_connection = connection.connection
+    connections_dir = tmp_path / "connections"
+    connections_dir.mkdir()
+    extract_primary_id = extract_fixture.extract_primary_id
+
+    def extract_primary_id_in_worker(primary_id, **kwargs):
+        output_file = extract_primary_id(primary_id=primary_id, **kwargs)
+        connections_dir.joinpath(str(primary_id)).write_text(
+            str(connection.connection is parent_connection)
+        )
+        return output_file
+
+    monkeypatch.setattr(
+        extract_fixture, "extract_primary_id", extract_primary_id_in_worker
+    )
+
+    output_dir = tmp_path / "fixtures"
+    output_dir.mkdir()
+
+    options = {
+        "app": "testapp",
+        "model": "recordlabel",
+        "output_dir": output_dir,
+        "jobs": 2,
+    }
+    call_command("extract_fixture", record_label_1.id, record_label_2.id, **options)
+
+    for record_label in [record_label_1, record_label_2]:
+        output_file = Path(output_dir).joinpath(
+            f"recordlabel_{record_label.id}/testapp.recordlabel.json"
+        )
+        expected_json = [
+            {
+                "model": "testapp.recordlabel",
+                "fields": {
+                    "id": record_label.id,
+                    "name": record_label.name,
+                },
+            }
+        ]
+
+        assert get_json_from_file(output_file) == expected_json
+        # Workers query the database through connections of their own
+        assert connections_dir.joinpath(str(record_label.id)).read_text() == "False"
+
+
+def test_run_command_with_multiple_jobs_on_in_memory_database(tmp_path, monkeypatch):
+    record_label = RecordLabelFactory.create()
+    monkeypatch.setitem(connection.settings_dict, "NAME", ":memory:")
+
+    def fail_in_pool(*args, **kwargs):
+        raise AssertionError("Extracted in a pool")
+
+    monkeypatch.setattr(extract_fixture.Command, "extract_in_pool", fail_in_pool)
+    call_command(
+        "extract_fixture",
+        record_label.id,
+        record_label.id + 1,
+        app="testapp",
+        model="recordlabel",
+        output_dir=tmp_path,
+        jobs=2,
+    )
+
+    assert (
+        Path(tmp_path)
+        .joinpath(f"recordlabel_{record_label.id}/testapp.recordlabel.json")
+        .exists()
+    )
+
+
+def test_run_command_prints_metrics(tmp_path):
+    record_label = RecordLabelFactory.create()
+    AlbumFactory.create_batch(2, record_label=record_label)
+    stdout = io.StringIO()
+
+    call_command(
+        "extract_fixture",
+        record_label.id,
+        app="testapp",
+        model="recordlabel",
+        output_dir=tmp_path,
+        metrics=True,
+        stdout=stdout,
+    )
+
+    summary = stdout.getvalue()
+    assert "testapp.album" in summary
+    assert "Serialized 5 records" in summary
+
+
+def test_run_command_compressed_compact_fixture_is_loadable(tmp_path):
+    record_label = RecordLabelFactory.create()
+    AlbumFactory.create(record_label=record_label)
+
+    call_command(
+        "extract_fixture",
+        record_label.id,
+        app="testapp",
+        model="recordlabel",
+        output_dir=tmp_path,
+        compression="gz",
+        compact=True,
+    )
+
+    output_file = Path(tmp_path).joinpath(
+        f"recordlabel_{record_label.id}/testapp.recordlabel.json.gz"
+    )
+    with gzip.open(output_file, "rt") as output_content:
+        content = output_content.read()
+
+    assert "\n" not in content
+    assert len(json.loads(content)) == 3
+    call_command("loaddata", output_file, verbosity=0)
+
+
+@pytest.mark.skipif(
+    django.VERSION < (3, 2), reason="loaddata reads jsonl since Django 3.2"
+)
+def test_run_command_json_lines_fixture_is_loadable(tmp_path):
+    record_label = RecordLabelFactory.create()
+    AlbumFactory.create(record_label=record_label)
+
+    call_command(
+        "extract_fixture",
+        record_label.id,
+        app="testapp",
+        model="recordlabel",
+        output_dir=tmp_path,
+        fixture_format="jsonl",
+    )
+
+    output_file = Path(tmp_path).joinpath(
+        f"recordlabel_{record_label.id}/testapp.recordlabel.jsonl"
+    )
+    lines = output_file.read_text().splitlines()
+
+    assert [json.loads(line)["model"] for line in lines] == [
+        "testapp.recordlabel",
+        "testapp.artist",
+        "testapp.album",
+    ]
+    call_command("loaddata", output_file, verbosity=0)
+
+
+def test_run_command_json_lines_requires_django_3_2(tmp_path, monkeypatch):
+    record_label = RecordLabelFactory.create()
+    monkeypatch.setattr(django, "VERSION", (3, 1, 0, "final", 0))
+
+    with pytest.raises(CommandError):
+        call_command(
+            "extract_fixture",
+            record_label.id,
+            app="testapp",
+            model="recordlabel",
+            output_dir=tmp_path,
+            fixture_format="jsonl",
+        )
+
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_run_command_natural_keys_load_into_other_primary_keys(tmp_path):
+    record_label = RecordLabelFactory.create()
+    album = AlbumFactory.create(record_label=record_label)
+
+    call_command(
+        "extract_fixture",
+        album.id,
+        app="testapp",
+        model="album",
+        output_dir=tmp_path,
+        natural_foreign=True,
+        natural_primary=True,
+    )
+
+    output_file = Path(tmp_path).joinpath(f"album_{album.id}/testapp.album.json")
+    records = {record["model"]: record for record in get_json_from_file(output_file)}
+    assert records["testapp.recordlabel"]["fields"] == {"name": record_label.name}
+    assert records["testapp.album"]["fields"]["record_label"] == [record_label.name]
+    assert records["testapp.album"]["fields"]["artist"] == album.artist.id
+
+    Album.objects.all().delete()
+    RecordLabel.objects.all().delete()
+    RecordLabelFactory.create()
+    call_command("loaddata", output_file, verbosity=0)
+
+    loaded_album = Album.objects.get(id=album.id)
+    assert loaded_album.record_label.name == record_label.name
+    assert loaded_album.record_label.id != record_label.id
+
+
+def test_run_command_through_rows_are_loadable(tmp_path):
+    membership = MembershipFactory.create()
+    MembershipFactory.create(band=membership.band)
+
+    call_command(
+        "extract_fixture",
+        membership.band.id,
+        app="testapp",
+        model="band",
+        output_dir=tmp_path,
+    )
+
+    output_file = Path(tmp_path).joinpath(
+        f"band_{membership.band.id}/testapp.band.json"
+    )
+    records = get_json_from_file(output_file)
+    assert [record["model"] for record in records] == [
+        "testapp.band",
+        "testapp.musician",
+        "testapp.musician",
+        "testapp.membership",
+        "testapp.membership",
+    ]
+    assert "members" not in records[0]["fields"]
+    assert records[3]["fields"]["role"] == membership.role
+
+    Band.objects.all().delete()
+    call_command("loaddata", output_file, verbosity=0)
+
+    assert Membership.objects.get(id=membership.id).role == membership.role
+
+
+def test_run_command_generic_relations_are_loadable(tmp_path):
+    comment = CommentFactory.create()
+    article = comment.content_object
+
+    call_command(
+        "extract_fixture",
+        article.id,
+        app="testapp",
+        model="article",
+        output_dir=tmp_path,
+        natural_foreign=True,
+        natural_primary=True,
+    )
+
+    output_file = Path(tmp_path).joinpath(f"article_{article.id}/testapp.article.json")
+    records = {record["model"]: record for record in get_json_from_file(output_file)}
+    assert records["testapp.comment"]["fields"]["content_type"] == [
+        "testapp",
+        "article",
+    ]
+    assert records["contenttypes.contenttype"]["fields"] == {
+        "app_label": "testapp",
+        "model": "article",
+    }
+
+    Article.objects.all().delete()
+    Comment.objects.all().delete()
+    call_command("loaddata", output_file, verbosity=0)
+
+    assert Comment.objects.get(id=comment.id).content_object.title == article.title
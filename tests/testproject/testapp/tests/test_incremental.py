@@ -0,0 +1,172 @@
+from pathlib import Path
+
+import pytest
+from django.core.management import call_command
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from fixtures_extractor.incremental import (
+    IncrementalFixtureWriter,
+    PreviousFixtureIndex,
+)
+from fixtures_extractor.orm_extractor import ORMExtractor
+from fixtures_extractor.projection import FieldProjection
+from fixtures_extractor.traversal import GraphTraversal
+from fixtures_extractor.writers import JSONFixtureWriter
+from tests.testproject.testapp.factories import AlbumFactory, RecordLabelFactory
+from tests.utils import get_json_from_file
+
+RECORDS = [
+    {"model": "testapp.artist", "fields": {"id": 1, "first_name": "John"}},
+    {"model": "testapp.artist", "fields": {"id": 2, "first_name": "Paul"}},
+]
+
+
+def _write_fixture(output_file, records):
+    with JSONFixtureWriter(output_file=output_file) as writer:
+        writer.write_records(records)
+
+
+@pytest.mark.parametrize(
+    "records, is_changed",
+    [
+        (RECORDS, False),
+        ([RECORDS[0]], True),
+        (RECORDS[::-1], False),
+        ([RECORDS[0], {**RECORDS[1], "fields": {"id": 2, "first_name": "P"}}], True),
+    ],
+)
+def test_incremental_writer_only_rewrites_changed_fixtures(
+    tmp_path, records, is_changed
+):
+    output_file = tmp_path / "fixture.json"
+    _write_fixture(output_file=output_file, records=RECORDS)
+    previous_inode = output_file.stat().st_ino
+
+    with IncrementalFixtureWriter(
+        output_file=output_file,
+        previous_index=PreviousFixtureIndex.load(fixture_file=output_file),
+    ) as writer:
+        writer.write_records(records)
+
+    assert writer.is_changed is is_changed
+    assert (output_file.stat().st_ino != previous_inode) is is_changed
+    assert get_json_from_file(output_file) == (records if is_changed else RECORDS)
+    assert list(tmp_path.iterdir()) == [output_file]
+
+
+def test_incremental_writer_rewrites_keyless_previous_records(tmp_path):
+    output_file = tmp_path / "fixture.json"
+    keyless_record = {"model": "testapp.recordlabel", "fields": {"name": "Label"}}
+    _write_fixture(output_file=output_file, records=RECORDS + [keyless_record])
+
+    with IncrementalFixtureWriter(
+        output_file=output_file,
+        previous_index=PreviousFixtureIndex.load(fixture_file=output_file),
+    ) as writer:
+        writer.write_records(RECORDS)
+
+    assert writer.is_changed
+    assert get_json_from_file(output_file) == RECORDS
+
+
+def test_incremental_writer_creates_missing_fixture(tmp_path):
+    output_file = tmp_path / "fixture.json"
+
+    with IncrementalFixtureWriter(
+        output_file=output_file,
+        previous_index=PreviousFixtureIndex.load(fixture_file=output_file),
+    ) as writer:
+        writer.write_records(RECORDS)
+
+    assert writer.changed_count == len(RECORDS)
+    assert get_json_from_file(output_file) == RECORDS
+
+
+@pytest.mark.django_db
+def test_run_command_incremental_keeps_unchanged_fixture(tmp_path):
+    record_label = RecordLabelFactory.create()
+    AlbumFactory.create(record_label=record_label)
+    options = {"app": "testapp", "model": "recordlabel", "output_dir": tmp_path}
+    output_file = Path(tmp_path).joinpath(
+        f"recordlabel_{record_label.id}/testapp.recordlabel.json"
+    )
+
+    call_command("extract_fixture", record_label.id, **options)
+    previous_inode = output_file.stat().st_ino
+
+    call_command("extract_fixture", record_label.id, incremental=True, **options)
+    assert output_file.stat().st_ino == previous_inode
+
+    record_label.name = "Renamed label"
+    record_label.save()
+    call_command("extract_fixture", record_label.id, incremental=True, **options)
+
+    assert output_file.stat().st_ino != previous_inode
+    assert "Renamed label" in output_file.read_text()
+
+
+@pytest.mark.django_db
+def test_run_command_incremental_after_natural_primary_extraction(tmp_path):
+    record_label = RecordLabelFactory.create()
+    album = AlbumFactory.create(record_label=record_label)
+    options = {"app": "testapp", "model": "album", "output_dir": tmp_path}
+    output_file = Path(tmp_path).joinpath(f"album_{album.id}/testapp.album.json")
+
+    call_command("extract_fixture", album.id, natural_primary=True, **options)
+    assert any(
+        "id" not in record["fields"] for record in get_json_from_file(output_file)
+    )
+
+    call_command("extract_fixture", album.id, incremental=True, **options)
+
+    assert {
+        (record["model"], record["fields"]["id"])
+        for record in get_json_from_file(output_file)
+    } == {
+        ("testapp.album", album.id),
+        ("testapp.artist", album.artist_id),
+        ("testapp.recordlabel", record_label.id),
+    }
+
+
+@pytest.mark.django_db
+def test_keys_only_traversal_reuses_rows_with_unchanged_timestamp(tmp_path):
+    record_label = RecordLabelFactory.create()
+    AlbumFactory.create_batch(2, record_label=record_label)
+    output_file = tmp_path / "fixture.json"
+    orm_extractor = ORMExtractor()
+
+    def extract(previous_index=None):
+        graph_traversal = GraphTraversal(
+            orm_extractor=orm_extractor,
+            projection=FieldProjection(keys_only=True),
+            timestamp_field="release_date",
+        )
+        records = graph_traversal.extract(
+            app_model="testapp.recordlabel",
+            filter_key="id",
+            filter_values=[record_label.id],
+            previous_index=previous_index,
+        )
+        return graph_traversal, records
+
+    _, records = extract()
+    _write_fixture(output_file=output_file, records=records)
+    previous_index = PreviousFixtureIndex.load(fixture_file=output_file)
+
+    with CaptureQueriesContext(connection) as context:
+        graph_traversal, reused_records = extract(previous_index=previous_index)
+
+    album_queries = [
+        query["sql"]
+        for query in context.captured_queries
+        if '"name"' in query["sql"] and "testapp_album" in query["sql"]
+    ]
+    assert graph_traversal.reused_count == 2
+    assert album_queries == []
+    with IncrementalFixtureWriter(
+        output_file=output_file, previous_index=previous_index
+    ) as writer:
+        writer.write_records(reused_records)
+    assert writer.is_changed is False
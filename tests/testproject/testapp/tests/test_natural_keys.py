@@ -0,0 +1,90 @@
+import pytest
+from django.contrib.auth.models import Permission
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from fixtures_extractor.metrics import ExtractionMetrics
+from fixtures_extractor.natural_keys import NaturalKeyResolver
+from fixtures_extractor.orm_extractor import ORMExtractor
+from fixtures_extractor.traversal import GraphTraversal
+from tests.testproject.testapp.factories import AlbumFactory, RecordLabelFactory
+
+pytestmark = [pytest.mark.django_db]
+
+
+def test_natural_keys_are_fetched_once_per_batch_and_model():
+    albums = [
+        AlbumFactory.create(record_label=RecordLabelFactory.create()) for _ in range(4)
+    ]
+    orm_extractor = ORMExtractor()
+    records = orm_extractor.build_records(
+        app_model="testapp.album",
+        records=orm_extractor.get_batch_records(
+            app_model="testapp.album", lookups={"id": [album.id for album in albums]}
+        ),
+    )
+
+    resolver = NaturalKeyResolver(natural_foreign=True, batch_size=2)
+    with CaptureQueriesContext(connection) as context:
+        converted_records = list(resolver.iter_records(records))
+
+    assert len(context.captured_queries) == 2
+    assert sorted(record["fields"]["record_label"] for record in converted_records) == (
+        sorted((album.record_label.name,) for album in albums)
+    )
+    assert all(
+        isinstance(record["fields"]["artist"], int) for record in converted_records
+    )
+
+
+def test_natural_keys_are_measured_in_their_own_step():
+    album = AlbumFactory.create()
+    metrics = ExtractionMetrics()
+    graph_traversal = GraphTraversal(orm_extractor=ORMExtractor(), metrics=metrics)
+    resolver = NaturalKeyResolver(natural_foreign=True, batch_size=1, metrics=metrics)
+
+    with metrics.collect():
+        list(
+            resolver.iter_records(
+                graph_traversal.iter_records(
+                    app_model="testapp.album", filter_key="id", filter_values=[album.id]
+                )
+            )
+        )
+
+    assert metrics.steps[("testapp.recordlabel", "natural_keys")].queries == 1
+    assert metrics.steps[("testapp.recordlabel", "id")].queries == 1
+    assert metrics.steps[("testapp.recordlabel", "id")].rows == 1
+
+
+def test_natural_keys_of_dependencies_are_fetched_in_the_same_query():
+    permissions = list(Permission.objects.order_by("id")[:5])
+    records = [
+        {
+            "model": "auth.group",
+            "fields": {
+                "id": 1,
+                "name": "Editors",
+                "permissions": [permission.id for permission in permissions],
+            },
+        }
+    ]
+
+    resolver = NaturalKeyResolver(natural_foreign=True)
+    with CaptureQueriesContext(connection) as context:
+        converted_records = list(resolver.iter_records(records))
+
+    # Permission natural keys include the natural key of their content type
+    assert len(context.captured_queries) == 1
+    assert converted_records[0]["fields"]["permissions"] == [
+        permission.natural_key() for permission in permissions
+    ]
+
+
+def test_natural_primary_only_strips_models_with_a_natural_key():
+    resolver = NaturalKeyResolver(natural_primary=True)
+    record_label = {"model": "testapp.recordlabel", "fields": {"id": 1, "name": "a"}}
+    artist = {"model": "testapp.artist", "fields": {"id": 1, "first_name": "b"}}
+
+    assert resolver.strip_primary_key(record_label)["fields"] == {"name": "a"}
+    assert resolver.strip_primary_key(artist) is artist
@@ -0,0 +1,143 @@
+import pytest
+
+from fixtures_extractor.ordering import DependencyOrder
+from fixtures_extractor.orm_extractor import ORMExtractor
+from fixtures_extractor.traversal import GraphTraversal
+from tests.testproject.testapp.factories import (
+    AlbumFactory,
+    ArtistFactory,
+    RecordLabelFactory,
+    SongFactory,
+)
+
+
+def _record(app_model, id, **fields):
+    return {"model": app_model, "fields": {"id": id, **fields}}
+
+
+def test_sort_models_puts_dependencies_first():
+    dependency_order = DependencyOrder()
+
+    assert dependency_order.sort_models(
+        models=[
+            "testapp.song",
+            "testapp.album",
+            "testapp.recordlabel",
+            "testapp.artist",
+        ]
+    ) == ["testapp.recordlabel", "testapp.artist", "testapp.album", "testapp.song"]
+
+
+def test_sort_self_references_puts_parents_first():
+    records = [
+        _record("testapp.category", 3, parent=2),
+        _record("testapp.category", 4, parent=None),
+        _record("testapp.category", 2, parent=1),
+        _record("testapp.category", 1, parent=None),
+    ]
+
+    sorted_records = DependencyOrder.sort_self_references(
+        records=records,
+        record_ids={record["fields"]["id"] for record in records},
+        field_names=["parent"],
+    )
+
+    # Rows are written as soon as their parent is
+    assert [record["fields"]["id"] for record in sorted_records] == [4, 1, 2, 3]
+
+
+def test_sort_self_references_streams_records():
+    records = [
+        _record("testapp.category", 1, parent=None),
+        _record("testapp.category", 3, parent=2),
+        _record("testapp.category", 2, parent=None),
+    ]
+    consumed_records = []
+
+    def iter_records():
+        for record in records:
+            consumed_records.append(record)
+            yield record
+
+    sorted_records = DependencyOrder.sort_self_references(
+        records=iter_records(), record_ids={1, 2, 3}, field_names=["parent"]
+    )
+
+    assert next(sorted_records)["fields"]["id"] == 1
+    assert len(consumed_records) == 1
+    assert [record["fields"]["id"] for record in sorted_records] == [2, 3]
+
+
+def test_sort_self_references_keeps_cycles():
+    records = [
+        _record("testapp.category", 1, parent=2),
+        _record("testapp.category", 2, parent=1),
+    ]
+
+    sorted_records = DependencyOrder.sort_self_references(
+        records=records,
+        record_ids={record["fields"]["id"] for record in records},
+        field_names=["parent"],
+    )
+
+    assert sorted(record["fields"]["id"] for record in sorted_records) == [1, 2]
+
+
+def test_sort_self_references_writes_cycles_before_their_children():
+    records = [
+        _record("testapp.category", 3, parent=1),
+        _record("testapp.category", 1, parent=2),
+        _record("testapp.category", 2, parent=1),
+    ]
+
+    sorted_records = DependencyOrder.sort_self_references(
+        records=records, record_ids={1, 2, 3}, field_names=["parent"]
+    )
+
+    sorted_ids = [record["fields"]["id"] for record in sorted_records]
+    assert sorted(sorted_ids) == [1, 2, 3]
+    assert sorted_ids.index(1) < sorted_ids.index(3)
+
+
+@pytest.mark.django_db
+def test_iter_sorted_records_spools_to_disk():
+    record_label = RecordLabelFactory.create()
+    artist = ArtistFactory.create()
+    albums = AlbumFactory.create_batch(3, record_label=record_label, artist=artist)
+    for album in albums:
+        SongFactory.create_batch(2, album=album, artists=[artist])
+
+    records = GraphTraversal(orm_extractor=ORMExtractor()).extract(
+        app_model="testapp.recordlabel",
+        filter_key="id",
+        filter_values=[record_label.id],
+    )
+    sorted_records = list(
+        DependencyOrder(max_buffered_records=2).iter_sorted_records(records)
+    )
+
+    assert sorted(map(repr, sorted_records)) == sorted(map(repr, records))
+    assert [record["model"] for record in sorted_records] == (
+        ["testapp.recordlabel", "testapp.artist"]
+        + ["testapp.album"] * 3
+        + ["testapp.song"] * 6
+    )
+
+
+def test_iter_sorted_records_sorts_spooled_self_references(monkeypatch):
+    records = [
+        _record("testapp.category", 4, parent=3),
+        _record("testapp.category", 3, parent=2),
+        _record("testapp.category", 2, parent=1),
+        _record("testapp.category", 1, parent=None),
+        _record("testapp.category", 5, parent=4),
+    ]
+    dependency_order = DependencyOrder(max_buffered_records=2)
+    monkeypatch.setattr(dependency_order, "get_dependencies", lambda app_model: set())
+    monkeypatch.setattr(
+        dependency_order, "get_self_relations", lambda app_model: ["parent"]
+    )
+
+    sorted_records = list(dependency_order.iter_sorted_records(records))
+
+    assert [record["fields"]["id"] for record in sorted_records] == [1, 2, 3, 4, 5]
@@ -1,8 +1,10 @@
+import django
 import pytest
 
 from fixtures_extractor.dtos import ModelFieldMetaDTO
 from fixtures_extractor.enums import FieldType
 from fixtures_extractor.orm_extractor import ORMExtractor
+from tests.testproject.testapp.factories import ArtistFactory, SongFactory
 
 
 @pytest.mark.parametrize(
@@ -312,3 +314,94 @@ def test_get_model_declared_many_relations(
     assert sorted(model_target_relations) == sorted(
         expected_model_declared_many_relations
     )
+
+
+@pytest.mark.django_db
+def test_get_batch_records_loads_many_to_many_in_bulk(django_assert_num_queries):
+    artist_1, artist_2 = ArtistFactory.create_batch(2)
+    songs = [
+        SongFactory.create(artists=[artist_1, artist_2]),
+        SongFactory.create(artists=[artist_2]),
+        SongFactory.create(),
+    ]
+    orm_extractor = ORMExtractor()
+
+    with django_assert_num_queries(2):
+        records = orm_extractor.get_batch_records(
+            app_model="testapp.song", lookups={"id": [song.id for song in songs]}
+        )
+
+    artists_by_song = {record["id"]: record["artists"] for record in records}
+    assert artists_by_song == {
+        songs[0].id: [artist_1.id, artist_2.id],
+        songs[1].id: [artist_2.id],
+        songs[2].id: [],
+    }
+
+
+@pytest.mark.django_db
+def test_get_batch_records_sorts_many_to_many_ids():
+    artist_1, artist_2 = ArtistFactory.create_batch(2)
+    song = SongFactory.create()
+    song.artists.add(artist_2)
+    song.artists.add(artist_1)
+
+    records = ORMExtractor().get_batch_records(
+        app_model="testapp.song", lookups={"id": [song.id]}
+    )
+
+    assert [record["artists"] for record in records] == [[artist_1.id, artist_2.id]]
+
+
+@pytest.mark.django_db
+def test_iter_batch_records_yields_chunks():
+    artist = ArtistFactory.create()
+    songs = SongFactory.create_batch(3, artists=[artist])
+    orm_extractor = ORMExtractor()
+
+    chunks = list(
+        orm_extractor.iter_batch_records(
+            app_model="testapp.song",
+            lookups={"id": [song.id for song in songs]},
+            chunk_size=2,
+        )
+    )
+
+    assert [len(chunk) for chunk in chunks] == [2, 1]
+    assert [record["artists"] for chunk in chunks for record in chunk] == [
+        [artist.id],
+        [artist.id],
+        [artist.id],
+    ]
+
+
+@pytest.mark.django_db
+def test_iter_batch_records_yields_chunks_before_django_2(monkeypatch):
+    songs = SongFactory.create_batch(3)
+    # QuerySet.iterator has no chunk_size argument before Django 2.0
+    monkeypatch.setattr(django, "VERSION", (1, 11, 0, "final", 0))
+
+    chunks = list(
+        ORMExtractor().iter_batch_records(
+            app_model="testapp.song",
+            lookups={"id": [song.id for song in songs]},
+            chunk_size=2,
+        )
+    )
+
+    assert [len(chunk) for chunk in chunks] == [2, 1]
+
+
+def test_build_records():
+    orm_extractor = ORMExtractor()
+
+    records = orm_extractor.build_records(
+        app_model="testapp.artist",
+        records=[{"id": 1, "first_name": "John"}, {"pk": 2, "id": 2}],
+    )
+
+    assert next(records) == {
+        "model": "testapp.artist",
+        "fields": {"id": 1, "first_name": "John"},
+    }
+    assert list(records) == [{"model": "testapp.artist", "fields": {"id": 2}}]
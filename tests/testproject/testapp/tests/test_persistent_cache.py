@@ -0,0 +1,115 @@
+import sqlite3
+
+import pytest
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from fixtures_extractor.orm_extractor import ORMExtractor
+from fixtures_extractor.persistent_cache import PersistentRecordCache
+from fixtures_extractor.projection import FieldProjection
+from fixtures_extractor.traversal import GraphTraversal
+from tests.testproject.testapp.factories import (
+    AlbumFactory,
+    ArtistFactory,
+    RecordLabelFactory,
+    SongFactory,
+)
+
+pytestmark = [pytest.mark.django_db]
+
+
+def _extract(record_label, record_cache, projection=None):
+    graph_traversal = GraphTraversal(
+        orm_extractor=ORMExtractor(),
+        record_cache=record_cache,
+        projection=projection,
+    )
+    with CaptureQueriesContext(connection) as context:
+        records = graph_traversal.extract(
+            app_model="testapp.recordlabel",
+            filter_key="id",
+            filter_values=[record_label.id],
+        )
+    record_cache.close()
+    return records, len(context.captured_queries)
+
+
+@pytest.fixture
+def record_label():
+    record_label = RecordLabelFactory.create()
+    artist = ArtistFactory.create()
+    album = AlbumFactory.create(record_label=record_label, artist=artist)
+    SongFactory.create(album=album, artists=[artist])
+    return record_label
+
+
+def test_persistent_cache_serves_a_later_run(tmp_path, record_label):
+    cache_file = tmp_path / "cache.sqlite3"
+
+    records, queries_count = _extract(
+        record_label=record_label,
+        record_cache=PersistentRecordCache(cache_file=cache_file),
+    )
+    record_cache = PersistentRecordCache(cache_file=cache_file)
+    cached_records, cached_queries_count = _extract(
+        record_label=record_label, record_cache=record_cache
+    )
+
+    assert queries_count > 0
+    assert cached_queries_count == 0
+    assert record_cache.disk_hits > 0
+    assert cached_records == records
+
+
+def test_persistent_cache_is_bound_to_the_fetched_columns(tmp_path, record_label):
+    cache_file = tmp_path / "cache.sqlite3"
+
+    _extract(
+        record_label=record_label,
+        record_cache=PersistentRecordCache(cache_file=cache_file),
+    )
+    records, queries_count = _extract(
+        record_label=record_label,
+        record_cache=PersistentRecordCache(cache_file=cache_file),
+        projection=FieldProjection.build(exclude=["testapp.album.name"]),
+    )
+
+    assert queries_count > 0
+    assert all(
+        "name" not in record["fields"]
+        for record in records
+        if record["model"] == "testapp.album"
+    )
+
+
+def test_persistent_cache_ignores_expired_entries(tmp_path, record_label):
+    cache_file = tmp_path / "cache.sqlite3"
+
+    _extract(
+        record_label=record_label,
+        record_cache=PersistentRecordCache(cache_file=cache_file),
+    )
+    with sqlite3.connect(str(cache_file)) as cache_connection:
+        cache_connection.execute("UPDATE records SET stored_at = stored_at - 100")
+
+    _, queries_count = _extract(
+        record_label=record_label,
+        record_cache=PersistentRecordCache(cache_file=cache_file, ttl=50),
+    )
+
+    assert queries_count > 0
+
+
+def test_persistent_cache_evicts_past_max_entries(tmp_path, record_label):
+    cache_file = tmp_path / "cache.sqlite3"
+
+    _extract(
+        record_label=record_label,
+        record_cache=PersistentRecordCache(cache_file=cache_file, max_entries=2),
+    )
+
+    with sqlite3.connect(str(cache_file)) as cache_connection:
+        (records_count,) = cache_connection.execute(
+            "SELECT COUNT(*) FROM records"
+        ).fetchone()
+    assert records_count == 2
@@ -0,0 +1,132 @@
+from fixtures_extractor.dtos import ExtractionEdgeDTO
+from fixtures_extractor.enums import RelationKind
+from fixtures_extractor.limits import TraversalLimits
+from fixtures_extractor.planner import ExtractionPlanner
+
+
+def test_get_plan_is_compiled_once():
+    planner = ExtractionPlanner()
+
+    plan = planner.get_plan(root="testapp.recordlabel")
+
+    assert planner.get_plan(root="testapp.recordlabel") is plan
+
+
+def test_compile_plan():
+    planner = ExtractionPlanner()
+
+    plan = planner.compile_plan(root="testapp.recordlabel")
+
+    assert plan.models == (
+        "testapp.recordlabel",
+        "testapp.album",
+        "testapp.artist",
+        "testapp.song",
+    )
+    assert plan.edges_by_source["testapp.recordlabel"] == (
+        ExtractionEdgeDTO(
+            source="testapp.recordlabel",
+            target="testapp.album",
+            source_field="id",
+            filter_key="record_label",
+            relation_kind=RelationKind.reverse,
+            is_cycle=True,
+        ),
+    )
+    assert plan.edges_by_source["testapp.song"] == (
+        ExtractionEdgeDTO(
+            source="testapp.song",
+            target="testapp.album",
+            source_field="album",
+            filter_key="id",
+            relation_kind=RelationKind.one,
+            is_cycle=True,
+        ),
+        ExtractionEdgeDTO(
+            source="testapp.song",
+            target="testapp.artist",
+            source_field="artists",
+            filter_key="id",
+            relation_kind=RelationKind.many,
+            is_cycle=True,
+        ),
+    )
+    assert plan.cyclic_edges == plan.edges
+
+
+def test_get_strongly_connected_components():
+    def edge(source, target):
+        return ExtractionEdgeDTO(
+            source=source,
+            target=target,
+            source_field="id",
+            filter_key="id",
+            relation_kind=RelationKind.one,
+        )
+
+    components = ExtractionPlanner.get_strongly_connected_components(
+        models=["a", "b", "c", "d"],
+        edges=[edge("a", "b"), edge("b", "a"), edge("b", "c"), edge("c", "d")],
+    )
+
+    assert components["a"] == components["b"]
+    assert len({components["a"], components["c"], components["d"]}) == 3
+
+
+def test_compile_plan_with_allowed_edges():
+    planner = ExtractionPlanner()
+
+    plan = planner.compile_plan(
+        root="testapp.song",
+        limits=TraversalLimits(allowed_edges=("testapp.album->*",)),
+    )
+
+    assert plan.models == (
+        "testapp.song",
+        "testapp.album",
+        "testapp.artist",
+        "testapp.recordlabel",
+    )
+    assert {(edge.source, edge.target) for edge in plan.edges} == {
+        ("testapp.song", "testapp.album"),
+        ("testapp.song", "testapp.artist"),
+        ("testapp.album", "testapp.artist"),
+        ("testapp.album", "testapp.recordlabel"),
+        ("testapp.album", "testapp.song"),
+    }
+
+
+def test_get_plan_depends_on_the_edge_patterns():
+    planner = ExtractionPlanner()
+
+    plan = planner.get_plan(root="testapp.song")
+
+    denied_plan = planner.get_plan(
+        root="testapp.song", limits=TraversalLimits(denied_edges=("*",))
+    )
+
+    assert planner.get_plan(root="testapp.song", limits=TraversalLimits()) is plan
+    assert denied_plan.models == plan.models
+    assert len(denied_plan.edges) < len(plan.edges)
+    assert not any(edge.is_fan_out for edge in denied_plan.edges)
+
+
+def test_compile_plan_follows_through_models():
+    planner = ExtractionPlanner()
+
+    plan = planner.compile_plan(root="testapp.band")
+
+    assert plan.edges_by_source["testapp.band"] == (
+        ExtractionEdgeDTO(
+            source="testapp.band",
+            target="testapp.membership",
+            source_field="id",
+            filter_key="band",
+            relation_kind=RelationKind.through,
+            is_cycle=True,
+        ),
+    )
+    assert plan.through_lookups == {
+        ("testapp.membership", "band"),
+        ("testapp.membership", "musician"),
+    }
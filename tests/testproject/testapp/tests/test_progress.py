@@ -0,0 +1,54 @@
+import logging
+
+from fixtures_extractor.extra_logging_formatter import ExtraFormatter
+from fixtures_extractor.progress import ProgressReporter
+
+
+class ListHandler(logging.Handler):
+    def __init__(self):
+        super().__init__()
+        self.messages = []
+
+    def emit(self, record):
+        self.messages.append(record.getMessage())
+
+
+def test_progress_reporter_logs_once_every_interval():
+    logger = logging.getLogger("test_progress")
+    logger.setLevel(logging.INFO)
+    handler = ListHandler()
+    logger.addHandler(handler)
+
+    progress = ProgressReporter(logger=logger, every=10, unit="rows")
+    for _ in range(7):
+        progress.add(4)
+    logger.removeHandler(handler)
+
+    assert progress.count == 28
+    assert [message.split(" in ")[0] for message in handler.messages] == [
+        "Extracted 12 rows",
+        "Extracted 20 rows",
+    ]
+
+
+def test_progress_reporter_skips_disabled_levels():
+    logger = logging.getLogger("test_progress_disabled")
+    logger.setLevel(logging.ERROR)
+    handler = ListHandler()
+    logger.addHandler(handler)
+
+    progress = ProgressReporter(logger=logger, every=1)
+    progress.add(5)
+    logger.removeHandler(handler)
+
+    assert handler.messages == []
+
+
+def test_extra_formatter_only_adds_extra_attributes():
+    formatter = ExtraFormatter("%(message)s")
+    record = logging.LogRecord("test", logging.INFO, "", 0, "Saved %s", ("file",), None)
+
+    assert formatter.format(record) == "Saved file"
+
+    record.primary_id = 1
+    assert formatter.format(record) == "Saved file - extra: {'primary_id': 1}"
@@ -0,0 +1,147 @@
+import pytest
+from django.contrib.contenttypes.models import ContentType
+from django.core.management import call_command
+
+from fixtures_extractor.remapping import FixtureRemapper, PrimaryKeyMap
+from tests.testproject.testapp.factories import (
+    AlbumFactory,
+    ArticleFactory,
+    ArtistFactory,
+    CommentFactory,
+    RecordLabelFactory,
+    SongFactory,
+)
+from tests.testproject.testapp.models import (
+    Album,
+    Article,
+    Comment,
+    RecordLabel,
+    Song,
+)
+from tests.utils import get_json_from_file
+
+
+def test_primary_key_map_assigns_dense_ids_in_pk_order():
+    pk_map = PrimaryKeyMap()
+    for pk in [40, 7, 40, 1000, 7]:
+        pk_map.add(pk)
+    pk_map.freeze(first_id=10)
+
+    assert len(pk_map) == 3
+    assert [pk_map.get(pk) for pk in [7, 40, 1000]] == [10, 11, 12]
+    assert pk_map.get(8) is None
+
+
+@pytest.mark.django_db
+def test_run_command_remapped_fixtures_load_next_to_the_originals(tmp_path):
+    record_label = RecordLabelFactory.create()
+    artist = ArtistFactory.create()
+    album = AlbumFactory.create(record_label=record_label, artist=artist)
+    SongFactory.create(album=album, artists=[artist])
+    # Rows of another graph, the remapped ids must not collide with them
+    RecordLabelFactory.create_batch(3)
+
+    fixtures_dir = tmp_path / "fixtures"
+    call_command(
+        "extract_fixture",
+        record_label.id,
+        app="testapp",
+        model="recordlabel",
+        output_dir=fixtures_dir,
+    )
+    remapped_dir = tmp_path / "remapped"
+    call_command("remap_fixture", str(fixtures_dir), output_dir=remapped_dir)
+
+    remapped_file = remapped_dir.joinpath(
+        f"recordlabel_{record_label.id}/testapp.recordlabel.json"
+    )
+    records = {
+        record["model"]: record["fields"]
+        for record in get_json_from_file(remapped_file)
+    }
+    assert (
+        records["testapp.recordlabel"]["id"] == RecordLabel.objects.latest("id").id + 1
+    )
+    assert (
+        records["testapp.album"]["record_label"] == records["testapp.recordlabel"]["id"]
+    )
+    assert records["testapp.song"]["album"] == records["testapp.album"]["id"]
+    assert records["testapp.song"]["artists"] == [records["testapp.artist"]["id"]]
+
+    call_command("loaddata", remapped_file, verbosity=0)
+
+    assert Album.objects.count() == 2
+    remapped_song = Song.objects.get(id=records["testapp.song"]["id"])
+    assert remapped_song.album.record_label.name == record_label.name
+    assert remapped_song.album.record_label_id != record_label.id
+
+
+@pytest.mark.django_db
+def test_run_command_remaps_generic_foreign_keys(tmp_path):
+    ArticleFactory.create_batch(2)
+    comment = CommentFactory.create()
+
+    fixtures_dir = tmp_path / "fixtures"
+    call_command(
+        "extract_fixture",
+        comment.id,
+        app="testapp",
+        model="comment",
+        output_dir=fixtures_dir,
+    )
+    remapped_dir = tmp_path / "remapped"
+    call_command("remap_fixture", str(fixtures_dir), output_dir=remapped_dir)
+
+    records = {
+        record["model"]: record["fields"]
+        for record in get_json_from_file(
+            remapped_dir.joinpath(f"comment_{comment.id}/testapp.comment.json")
+        )
+    }
+    assert records["testapp.article"]["id"] != comment.object_id
+    assert records["testapp.comment"]["object_id"] == records["testapp.article"]["id"]
+    assert records["testapp.comment"]["content_type"] == comment.content_type_id
+    assert "contenttypes.contenttype" not in records
+
+    call_command(
+        "loaddata",
+        remapped_dir.joinpath(f"comment_{comment.id}/testapp.comment.json"),
+        verbosity=0,
+    )
+
+    assert Comment.objects.count() == 2
+    remapped_comment = Comment.objects.get(id=records["testapp.comment"]["id"])
+    assert remapped_comment.content_object.title == comment.content_object.title
+    assert remapped_comment.content_object.id != comment.object_id
+
+
+@pytest.mark.django_db
+def test_remapper_resolves_content_types_by_natural_key():
+    article_content_type = ContentType.objects.get_for_model(Article)
+    remapper = FixtureRemapper()
+    records = [
+        {
+            "model": "contenttypes.contenttype",
+            "fields": {"id": 999, "app_label": "testapp", "model": "article"},
+        },
+        {"model": "testapp.article", "fields": {"id": 5, "title": "Title"}},
+        {
+            "model": "testapp.comment",
+            "fields": {"id": 7, "content_type": 999, "object_id": 5, "text": ""},
+        },
+    ]
+    remapper.index(records=records)
+    remapper.freeze()
+
+    remapped_records = list(remapper.iter_records(records=records))
+
+    assert [record["model"] for record in remapped_records] == [
+        "testapp.article",
+        "testapp.comment",
+    ]
+    assert remapped_records[1]["fields"]["content_type"] == article_content_type.id
+    assert (
+        remapped_records[1]["fields"]["object_id"]
+        == remapped_records[0]["fields"]["id"]
+    )
+    assert remapper.dropped_count == 1
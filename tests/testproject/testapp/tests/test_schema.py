@@ -0,0 +1,143 @@
+import sys
+
+import pytest
+
+from fixtures_extractor.dtos import ModelFieldMetaDTO
+from fixtures_extractor.enums import FieldType
+from fixtures_extractor.schema import SchemaRegistry
+
+
+def test_get_schema_is_built_once():
+    registry = SchemaRegistry()
+
+    schema = registry.get_schema(app_model="testapp.song")
+
+    assert registry.get_schema(app_model="testapp.song") is schema
+
+
+def test_invalidate_rebuilds_schema():
+    registry = SchemaRegistry()
+    schema = registry.get_schema(app_model="testapp.song")
+
+    registry.invalidate(app_model="testapp.song")
+
+    rebuilt_schema = registry.get_schema(app_model="testapp.song")
+    assert rebuilt_schema is not schema
+    assert rebuilt_schema == schema
+
+
+def test_invalidate_all_schemas():
+    registry = SchemaRegistry()
+    song_schema = registry.get_schema(app_model="testapp.song")
+    album_schema = registry.get_schema(app_model="testapp.album")
+
+    registry.invalidate()
+
+    assert registry.get_schema(app_model="testapp.song") is not song_schema
+    assert registry.get_schema(app_model="testapp.album") is not album_schema
+
+
+def test_schema_buckets():
+    registry = SchemaRegistry()
+
+    schema = registry.get_schema(app_model="testapp.song")
+
+    assert [field.field_name for field in schema.fields] == [
+        "id",
+        "name",
+        "release_date",
+    ]
+    assert schema.one_relations == (
+        ModelFieldMetaDTO(
+            app_name="testapp",
+            field_name="album",
+            model_name="album",
+            field_type=FieldType.foreign_key,
+        ),
+    )
+    assert schema.many_relations == (
+        ModelFieldMetaDTO(
+            app_name="testapp",
+            field_name="artists",
+            model_name="artist",
+            field_type=FieldType.many_to_many,
+        ),
+    )
+    assert schema.target_relations == ()
+
+
+def test_schema_generic_relations():
+    registry = SchemaRegistry()
+
+    comment_schema = registry.get_schema(app_model="testapp.comment")
+    article_schema = registry.get_schema(app_model="testapp.article")
+
+    assert comment_schema.generic_foreign_keys == (
+        ModelFieldMetaDTO(
+            app_name="contenttypes",
+            field_name="content_object",
+            model_name="contenttype",
+            field_type=FieldType.generic_foreign_key,
+            content_type_field_name="content_type",
+            object_id_field_name="object_id",
+        ),
+    )
+    assert article_schema.generic_relations == (
+        ModelFieldMetaDTO(
+            app_name="testapp",
+            field_name="comments",
+            model_name="comment",
+            field_type=FieldType.generic_relation,
+            content_type_field_name="content_type",
+            object_id_field_name="object_id",
+        ),
+        ModelFieldMetaDTO(
+            app_name="testapp",
+            field_name="tags",
+            model_name="tag",
+            field_type=FieldType.generic_relation,
+            content_type_field_name="content_type",
+            object_id_field_name="object_pk",
+        ),
+    )
+    assert article_schema.target_relations == ()
+
+
+def test_schema_through_relations():
+    registry = SchemaRegistry()
+
+    schema = registry.get_schema(app_model="testapp.band")
+
+    assert schema.many_relations == ()
+    assert schema.through_relations == (
+        ModelFieldMetaDTO(
+            app_name="testapp",
+            field_name="members",
+            model_name="musician",
+            field_type=FieldType.many_to_many_through,
+            through_app_model="testapp.membership",
+            through_field_name="band",
+        ),
+    )
+
+
+def test_schema_is_frozen():
+    registry = SchemaRegistry()
+
+    schema = registry.get_schema(app_model="testapp.song")
+
+    with pytest.raises(AttributeError):
+        schema.fields = ()
+
+
+def test_fields_are_compact_hashable_keys():
+    registry = SchemaRegistry()
+
+    song_fields = registry.get_schema(app_model="testapp.song").all_fields
+    album_relation = next(field for field in song_fields if field.field_name == "album")
+
+    assert not hasattr(album_relation, "__dict__")
+    assert album_relation in set(song_fields)
+    assert album_relation.model_name is sys.intern("album")
+    with pytest.raises(AttributeError):
+        album_relation.field_name = "other"
@@ -0,0 +1,493 @@
+from collections.abc import Iterator
+
+import pytest
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from fixtures_extractor.limits import TraversalLimits
+from fixtures_extractor.metrics import ExtractionMetrics
+from fixtures_extractor.orm_extractor import ORMExtractor
+from fixtures_extractor.projection import FieldProjection
+from fixtures_extractor.traversal import GraphTraversal, RecordCache
+from tests.testproject.testapp.factories import (
+    AlbumFactory,
+    ArticleFactory,
+    ArtistFactory,
+    BandFactory,
+    CommentFactory,
+    MembershipFactory,
+    RecordLabelFactory,
+    SongFactory,
+    TagFactory,
+)
+from tests.testproject.testapp.models import Tag
+
+pytestmark = [pytest.mark.django_db]
+
+
+def _record_keys(records):
+    return sorted((record["model"], record["fields"]["id"]) for record in records)
+
+
+def test_extract_follows_every_relation():
+    record_label = RecordLabelFactory.create()
+    artist = ArtistFactory.create()
+    album = AlbumFactory.create(record_label=record_label, artist=artist)
+    song = SongFactory.create(album=album, artists=[artist])
+    other_artist = ArtistFactory.create()
+    SongFactory.create(artists=[other_artist])
+
+    graph_traversal = GraphTraversal(orm_extractor=ORMExtractor())
+
+    records = graph_traversal.extract(
+        app_model="testapp.recordlabel",
+        filter_key="id",
+        filter_values=[record_label.id],
+    )
+
+    assert _record_keys(records) == [
+        ("testapp.album", album.id),
+        ("testapp.artist", artist.id),
+        ("testapp.recordlabel", record_label.id),
+        ("testapp.song", song.id),
+    ]
+
+
+def test_extract_query_count_does_not_grow_with_fan_out():
+    def count_queries(albums_count):
+        record_label = RecordLabelFactory.create()
+        AlbumFactory.create_batch(albums_count, record_label=record_label)
+        graph_traversal = GraphTraversal(orm_extractor=ORMExtractor())
+
+        with CaptureQueriesContext(connection) as context:
+            graph_traversal.extract(
+                app_model="testapp.recordlabel",
+                filter_key="id",
+                filter_values=[record_label.id],
+            )
+
+        return len(context.captured_queries)
+
+    assert count_queries(albums_count=2) == count_queries(albums_count=10)
+
+
+def test_extract_multiple_roots():
+    record_label_1 = RecordLabelFactory.create()
+    record_label_2 = RecordLabelFactory.create()
+    RecordLabelFactory.create()
+
+    graph_traversal = GraphTraversal(orm_extractor=ORMExtractor())
+
+    records = graph_traversal.extract(
+        app_model="testapp.recordlabel",
+        filter_key="id",
+        filter_values=[record_label_1.id, record_label_2.id],
+    )
+
+    assert _record_keys(records) == [
+        ("testapp.recordlabel", record_label_1.id),
+        ("testapp.recordlabel", record_label_2.id),
+    ]
+
+
+def test_extract_fetches_each_row_once():
+    artist = ArtistFactory.create()
+    album = AlbumFactory.create(artist=artist)
+    SongFactory.create_batch(3, album=album, artists=[artist])
+
+    graph_traversal = GraphTraversal(orm_extractor=ORMExtractor())
+
+    with CaptureQueriesContext(connection) as context:
+        records = graph_traversal.extract(
+            app_model="testapp.artist", filter_key="id", filter_values=[artist.id]
+        )
+
+    record_keys = _record_keys(records)
+    assert len(record_keys) == len(set(record_keys)) == 6
+    album_queries = [
+        query
+        for query in context.captured_queries
+        if query["sql"].startswith('SELECT "testapp_album"')
+    ]
+    assert len(album_queries) == 2
+
+
+def test_extract_with_record_cache_reuses_shared_rows():
+    record_label = RecordLabelFactory.create()
+    album_1, album_2 = AlbumFactory.create_batch(2, record_label=record_label)
+
+    graph_traversal = GraphTraversal(
+        orm_extractor=ORMExtractor(), record_cache=RecordCache()
+    )
+    records_1 = graph_traversal.extract(
+        app_model="testapp.album", filter_key="id", filter_values=[album_1.id]
+    )
+
+    with CaptureQueriesContext(connection) as context:
+        records_2 = graph_traversal.extract(
+            app_model="testapp.album", filter_key="id", filter_values=[album_2.id]
+        )
+
+    assert len(context.captured_queries) == 0
+    assert _record_keys(records_1) == _record_keys(records_2)
+    assert _record_keys(records_2) == _record_keys(
+        GraphTraversal(orm_extractor=ORMExtractor()).extract(
+            app_model="testapp.album", filter_key="id", filter_values=[album_2.id]
+        )
+    )
+
+
+def test_extract_with_projection():
+    album = AlbumFactory.create()
+
+    graph_traversal = GraphTraversal(
+        orm_extractor=ORMExtractor(),
+        projection=FieldProjection.build(
+            include=["testapp.artist.first_name"],
+            exclude=["testapp.album.release_date"],
+        ),
+    )
+    records = graph_traversal.extract(
+        app_model="testapp.album", filter_key="id", filter_values=[album.id]
+    )
+
+    fields_by_model = {record["model"]: record["fields"] for record in records}
+    assert fields_by_model["testapp.artist"] == {
+        "id": album.artist.id,
+        "first_name": album.artist.first_name,
+    }
+    assert "release_date" not in fields_by_model["testapp.album"]
+    assert fields_by_model["testapp.album"]["record_label"] == album.record_label.id
+
+
+def test_extract_keys_only_traversal_matches_full_traversal():
+    artist = ArtistFactory.create()
+    album = AlbumFactory.create(artist=artist)
+    SongFactory.create_batch(2, album=album, artists=[artist])
+
+    def extract(projection):
+        graph_traversal = GraphTraversal(
+            orm_extractor=ORMExtractor(), projection=projection
+        )
+        records = graph_traversal.extract(
+            app_model="testapp.artist", filter_key="id", filter_values=[artist.id]
+        )
+        return sorted(
+            records, key=lambda record: (record["model"], record["fields"]["id"])
+        )
+
+    assert extract(FieldProjection(keys_only=True)) == extract(FieldProjection())
+
+
+def test_field_projection_keeps_the_case_of_field_names():
+    projection = FieldProjection.build(include=["testApp.Artist.first_Name"])
+
+    assert projection.include == {"testapp.artist": {"first_Name"}}
+
+
+def test_field_projection_rejects_invalid_fields():
+    with pytest.raises(ValueError):
+        FieldProjection.build(include=["artist.first_name"])
+
+
+def test_iter_records_with_chunk_size():
+    artist = ArtistFactory.create()
+    album = AlbumFactory.create(artist=artist)
+    SongFactory.create_batch(3, album=album, artists=[artist])
+
+    chunked_graph_traversal = GraphTraversal(orm_extractor=ORMExtractor(), chunk_size=2)
+    records = chunked_graph_traversal.iter_records(
+        app_model="testapp.artist", filter_key="id", filter_values=[artist.id]
+    )
+
+    assert isinstance(records, Iterator)
+    assert _record_keys(records) == _record_keys(
+        GraphTraversal(orm_extractor=ORMExtractor()).extract(
+            app_model="testapp.artist", filter_key="id", filter_values=[artist.id]
+        )
+    )
+
+
+def test_extract_with_max_depth():
+    record_label = RecordLabelFactory.create()
+    albums = AlbumFactory.create_batch(2, record_label=record_label)
+
+    graph_traversal = GraphTraversal(
+        orm_extractor=ORMExtractor(), limits=TraversalLimits(max_depth=1)
+    )
+    records = graph_traversal.extract(
+        app_model="testapp.recordlabel",
+        filter_key="id",
+        filter_values=[record_label.id],
+    )
+
+    # Artists are past the depth but albums can not be loaded without them
+    assert _record_keys(records) == sorted(
+        [("testapp.album", album.id) for album in albums]
+        + [("testapp.artist", album.artist.id) for album in albums]
+        + [("testapp.recordlabel", record_label.id)]
+    )
+
+
+def test_extract_with_max_depth_counts_foreign_key_hops():
+    album = AlbumFactory.create()
+    artist = ArtistFactory.create()
+    song = SongFactory.create(album=album, artists=[artist])
+    SongFactory.create(album=album)
+
+    graph_traversal = GraphTraversal(
+        orm_extractor=ORMExtractor(), limits=TraversalLimits(max_depth=1)
+    )
+    records = graph_traversal.extract(
+        app_model="testapp.song", filter_key="id", filter_values=[song.id]
+    )
+
+    # The album is one hop away, its other songs are two hops away
+    assert _record_keys(records) == sorted(
+        [
+            ("testapp.album", album.id),
+            ("testapp.artist", album.artist.id),
+            ("testapp.artist", artist.id),
+            ("testapp.recordlabel", album.record_label.id),
+            ("testapp.song", song.id),
+        ]
+    )
+
+
+def test_extract_with_max_rows_per_relation():
+    record_label = RecordLabelFactory.create()
+    albums = AlbumFactory.create_batch(5, record_label=record_label)
+
+    graph_traversal = GraphTraversal(
+        orm_extractor=ORMExtractor(),
+        record_cache=RecordCache(),
+        limits=TraversalLimits(max_depth=1, max_rows_per_relation=2),
+    )
+    records = graph_traversal.extract(
+        app_model="testapp.recordlabel",
+        filter_key="id",
+        filter_values=[record_label.id],
+    )
+
+    assert _record_keys(records) == sorted(
+        [("testapp.album", album.id) for album in albums[:2]]
+        + [("testapp.artist", album.artist.id) for album in albums[:2]]
+        + [("testapp.recordlabel", record_label.id)]
+    )
+
+
+def test_extract_with_denied_edges():
+    record_label = RecordLabelFactory.create()
+    album = AlbumFactory.create(record_label=record_label)
+    SongFactory.create(album=album)
+
+    graph_traversal = GraphTraversal(
+        orm_extractor=ORMExtractor(),
+        limits=TraversalLimits(denied_edges=("reverse:*->testapp.song",)),
+    )
+    records = graph_traversal.extract(
+        app_model="testapp.recordlabel",
+        filter_key="id",
+        filter_values=[record_label.id],
+    )
+
+    assert _record_keys(records) == [
+        ("testapp.album", album.id),
+        ("testapp.artist", album.artist.id),
+        ("testapp.recordlabel", record_label.id),
+    ]
+
+
+def test_extract_collects_metrics_per_model_and_relation():
+    record_label = RecordLabelFactory.create()
+    artist = ArtistFactory.create()
+    AlbumFactory.create_batch(2, record_label=record_label, artist=artist)
+    metrics = ExtractionMetrics()
+    graph_traversal = GraphTraversal(orm_extractor=ORMExtractor(), metrics=metrics)
+
+    with metrics.collect():
+        graph_traversal.extract(
+            app_model="testapp.recordlabel",
+            filter_key="id",
+            filter_values=[record_label.id],
+        )
+
+    album_metrics = metrics.steps[("testapp.album", "record_label")]
+    assert album_metrics.queries == 1
+    assert album_metrics.rows == 2
+    assert metrics.steps[("testapp.artist", "id")].rows == 1
+    assert metrics.total.queries == sum(
+        step_metrics.queries for step_metrics in metrics.steps.values()
+    )
+    assert "testapp.album" in metrics.summary()
+
+
+def test_extract_with_warm_record_cache_counts_cached_rows_only():
+    record_label = RecordLabelFactory.create()
+    artist = ArtistFactory.create()
+    AlbumFactory.create_batch(2, record_label=record_label, artist=artist)
+    cold_metrics = ExtractionMetrics()
+    graph_traversal = GraphTraversal(
+        orm_extractor=ORMExtractor(), record_cache=RecordCache(), metrics=cold_metrics
+    )
+    with cold_metrics.collect():
+        graph_traversal.extract(
+            app_model="testapp.recordlabel",
+            filter_key="id",
+            filter_values=[record_label.id],
+        )
+
+    warm_metrics = ExtractionMetrics()
+    graph_traversal.metrics = warm_metrics
+    with warm_metrics.collect():
+        graph_traversal.extract(
+            app_model="testapp.recordlabel",
+            filter_key="id",
+            filter_values=[record_label.id],
+        )
+
+    album_metrics = warm_metrics.steps[("testapp.album", "record_label")]
+    assert album_metrics.rows == 0
+    assert album_metrics.cached_rows == 2
+    assert warm_metrics.total.queries == 0
+    assert warm_metrics.total.rows == 0
+    assert warm_metrics.total.cached_rows == cold_metrics.total.rows
+    assert cold_metrics.total.cached_rows == 0
+
+
+def test_extract_through_rows_in_one_query_per_batch():
+    bands = BandFactory.create_batch(3)
+    memberships = [
+        membership
+        for band in bands
+        for membership in MembershipFactory.create_batch(2, band=band)
+    ]
+
+    graph_traversal = GraphTraversal(
+        orm_extractor=ORMExtractor(),
+        limits=TraversalLimits(max_rows_per_relation=1),
+    )
+    with CaptureQueriesContext(connection) as context:
+        records = graph_traversal.extract(
+            app_model="testapp.band",
+            filter_key="id",
+            filter_values=[band.id for band in bands],
+        )
+
+    assert _record_keys(records) == sorted(
+        [("testapp.band", band.id) for band in bands]
+        + [("testapp.membership", membership.id) for membership in memberships]
+        + [("testapp.musician", membership.musician_id) for membership in memberships]
+    )
+    assert all("members" not in record["fields"] for record in records)
+    membership_queries = [
+        query
+        for query in context.captured_queries
+        if '"testapp_membership"."band_id" IN' in query["sql"]
+    ]
+    assert len(membership_queries) == 1
+
+
+def test_extract_generic_foreign_keys_in_one_query_per_content_type():
+    articles = ArticleFactory.create_batch(3)
+    record_label = RecordLabelFactory.create()
+    album = AlbumFactory.create(record_label=record_label)
+    comments = [CommentFactory.create(content_object=article) for article in articles]
+    comments.append(CommentFactory.create(content_object=record_label))
+
+    graph_traversal = GraphTraversal(orm_extractor=ORMExtractor())
+    with CaptureQueriesContext(connection) as context:
+        records = graph_traversal.extract(
+            app_model="testapp.comment",
+            filter_key="id",
+            filter_values=[comment.id for comment in comments],
+        )
+
+    record_keys = _record_keys(records)
+    assert [("testapp.article", article.id) for article in articles] == [
+        record_key for record_key in record_keys if record_key[0] == "testapp.article"
+    ]
+    # Models only reached through a generic key are followed as well
+    assert ("testapp.recordlabel", record_label.id) in record_keys
+    assert ("testapp.album", album.id) in record_keys
+    article_queries = [
+        query
+        for query in context.captured_queries
+        if 'FROM "testapp_article"' in query["sql"]
+    ]
+    assert len(article_queries) == 1
+
+
+def test_extract_generic_relations_only_match_their_content_type():
+    article = ArticleFactory.create()
+    comment = CommentFactory.create(content_object=article)
+    record_label_comment = CommentFactory.create(
+        content_object=RecordLabelFactory.create()
+    )
+    record_label_comment.object_id = article.id
+    record_label_comment.save()
+
+    graph_traversal = GraphTraversal(orm_extractor=ORMExtractor())
+    records = graph_traversal.extract(
+        app_model="testapp.article",
+        filter_key="id",
+        filter_values=[article.id],
+    )
+
+    assert [
+        record_key
+        for record_key in _record_keys(records)
+        if record_key[0] != "contenttypes.contenttype"
+    ] == [("testapp.article", article.id), ("testapp.comment", comment.id)]
+
+
+def test_extract_with_record_cache_matches_char_object_ids():
+    article = ArticleFactory.create()
+    tags = TagFactory.create_batch(2, content_object=article)
+
+    record_cache = RecordCache()
+    graph_traversal = GraphTraversal(
+        orm_extractor=ORMExtractor(), record_cache=record_cache
+    )
+    first_records = graph_traversal.extract(
+        app_model="testapp.article", filter_key="id", filter_values=[article.id]
+    )
+    with CaptureQueriesContext(connection) as context:
+        second_records = graph_traversal.extract(
+            app_model="testapp.article", filter_key="id", filter_values=[article.id]
+        )
+
+    # Object ids are stored as text, the cached lookups are keyed by int pks
+    expected_tag_keys = [("testapp.tag", tag.id) for tag in tags]
+    for records in (first_records, second_records):
+        assert [
+            record_key
+            for record_key in _record_keys(records)
+            if record_key[0] == "testapp.tag"
+        ] == expected_tag_keys
+    assert len(context.captured_queries) == 0
+
+
+def test_extract_skips_generic_object_ids_that_are_not_primary_keys():
+    article = ArticleFactory.create()
+    tag = TagFactory.create(content_object=article)
+    invalid_tag = TagFactory.create(content_object=article)
+    Tag.objects.filter(id=invalid_tag.id).update(object_pk="abc")
+
+    graph_traversal = GraphTraversal(orm_extractor=ORMExtractor())
+    records = graph_traversal.extract(
+        app_model="testapp.tag",
+        filter_key="id",
+        filter_values=[tag.id, invalid_tag.id],
+    )
+
+    # The article is only reached through the valid tag
+    assert [
+        record_key
+        for record_key in _record_keys(records)
+        if record_key[0].startswith("testapp.")
+    ] == [
+        ("testapp.article", article.id),
+        ("testapp.tag", tag.id),
+        ("testapp.tag", invalid_tag.id),
+    ]
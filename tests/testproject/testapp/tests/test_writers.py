@@ -0,0 +1,127 @@
+import json
+from datetime import date
+
+import pytest
+
+from fixtures_extractor.encoders import EnhancedDjangoJSONEncoder
+from fixtures_extractor.writers import (
+    COMPRESSORS,
+    JSONFixtureWriter,
+    JSONLinesFixtureWriter,
+    get_fixture_format,
+    get_fixture_suffix,
+    iter_fixture_records,
+    open_fixture,
+)
+
+RECORDS = [
+    {
+        "model": "testapp.song",
+        "fields": {
+            "id": 1,
+            "name": "Song\nwith a new line",
+            "release_date": date(2020, 1, 1),
+            "album": 1,
+            "artists": [1, 2],
+        },
+    },
+    {
+        "model": "testapp.song",
+        "fields": {
+            "id": 2,
+            "name": "Other song",
+            "release_date": date(2020, 1, 2),
+            "album": None,
+            "artists": [],
+        },
+    },
+]
+
+
+@pytest.mark.parametrize("records", [RECORDS, RECORDS[:1], []])
+def test_write_records_matches_json_dumps(tmp_path, records):
+    output_file = tmp_path / "fixture.json"
+
+    with JSONFixtureWriter(output_file=output_file) as writer:
+        writer.write_records(records)
+
+    expected_content = json.dumps(records, cls=EnhancedDjangoJSONEncoder, indent=4)
+    assert output_file.read_text() == expected_content
+
+
+def test_write_records_skips_duplicated_records(tmp_path):
+    output_file = tmp_path / "fixture.json"
+
+    with JSONFixtureWriter(output_file=output_file) as writer:
+        writer.write_records(RECORDS + RECORDS[:1])
+
+    assert writer.written_count == 2
+    assert writer.duplicated_count == 1
+    assert len(json.loads(output_file.read_text())) == 2
+
+
+@pytest.mark.parametrize("records", [RECORDS, []])
+@pytest.mark.parametrize("indent", [None, 0, 2])
+def test_write_records_matches_json_dumps_indent(tmp_path, records, indent):
+    output_file = tmp_path / "fixture.json"
+
+    with JSONFixtureWriter(output_file=output_file, indent=indent) as writer:
+        writer.write_records(records)
+
+    separators = (",", ":") if indent is None else None
+    expected_content = json.dumps(
+        records, cls=EnhancedDjangoJSONEncoder, indent=indent, separators=separators
+    )
+    assert output_file.read_text() == expected_content
+
+
+@pytest.mark.parametrize("compression", sorted(COMPRESSORS))
+def test_write_records_compressed(tmp_path, compression):
+    output_file = tmp_path / f"fixture{get_fixture_suffix(compression=compression)}"
+
+    with JSONFixtureWriter(output_file=output_file) as writer:
+        writer.write_records(RECORDS)
+
+    with open_fixture(fixture_file=output_file) as fixture_content:
+        content = fixture_content.read()
+
+    assert content == json.dumps(RECORDS, cls=EnhancedDjangoJSONEncoder, indent=4)
+    assert output_file.read_bytes()[:1] != b"["
+
+
+@pytest.mark.parametrize("compression", [None, "gz"])
+def test_write_records_as_json_lines(tmp_path, compression):
+    output_file = tmp_path / f"fixture{get_fixture_suffix(compression, 'jsonl')}"
+
+    with JSONLinesFixtureWriter(output_file=output_file) as writer:
+        writer.write_records(RECORDS + RECORDS[:1])
+
+    with open_fixture(fixture_file=output_file) as fixture_content:
+        lines = fixture_content.read().splitlines()
+
+    assert get_fixture_format(fixture_file=output_file) == "jsonl"
+    assert lines == [
+        json.dumps(record, cls=EnhancedDjangoJSONEncoder, separators=(",", ":"))
+        for record in RECORDS
+    ]
+    assert list(iter_fixture_records(fixture_file=output_file)) == json.loads(
+        json.dumps(RECORDS, cls=EnhancedDjangoJSONEncoder)
+    )
+
+
+@pytest.mark.parametrize("fixture_format", ["json", "jsonl"])
+def test_write_records_failure_keeps_previous_fixture(tmp_path, fixture_format):
+    output_file = tmp_path / f"fixture.{fixture_format}"
+    output_file.write_text("previous")
+
+    def failing_records():
+        yield RECORDS[0]
+        raise RuntimeError("Extraction failed")
+
+    writer_class = {"json": JSONFixtureWriter, "jsonl": JSONLinesFixtureWriter}
+    with pytest.raises(RuntimeError):
+        with writer_class[fixture_format](output_file=output_file) as writer:
+            writer.write_records(failing_records())
+
+    assert output_file.read_text() == "previous"
+    assert [path.name for path in tmp_path.iterdir()] == [output_file.name]
@@ -81,6 +81,10 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': Path(BASE_DIR).joinpath("database.db"),
+        # File backed, so the workers of --jobs open their own connections
+        'TEST': {
+            'NAME': Path(BASE_DIR).joinpath("test_database.db"),
+        },
     }
 }
 